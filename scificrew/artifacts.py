@@ -0,0 +1,149 @@
+""" Typed columnar files passed between the stages of the pipeline (Parquet or
+Feather, instead of csv files), with an explicit schema for each artifact
+
+:Author: Yassmine Chebaro <yassmnine.chebaro@mssm.edu>
+:Date: 2019-10-10
+:License: MIT
+"""
+
+import os
+import pandas as pd
+import pyarrow.feather as feather
+
+
+# columns and pandas dtypes of each artifact, in the order of the files
+SCHEMAS = {
+	# scifi books (cleaning_books)
+	'books_scifi': {'isbn': 'string', 'book_id': 'int64', 'title': 'string', 'num_pages': 'Int64',
+		'publication_year': 'Int64', 'average_rating': 'float64', 'ratings_count': 'Int64'},
+	# scifi books and their most populated tag, columns in alphabetical order (cleaning_books)
+	'book_year_1tag': {'average_rating': 'float64', 'book_id': 'int64', 'count_shelves': 'int64', 'isbn': 'string',
+		'num_pages': 'Int64', 'popular_shelves': 'string', 'publication_year': 'Int64', 'ratings_count': 'Int64',
+		'title': 'string'},
+	# read and reviewed scifi books of the selected users (users_books_ratings)
+	'ratings_books': {'user_id': 'int32', 'is_read': 'int8', 'rating': 'int8', 'is_reviewed': 'int8',
+		'book_id_gr': 'int64', 'user_counts': 'int32', 'book_counts': 'int32', 'user_idx': 'int32',
+		'book_idx': 'int32'},
+	# clusters of Step 1 (clustering_users)
+	'user_clusters': {'user_idx': 'int32', 'group': 'int32'},
+	# final clusters (clustering_users)
+	'clusters_final': {'user_idx': 'int32', 'group': 'int32'},
+	# nature of the average sentiment of the reviews of each goodreads user (reviews_sent_analysis)
+	'users_ave_sentiment': {'User': 'string', 'Average sentiment': 'string'},
+	# favorite book of each user
+	'user_book_fav': {'user_id': 'int64', 'book_id': 'int64', 'title': 'string'},
+	# name of each user of the final clusters
+	'clusters_group_names': {'user_idx': 'int32', 'group': 'int32', 'names': 'string'},
+	# users of the web application (mapping_final_clusters_data)
+	'clusters': {'user_id_csv': 'int64', 'user_idx': 'int32', 'user_id_gr': 'string', 'Average sentiment': 'string',
+		'group_x': 'int32', 'book_id': 'int64', 'title': 'string', 'group_y': 'int32', 'names': 'string'},
+}
+
+FORMATS = {'parquet': '.parquet', 'feather': '.feather'}
+
+
+def _schema(name):
+	if name not in SCHEMAS:
+		raise ValueError('Unknown artifact: {}'.format(name))
+	return SCHEMAS[name]
+
+
+def cast_to_schema(dfin, name, columns=None):
+	""" Columns of an artifact in the order and with the dtypes of its schema,
+	text columns of numeric dtypes are parsed ('' and invalid values are missing)
+
+	Args:
+		dfin (:obj:`DataFrame`): pandas DataFrame with at least the columns of the artifact
+		name (:obj:`str`): name of the artifact, key of SCHEMAS
+		columns (:obj:`list`): columns to keep, all the columns of the schema if None
+
+	Returns:
+		:obj:`DataFrame`: pandas DataFrame with the columns of the schema
+	"""
+	schema = _schema(name)
+	columns = list(schema) if columns is None else list(columns)
+	unknown = [column for column in columns if column not in schema]
+	if unknown:
+		raise ValueError('Columns not in the schema of {}: {}'.format(name, unknown))
+	missing = [column for column in columns if column not in dfin.columns]
+	if missing:
+		raise ValueError('Missing columns for {}: {}'.format(name, missing))
+
+	dfout = pd.DataFrame(index=dfin.index)
+	for column in columns:
+		values = dfin[column]
+		dtype = schema[column]
+		if dtype != 'string' and not pd.api.types.is_numeric_dtype(values):
+			values = pd.to_numeric(values, errors='coerce')
+		dfout[column] = values.astype(dtype, copy=False)
+
+	return dfout.reset_index(drop=True)
+
+
+class ArtifactStore(object):
+	""" Folder of the artifacts of the pipeline
+
+	Args:
+		folder (:obj:`str`): folder of the files
+		fmt (:obj:`str`): 'parquet' (compressed) or 'feather' (uncompressed, memory-mapped when read)
+	"""
+
+	def __init__(self, folder='.', fmt='parquet'):
+		if fmt not in FORMATS:
+			raise ValueError('Unknown artifact format: {}'.format(fmt))
+		self.folder = folder
+		self.fmt = fmt
+
+	def path(self, name):
+		""" File name of an artifact """
+		_schema(name)
+		return os.path.join(self.folder, name + FORMATS[self.fmt])
+
+	def exists(self, name):
+		return os.path.exists(self.path(name))
+
+	def write(self, name, dfin):
+		""" Write an artifact with the columns and dtypes of its schema, other columns are left out
+
+		Args:
+			name (:obj:`str`): name of the artifact
+			dfin (:obj:`DataFrame`): pandas DataFrame with at least the columns of the artifact
+
+		Returns:
+			:obj:`str`: file name of the artifact
+		"""
+		dfout = cast_to_schema(dfin, name)
+		path = self.path(name)
+		# written then renamed, for readers never to see a partial file
+		tmp_path = '{}.tmp{}'.format(path, os.getpid())
+		if self.fmt == 'parquet':
+			dfout.to_parquet(tmp_path, index=False)
+		else:
+			feather.write_feather(dfout, tmp_path, compression='uncompressed')
+		os.replace(tmp_path, path)
+
+		return path
+
+	def read(self, name, columns=None, fallback_csv=None):
+		""" Read some columns of an artifact, with the dtypes of its schema
+
+		Args:
+			name (:obj:`str`): name of the artifact
+			columns (:obj:`list`): columns to read, all if None
+			fallback_csv (:obj:`str`): csv file read (only the columns) when the artifact
+			was not written yet, for data of previous runs
+
+		Returns:
+			:obj:`DataFrame`: pandas DataFrame of the columns
+		"""
+		columns = list(_schema(name)) if columns is None else list(columns)
+		path = self.path(name)
+		if not os.path.exists(path) and fallback_csv is not None:
+			return cast_to_schema(pd.read_csv(fallback_csv, usecols=columns), name, columns)
+
+		if self.fmt == 'parquet':
+			dfin = pd.read_parquet(path, columns=columns, memory_map=True)
+		else:
+			dfin = feather.read_table(path, columns=columns, memory_map=True).to_pandas()
+
+		return cast_to_schema(dfin, name, columns)
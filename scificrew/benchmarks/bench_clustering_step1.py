@@ -0,0 +1,71 @@
+""" Benchmark of the clustering engines of ClusteringUsersStep1 (time, peak memory
+and inertia) on a synthetic sparse users x books ratings matrix
+
+Run from the scificrew folder:
+	python benchmarks/bench_clustering_step1.py --users 100000 --books 20000
+
+:Author: Yassmine Chebaro <yassmnine.chebaro@mssm.edu>
+:Date: 2019-10-05
+:License: MIT
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from clustering_users import ClusteringUsersStep1
+
+
+def synthetic_ratings(nb_users, nb_books, ratings_per_user, seed=0):
+	""" Ratings of users drawn from a few groups with preferred books """
+	rng = np.random.RandomState(seed)
+	nb_groups = 25
+	group = rng.randint(0, nb_groups, nb_users)
+	preferred = rng.randint(0, nb_books, (nb_groups, 5 * ratings_per_user))
+
+	user_idx = np.repeat(np.arange(nb_users), ratings_per_user)
+	choice = rng.randint(0, preferred.shape[1], len(user_idx))
+	book_idx = preferred[group[user_idx], choice]
+	ratings = pd.DataFrame({'user_idx': user_idx, 'book_idx': book_idx, 'rating': rng.randint(1, 6, len(user_idx))})
+
+	return ratings.drop_duplicates(['user_idx', 'book_idx'])
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument('--users', type=int, default=20000)
+	parser.add_argument('--books', type=int, default=10000)
+	parser.add_argument('--ratings-per-user', type=int, default=100)
+	parser.add_argument('--clusters', type=int, default=25)
+	args = parser.parse_args()
+
+	ratings = synthetic_ratings(args.users, args.books, args.ratings_per_user)
+	sparse_ratings, users, books = ClusteringUsersStep1().get_ratings_matrix(ratings)
+	print('{} users, {} books, {} ratings'.format(sparse_ratings.shape[0], sparse_ratings.shape[1], sparse_ratings.nnz))
+
+	engines = [
+		('kmeans', ClusteringUsersStep1('kmeans', n_init=1, random_state=0)),
+		('minibatch', ClusteringUsersStep1('minibatch', n_init=3, random_state=0, batch_size=4096)),
+		('minibatch streaming', ClusteringUsersStep1('minibatch', n_init=1, random_state=0, batch_size=4096,
+			chunk_size=10000, n_epochs=3)),
+	]
+	for name, engine in engines:
+		tracemalloc.start()
+		start = time.perf_counter()
+		engine.fit_clusters(sparse_ratings, args.clusters)
+		elapsed = time.perf_counter() - start
+		peak = tracemalloc.get_traced_memory()[1]
+		tracemalloc.stop()
+
+		# inertia on all users, for all engines
+		inertia = -engine.model.score(sparse_ratings)
+		print('{:20s} {:8.2f} s  peak {:8.1f} MB  inertia {:.4g}'.format(name, elapsed, peak / 1e6, inertia))
+
+
+if __name__ == '__main__':
+	main()
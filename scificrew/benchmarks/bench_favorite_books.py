@@ -0,0 +1,67 @@
+""" Benchmark of the favorite book selection of favorite_books on synthetic
+ratings of millions of users
+
+Run from the scificrew folder:
+	python benchmarks/bench_favorite_books.py --users 1000000
+
+:Author: Yassmine Chebaro <yassmnine.chebaro@mssm.edu>
+:Date: 2019-10-12
+:License: MIT
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from favorite_books import random_favorite_books, popular_favorite_books
+
+
+def reference_get_random_good_book(df):
+	""" Previous implementation: lists of books per user, one row at a time """
+	test = df[df['rating'] >= 4].groupby('user_id')['book_id_gr'].apply(list).reset_index(name='list_books_4')
+	user_gb = {}
+	for i in range(test.shape[0]):
+		choice = random.choice(test.iloc[i][1])
+		user_gb[test.iloc[i][0]] = random.choice(test.iloc[i][1])
+	return user_gb
+
+
+def timed(func, *args, **kwargs):
+	start = time.perf_counter()
+	result = func(*args, **kwargs)
+	return result, time.perf_counter() - start
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument('--users', type=int, default=1000000, help='number of users')
+	parser.add_argument('--books-per-user', type=int, default=20, help='number of ratings per user')
+	parser.add_argument('--reference-users', type=int, default=20000,
+		help='number of users for the previous implementation (0 to skip)')
+	args = parser.parse_args()
+
+	rng = np.random.RandomState(0)
+	nb_ratings = args.users * args.books_per_user
+	ratings = pd.DataFrame({'user_id': np.repeat(np.arange(args.users, dtype=np.int32), args.books_per_user),
+		'book_id_gr': rng.randint(0, 100000, nb_ratings), 'rating': rng.randint(0, 6, nb_ratings).astype(np.int8)})
+	scores = pd.Series(rng.random_sample(100000))
+
+	fav, elapsed = timed(random_favorite_books, ratings, random_state=0)
+	print('random: {} users in {:.2f} s'.format(len(fav), elapsed))
+	fav, elapsed = timed(popular_favorite_books, ratings, scores, random_state=0)
+	print('popularity: {} users in {:.2f} s'.format(len(fav), elapsed))
+
+	if args.reference_users:
+		sample = ratings.iloc[:args.reference_users * args.books_per_user]
+		user_gb, elapsed_ref = timed(reference_get_random_good_book, sample)
+		print('reference: {} users in {:.2f} s'.format(len(user_gb), elapsed_ref))
+		print('speedup per user: {:.1f}x'.format((elapsed_ref / len(user_gb)) / (elapsed / len(fav))))
+
+
+if __name__ == '__main__':
+	main()
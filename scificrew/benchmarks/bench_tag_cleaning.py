@@ -0,0 +1,75 @@
+""" Benchmark of the tag cleaning of CleaningBooks.clean_data_bad_tags
+on the books_scifi_test.csv fixture scaled up to millions of rows
+
+Run from the scificrew folder:
+	python benchmarks/bench_tag_cleaning.py --rows 1000000
+
+:Author: Yassmine Chebaro <yassmnine.chebaro@mssm.edu>
+:Date: 2019-10-03
+:License: MIT
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tag_cleaning import TagCleaner
+
+
+def reference_clean_data_bad_tags(popular_shelves, count_shelves):
+	""" Previous implementation: eval of each row and one re.match per pattern and tag """
+	popnew = []
+	cnew = []
+	for elm_str, elmc_str in zip(popular_shelves, count_shelves):
+		to_remove = []
+		elmlist = eval('['+elm_str+']')
+		elmclist = eval('['+elmc_str+']')
+		elm = [i for all in elmlist for i in all]
+		elmc = [i for all in elmclist for i in all]
+
+		for i in range(len(elm)):
+			if (len(elm[i]) == 1) or any(bool(re.match(p, elm[i])) for p in ['.*book*', '.*read*',
+				'.*favorite*', '.*need*', '.*own*', '.*shelve*', '.*like*', '.*shelf*', '.*buy*', 'tbr',
+				'.*finish*', '.*kindle*', '.*list*', '.*year*', '.*audio*', '.*library*']):
+				to_remove.append(i)
+
+		popnew.append([elm[e] for e in range(len(elm)) if e not in to_remove])
+		cnew.append([elmc[e] for e in range(len(elmc)) if e not in to_remove])
+
+	return popnew, cnew
+
+
+def timed(func, *args):
+	start = time.perf_counter()
+	result = func(*args)
+	return result, time.perf_counter() - start
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument('--rows', type=int, default=1000000, help='number of books for the tag cleaner')
+	parser.add_argument('--reference-rows', type=int, default=20000,
+		help='number of books for the previous implementation (0 to skip)')
+	args = parser.parse_args()
+
+	fixture = pd.read_csv(os.path.join('tests', 'fixtures', 'books_scifi_test.csv'))
+	repeat = -(-args.rows // len(fixture))
+	books = pd.concat([fixture] * repeat, ignore_index=True).iloc[:args.rows]
+
+	(popnew, cnew), elapsed = timed(TagCleaner().clean_shelves, books['popular_shelves'], books['count_shelves'])
+	print('TagCleaner: {} rows in {:.2f} s ({:.0f} rows/s)'.format(len(books), elapsed, len(books) / elapsed))
+
+	if args.reference_rows:
+		sample = books.iloc[:args.reference_rows]
+		(popref, cref), elapsed_ref = timed(reference_clean_data_bad_tags, sample['popular_shelves'], sample['count_shelves'])
+		print('reference: {} rows in {:.2f} s ({:.0f} rows/s)'.format(len(sample), elapsed_ref, len(sample) / elapsed_ref))
+		print('speedup per row: {:.1f}x'.format((elapsed_ref / len(sample)) / (elapsed / len(books))))
+		print('same result: {}'.format(popref == popnew[:len(sample)] and cref == cnew[:len(sample)]))
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,155 @@
+""" Filtering book entries from the GoodReads json dump
+in a single streaming pass, optionally over several processes
+
+:Author: Yassmine Chebaro <yassmnine.chebaro@mssm.edu>
+:Date: 2019-09-16
+:License: MIT
+"""
+
+import gzip
+import json
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+
+ENG_LAN = {'en', 'enm', 'en-US', 'en-GB', ''}
+CHILD_BOOKS = {'child', 'children', 'children-s', 'childrens', 'kids-books', 'childrens-s-books'}
+SCIFI_GENRES = {'science-fiction', 'sci-fi', 'scifi'}
+MAIN_GENRES = {'classics', 'classic', 'fantasy', 'romance', 'mystery', 'science-fiction', 'sci-fi',
+	'scifi', 'business', 'economics'}
+
+
+def is_english_nochild(book, names):
+	""" English book without children tag in its first 6 shelves """
+	return book['language_code'] in ENG_LAN and CHILD_BOOKS.isdisjoint(names[:6])
+
+
+def is_scifi(book, names):
+	""" Book with a sci-fi shelf """
+	return not SCIFI_GENRES.isdisjoint(names)
+
+
+def is_main_genre(book, names):
+	""" Book with a shelf from the main genres """
+	return not MAIN_GENRES.isdisjoint(names)
+
+
+BOOK_FILTERS = {
+	'english_nochild': is_english_nochild,
+	'scifi': is_scifi,
+	'main_genre': is_main_genre,
+}
+
+
+def open_json(inputdata):
+	""" Open a json lines file for binary reading, gzip'd or not
+
+	Args:
+		inputdata (:obj:`str`): name of the input json file
+
+	Returns:
+		:obj:`file`: binary file object
+	"""
+	with open(inputdata, 'rb') as fin:
+		magic = fin.read(2)
+	if magic == b'\x1f\x8b':
+		return gzip.open(inputdata, 'rb')
+	return open(inputdata, 'rb')
+
+
+def _open_output(outputfile):
+	if outputfile.endswith('.gz'):
+		return gzip.open(outputfile, 'wt')
+	return open(outputfile, 'w')
+
+
+def filter_lines(lines, filters):
+	""" Decode a batch of json lines and apply the filters of each output
+
+	Args:
+		lines (:obj:`list`): list of json lines (bytes)
+		filters (:obj:`list`): list of tuples of filter names, one tuple per output;
+		a book goes to an output when it passes all of its filters
+
+	Returns:
+		:obj:`selected`: list of lists of selected lines (str, without end of line), one per output
+	"""
+	selected = [[] for _ in filters]
+	for line in lines:
+		book = json.loads(line)
+		names = [elm['name'] for elm in book['popular_shelves']]
+		passed = {}
+		for i, output_filters in enumerate(filters):
+			for name in output_filters:
+				if name not in passed:
+					passed[name] = BOOK_FILTERS[name](book, names)
+				if not passed[name]:
+					break
+			else:
+				selected[i].append(line.decode('utf-8').rstrip('\r\n'))
+
+	return selected
+
+
+def _batches(json_file, batch_size):
+	while True:
+		batch = list(islice(json_file, batch_size))
+		if not batch:
+			return
+		yield batch
+
+
+def filter_books(inputdata, outputs, n_jobs=1, batch_size=10000):
+	""" Write the books passing the filters of each output, reading the input only once.
+	Batches of lines are decoded and filtered in n_jobs worker processes and written in the
+	order of the input, the selected lines are written as they are read
+
+	Args:
+		inputdata (:obj:`str`): name of input json file, gzip'd or not
+		outputs (:obj:`dict`): output json file names (gzip'd if ending in .gz) and the
+		list of filter names (keys of BOOK_FILTERS) a book has to pass to be written in it
+		n_jobs (:obj:`int`): number of worker processes, 1 to filter in the current process
+		batch_size (:obj:`int`): number of lines per batch
+
+	Returns:
+		:obj:`counts`: dict of the number of books written in each output
+	"""
+	outputfiles = list(outputs)
+	filters = [tuple(outputs[name]) for name in outputfiles]
+	for output_filters in filters:
+		for name in output_filters:
+			if name not in BOOK_FILTERS:
+				raise ValueError('Unknown book filter: {}'.format(name))
+
+	counts = dict.fromkeys(outputfiles, 0)
+	fouts = [_open_output(name) for name in outputfiles]
+	try:
+		with open_json(inputdata) as json_file:
+			batches = _batches(json_file, batch_size)
+			if n_jobs == 1:
+				results = (filter_lines(batch, filters) for batch in batches)
+				for selected in results:
+					_write_selected(fouts, outputfiles, selected, counts)
+			else:
+				with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+					# keep a bounded number of batches in flight, collected in input order
+					pending = deque()
+					for batch in batches:
+						pending.append(executor.submit(filter_lines, batch, filters))
+						if len(pending) >= 2 * n_jobs:
+							_write_selected(fouts, outputfiles, pending.popleft().result(), counts)
+					while pending:
+						_write_selected(fouts, outputfiles, pending.popleft().result(), counts)
+	finally:
+		for fout in fouts:
+			fout.close()
+
+	return counts
+
+
+def _write_selected(fouts, outputfiles, selected, counts):
+	for fout, name, lines in zip(fouts, outputfiles, selected):
+		for line in lines:
+			fout.write('{}\n'.format(line))
+		counts[name] += len(lines)
@@ -17,85 +17,72 @@ import matplotlib.pyplot as plt
 import seaborn as sns
 from collections import Counter
 from subprocess import check_call
+from books_filter import filter_books
+from shelf_store import ShelfStore, read_books_json
+from artifacts import ArtifactStore
+from tag_cleaning import TagCleaner, TagReplacer, TagPipeline, FirstTags, SF_TAG_PATTERNS, \
+	merge_similar_tags, book_tags_pipeline
 
 
+# scalar fields of the scifi books, the tags are kept in a ShelfStore
+BOOK_FIELDS = ['isbn', 'book_id', 'title', 'num_pages', 'publication_year', 'average_rating', 'ratings_count']
+
 
 class CleaningBooks(object):
 	""" Cleaning books from Goodreads database 
 	Mengting Wan, Julian McAuley, "Item Recommendation on Monotonic Behavior Chains", in RecSys'18 
 	"""
 	
-	def get_genre(self, inputjson, outputjson):
+	def filter_books(self, inputdata, outputs, n_jobs=1):
+		""" Selects books for several outputs in a single pass over the json file,
+		see :obj:`books_filter.filter_books`
+
+		Args:
+			inputdata (:obj:`str`): name of input json file, gzip'd or not
+			outputs (:obj:`dict`): output json file names and their list of filter names
+			('english_nochild', 'scifi', 'main_genre')
+			n_jobs (:obj:`int`): number of worker processes
+
+		Returns:
+			:obj:`counts`: dict of the number of books written in each output
+		"""
+		return filter_books(inputdata, outputs, n_jobs=n_jobs)
+
+	def get_genre(self, inputjson, outputjson, n_jobs=1):
 		""" Selects books from main genres
 		
 		Args:
 			inputjson (:obj:`str`): name of input json file
+			n_jobs (:obj:`int`): number of worker processes
 
 		Returns:
 			:obj:`outputjson`: name of output json file
 		"""
+		self.filter_books(inputjson, {outputjson: ['main_genre']}, n_jobs)
 
-		wanted = ['classics', 'classic', 'fantasy', 'romance', 'mystery', 'science-fiction', 'sci-fi',
-			 'scifi', 'business', 'economics']
-
-		output = open(outputfile, 'w')
-	
-		with open(inputdata) as json_file:
-			for line in json_file:
-				book = json.loads(line)
-				names = [elm['name'] for elm in book['popular_shelves'] if \
-			bool(re.match('[^\x00-\x7F\x80-\xFF\u0100-\u017F\u0180-\u024F\u1E00-\u1EFF]', elm['name'])) == False]
-				if set(wanted).isdisjoint(names) == False:
-					output.write('{}\n'.format(json.dumps(book)))
-
-		output.close()
-
-	def clean_data_language(self, inputdata, outputfile):
+	def clean_data_language(self, inputdata, outputfile, n_jobs=1):
 		""" Removes children books and non-english books from json file
 		
 		Args:
 			inputdata (:obj:`str`): name of input json file
+			n_jobs (:obj:`int`): number of worker processes
 
 		Returns:
 			:obj:`outputfile`: name of output json file
 		"""
-		
-		eng_lan = ['en', 'enm', 'en-US', 'en-GB', '']
-		child_books = ['child', 'children', 'children-s', 'childrens', 'kids-books', 'childrens-s-books']
+		self.filter_books(inputdata, {outputfile: ['english_nochild']}, n_jobs)
 
-		output = open(outputfile, 'w')
-		with gzip.open(inputdata) as json_file:
-			for line in json_file:
-				book = json.loads(line)
-				names = [elm['name'] for elm in book['popular_shelves']]
-				if (book['language_code'] in eng_lan) and (not set(child_books).isdisjoint(names[:6]) == False):
-					output.write('{}\n'.format(json.dumps(book)))
-		output.close()
-
-
-
-	def get_scifi(self, inputjson, outputjson):
+	def get_scifi(self, inputjson, outputjson, n_jobs=1):
 		""" Selects books from sci-fi genre
 		
 		Args:
 			inputjson (:obj:`str`): name of input json file
+			n_jobs (:obj:`int`): number of worker processes
 
 		Returns:
 			:obj:`outputjson`: name of output json file
 		"""
-
-		wanted = [ 'science-fiction', 'sci-fi', 'scifi']
-
-		output = open(outputjson, 'w')
-	
-		with gzip.open(inputjson) as json_file:
-			for line in json_file:
-				book = json.loads(line)
-				names = [elm['name'] for elm in book['popular_shelves']]
-				if set(wanted).isdisjoint(names) == False:
-					output.write('{}\n'.format(json.dumps(book)))
-
-		output.close()
+		self.filter_books(inputjson, {outputjson: ['scifi']}, n_jobs)
 
 	def clean_data_bad_tags(self, dfin):
 		""" Removes book tags from datafram which are irrelevant
@@ -109,35 +96,7 @@ class CleaningBooks(object):
 			:obj:`cnew`: list with removed count of irrelevant tag names
 		"""
 
-		popular_shelves = dfin['popular_shelves']
-		count_shelves = dfin['count_shelves']
-	
-		popnew = []
-		cnew = []
-
-		for elm_str, elmc_str in zip(popular_shelves, count_shelves):    
-			to_remove = []
-			elmlist=eval('['+elm_str+']')
-			elmclist=eval('['+elmc_str+']')
-			elm = [i for all in elmlist for i in all]
-			elmc = [i for all in elmclist for i in all]
-
-			for i in range(len(elm)):
-				if (len(elm[i]) == 1) or (bool(re.match('.*book*', elm[i])) == True)\
-				or (bool(re.match('.*read*', elm[i])) == True) or (bool(re.match('.*favorite*', elm[i])) == True)\
-				or (bool(re.match('.*need*', elm[i])) == True) or (bool(re.match('.*own*', elm[i])) == True)\
-				or (bool(re.match('.*shelve*', elm[i])) == True) or (bool(re.match('.*like*', elm[i])) == True)\
-				or (bool(re.match('.*shelf*', elm[i])) == True) or (bool(re.match('.*buy*', elm[i])) == True)\
-				or (bool(re.match('tbr', elm[i])) == True) or (bool(re.match('.*finish*', elm[i])) == True)\
-				or (bool(re.match('.*kindle*', elm[i])) == True) or (bool(re.match('.*list*', elm[i])) == True)\
-				or (bool(re.match('.*year*', elm[i])) == True) or (bool(re.match('.*audio*', elm[i])) == True)\
-				or (bool(re.match('.*library*', elm[i])) == True):
-					to_remove.append(i) 
-		
-			popnew.append([elm[e] for e in range(len(elm)) if e not in to_remove])
-			cnew.append([elmc[e] for e in range(len(elmc)) if e not in to_remove])
-
-		return popnew, cnew
+		return TagCleaner().clean_shelves(dfin['popular_shelves'], dfin['count_shelves'])
 
 
 	def replace_tags(self, dfin):
@@ -151,24 +110,7 @@ class CleaningBooks(object):
 			:obj:`popnew`: list with removed irrelevant tag names
 			:obj:`cnew`: list with removed count of irrelevant tag names
 		"""
-
-		popular_shelves = dfin['popular_shelves']
-		count_shelves = dfin['count_shelves']    
-	
-		popnew = []
-		cnew = []
-
-		for elm, elmc in zip(popular_shelves, count_shelves):    
-			for i in range(len(elm)):
-				elm[i]= elm[i].replace('classics', 'classic')
-				elm[i]= elm[i].replace('scifi', 'science-fiction')
-				elm[i]= elm[i].replace('sci-fi', 'science-fiction')
-				elm[i] = elm[i].replace('ya', 'young-adult')
-
-			popnew.append([elm[e] for e in range(len(elm))])
-			cnew.append([elmc[e] for e in range(len(elmc))])
-	
-		return popnew, cnew
+		return TagPipeline([TagReplacer()]).run(dfin['popular_shelves'], dfin['count_shelves'])
 
 	def merge_similar_tags(self, dfin):
 		""" Merge similar tags, needed after replacing ya with young-adult for example
@@ -180,29 +122,9 @@ class CleaningBooks(object):
 			:obj:`popnew`: list with merged tag names
 			:obj:`cnew`: list with removed count of merged tag names
 		"""
+		popnew, cnew = TagPipeline([merge_similar_tags]).run(dfin['popular_shelves'], dfin['count_shelves'])
+		sum_tags = [sum(elmc) for elmc in cnew]
 
-		popular_shelves = dfin['popular_shelves']
-		count_shelves = dfin['count_shelves']    
-	
-		popnew = []
-		cnew = []
-		sum_tags = []
-
-		for elm, elmc in zip(popular_shelves, count_shelves):  
-			to_remove = []
-			elmc_int = np.array([int(i) for i in elmc])
-			rep = [item for item, count in Counter(elm).items() if count > 1]
-			if rep:
-				to_remove = [elm.index(tag) for tag in rep]
-				for r in rep:
-					rep_idx = [i for i,d in enumerate(elm) if d==r]
-					sum_rep = (np.sum(elmc_int[rep_idx]))
-					elmc_int[rep_idx[1]] = sum_rep
-			
-			popnew.append([elm[e] for e in range(len(elm)) if e not in to_remove])
-			cnew.append([elmc_int[e] for e in range(len(elmc_int)) if e not in to_remove])
-			sum_tags.append(sum([elmc_int[e] for e in range(len(elmc_int)) if e not in to_remove]))
-		
 		return popnew, cnew, sum_tags
 
 
@@ -216,22 +138,7 @@ class CleaningBooks(object):
 			:obj:`popnew`: list with removed science-fiction tag names
 			:obj:`cnew`: list with removed count of science-fiction tag names
 		"""
-
-		popular_shelves = dfin['popular_shelves']
-		count_shelves = dfin['count_shelves']
-	
-		popnew = []
-		cnew = []
-
-		for elm, elmc in zip(popular_shelves, count_shelves):    
-			to_remove = []
-			for i in range(len(elm)):
-				if (bool(re.match('.*science-fiction*', elm[i])) == True):
-					to_remove.append(i) 
-			popnew.append([elm[e] for e in range(len(elm)) if e not in to_remove])
-			cnew.append([elmc[e] for e in range(len(elmc)) if e not in to_remove])
- 
-		return popnew, cnew
+		return TagPipeline([TagCleaner(SF_TAG_PATTERNS, drop_lengths=())]).run(dfin['popular_shelves'], dfin['count_shelves'])
 
 	def get_first_tags(self, dfin, cutoff):
 		""" Keep only first n tags, using cutoff as value
@@ -244,23 +151,23 @@ class CleaningBooks(object):
 			:obj:`popnew`: list with most populated tag names using cutoff for the number of tags
 			:obj:`cnew`: list with most populated tag names using cutoff for the number of tags
 		"""
-		popular_shelves = dfin['popular_shelves']
-		count_shelves = dfin['count_shelves']    
-		
-		popnew = []
-		cnew = []
+		return TagPipeline([FirstTags(cutoff)]).run(dfin['popular_shelves'], dfin['count_shelves'])
 
-		for elm, elmc in zip(popular_shelves, count_shelves):    
-			listp = [elm[e] for e in range(len(elm))][0:int(cutoff)]
-			listc = [elmc[e] for e in range(len(elmc))][0:int(cutoff)]
-			if len(listp) == 0:
-				popnew.append('none')
-				cnew.append(0)
-			else:
-				popnew.append(listp[0])
-				cnew.append(listc[0])
-
-		return popnew, cnew
+	def normalize_tags(self, dfin, cutoff):
+		""" Removes irrelevant tags, replaces tag names with homogeneous tags, removes science-fiction
+		tags, merges similar tags and keeps only the first tag in a single pass over the books,
+		same result as chaining clean_data_bad_tags, replace_tags, remove_sf_tags, merge_similar_tags
+		and get_first_tags
+		
+		Args:
+			dfin (:obj:`str`): name of the dataframe
+			cutoff (:obj:`int`): cutoff for the number of first tags to keep
+ 
+		Returns:
+			:obj:`popnew`: list with most populated tag names using cutoff for the number of tags
+			:obj:`cnew`: list with most populated tag names using cutoff for the number of tags
+		"""
+		return book_tags_pipeline(cutoff).run(dfin['popular_shelves'], dfin['count_shelves'])
 
 	def update_dataframe(self, popular_shelves, count_shelves, inputdf):
 		""" Updates dataframe with new values for popular_shelves and respective counts
@@ -317,6 +224,34 @@ class CleaningBooks(object):
 				books.append(book)
 		return books
 
+	def get_books_shelves(self, inputdata):
+		""" Extract popular_shelves and count_shelves from json file in a columnar
+		store of tag ids and counts, see :obj:`shelf_store.ShelfStore`
+		
+		Args:
+			inputdata (:obj:`str`): name of the input json file
+ 
+		Returns:
+			:obj:`shelves`: ShelfStore of the tags of each book
+		"""
+		return ShelfStore.from_json(inputdata)
+
+	def get_books_data_shelves(self, inputdata):
+		""" Extract the fields of get_books_data and the store of get_books_shelves
+		in a single pass over the json file
+
+		Args:
+			inputdata (:obj:`str`): name of the input json file
+
+		Returns:
+			:obj:`books`: pandas DataFrame of isbn, book_id, title, num_pages, publication_year,
+			average_rating and ratings_count
+			:obj:`shelves`: ShelfStore of the tags of each book
+		"""
+		columns, shelves = read_books_json(inputdata, BOOK_FIELDS)
+
+		return pd.DataFrame(columns, columns=BOOK_FIELDS), shelves
+
 	def load_data(self, inputdata):
 		""" Extract json entry from concatenated json file
 
@@ -337,55 +272,28 @@ class CleaningBooks(object):
 
 def main():
 
-	# Read in json file of book entries and output
-	books_json = CleaningBooks().clean_data_language('goodreads_books.json.gz', 'books_en_nochild.json')
-
-	# Gzip the json file for space
-	with open('books_en_nochild-30-09.json', 'rb') as fin, gzip.open('books_en_nochild.json.gz', 'wb') as fout:
-	 	fout.writelines(fin)
-
-	# Extracting scifi books from the database and putting them in a pandas DataFrame
-	CleaningBooks().get_scifi('books_en_nochild.json.gz', 'books_scifi.json')
-	scifi_books = CleaningBooks().get_books_data('books_scifi.json')
-	df_scifi_books = pd.DataFrame(scifi_books)
-	df_scifi_books.to_csv('books_scifi.csv', index=False)
-
-	# Removing irrelevant tags from scifi books
-	popnew, cnew = CleaningBooks().clean_data_bad_tags(dfin)
-	new_column_p = pd.Series(popnew, name='popular_shelves', index=range(len(popnew)))
-	new_column_c = pd.Series(cnew, name='count_shelves', index=range(len(cnew)))
-	dfin.update(new_column_p)
-	dfin.update(new_column_c)
-
-	# Replace repetitive tag names
-	popnew, cnew = CleaningBooks().replace_tags(dfin)
-	new_column_p = pd.Series(popnew, name='popular_shelves', index=range(len(popnew)))
-	new_column_c = pd.Series(cnew, name='count_shelves', index=range(len(cnew)))
-	dfin.update(new_column_p)
-	dfin.update(new_column_c)
-	
-	# Remove science-fiction tags to get subgenre tags
-	popnew, cnew =CleaningBooks().remove_sf_tags(dfin)
-	new_column_p = pd.Series(popnew, name='popular_shelves', index=range(len(popnew)))
-	new_column_c = pd.Series(cnew, name='count_shelves', index=range(len(cnew)))
-	dfin.update(new_column_p)
-	dfin.update(new_column_c)
-
-	# Merge similar tags
-	popnew, cnew, sum_tags = CleaningBooks().merge_similar_tags(dfin)
-	new_column_p = pd.Series(popnew, name='popular_shelves', index=range(len(popnew)))
-	new_column_c = pd.Series(cnew, name='count_shelves', index=range(len(cnew)))
-	dfin.update(new_column_p)
-	dfin.update(new_column_c)
-
-	# Get first populated tags, here I chose 1
-	popnew, cnew = CleaningBooks().get_first_tags(dfin, 1)
-	new_column_p = pd.Series(popnew, name='popular_shelves', index=range(len(popnew)))
-	new_column_c = pd.Series(cnew, name='count_shelves', index=range(len(cnew)))
-	dfin.update(new_column_p)
-	dfin.update(new_column_c)
-
-	dfin.to_csv('book_year_1tag.csv', index=False)
+	# Single pass over the json file of book entries: english books without children
+	# books (gzip'd for space) and scifi books among them
+	CleaningBooks().filter_books('goodreads_books.json.gz', {
+		'books_en_nochild.json.gz': ['english_nochild'],
+		'books_scifi.json': ['english_nochild', 'scifi']}, n_jobs=os.cpu_count())
+
+	# Extracting scifi books from the database and putting them in a pandas DataFrame,
+	# the tags are kept in a binary columnar store instead of lists in the csv file
+	store = ArtifactStore()
+	df_scifi_books, shelves = CleaningBooks().get_books_data_shelves('books_scifi.json')
+	store.write('books_scifi', df_scifi_books)
+	shelves.save('books_scifi_shelves.npz')
+
+	# Removing irrelevant tags, replacing and merging tag names, removing science-fiction tags
+	# and getting first populated tags (here I chose 1) with vectorized operations on the store
+	popnew, cnew = shelves.normalize_tags(1)
+	dfin = df_scifi_books
+	dfin['popular_shelves'] = popnew
+	dfin['count_shelves'] = cnew
+
+	# typed columns, in alphabetical order
+	store.write('book_year_1tag', dfin)
 
 
 if __name__ == '__main__':
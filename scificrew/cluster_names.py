@@ -0,0 +1,71 @@
+""" Names of the users of the final clusters: within each group the users get the names
+of a shuffled permutation of the name pool, by rank in the group, in one vectorized pass
+
+:Author: Yassmine Chebaro <yassmnine.chebaro@mssm.edu>
+:Date: 2019-10-13
+:License: MIT
+"""
+
+import numpy as np
+import pandas as pd
+from artifacts import ArtifactStore
+
+
+def load_names(inputcsv):
+	""" Pool of first names, one per line
+
+	Args:
+		inputcsv (:obj:`str`): name of the file of names
+
+	Returns:
+		:obj:`array`: numpy array of the distinct names, sorted
+	"""
+	return np.unique(np.atleast_1d(np.genfromtxt(inputcsv, dtype='str')))
+
+
+def assign_names(clusters, names, random_state=None):
+	""" Name of each user of each group, as the former get_names_clust without the
+	per group filtering: the users of a group, by increasing user_idx, get the names of a
+	random permutation of the pool. In a group larger than the pool, the permutation
+	is repeated (user of rank r gets the name of position r modulo the pool size), so a
+	name is reused only once all names of the pool are used in the group
+
+	Args:
+		clusters (:obj:`DataFrame`): pandas DataFrame of user_idx and group
+		names (:obj:`array`): pool of names
+		random_state (:obj:`int`): seed of the permutations
+
+	Returns:
+		:obj:`df`: pandas DataFrame of user_idx, group and names, in the order of clusters
+	"""
+	names = np.unique(np.asarray(names, dtype=str))
+	if len(names) == 0:
+		raise ValueError('Empty pool of names')
+	if clusters['user_idx'].duplicated().any():
+		raise ValueError('Users in several groups')
+
+	users = clusters.loc[:, ['user_idx', 'group']].sort_values(['group', 'user_idx'])
+	groups, group_pos = np.unique(users['group'].to_numpy(), return_inverse=True)
+	rank = users.groupby('group').cumcount().to_numpy()
+
+	# one permutation of the pool per group, indexed by the rank of the user in the group
+	rng = np.random.RandomState(random_state)
+	permutations = rng.random_sample((len(groups), len(names))).argsort(axis=1)
+	users['names'] = names[permutations[group_pos.reshape(-1), rank % len(names)]]
+
+	return pd.merge(clusters.loc[:, ['user_idx', 'group']], users.loc[:, ['user_idx', 'names']], on='user_idx',
+		how='left', validate='one_to_one')
+
+
+def main(random_state=0):
+	store = ArtifactStore()
+
+	# open clusters and names files
+	clusters = store.read('clusters_final', fallback_csv='clusters_final.csv')
+	names = load_names('names_64.csv')
+
+	store.write('clusters_group_names', assign_names(clusters, names, random_state))
+
+
+if __name__ == '__main__':
+	main()
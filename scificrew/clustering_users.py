@@ -9,44 +9,163 @@
 import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
-from scipy.sparse import csr_matrix
-from sklearn.cluster import KMeans
+from scipy.sparse import csr_matrix, coo_matrix
+from sklearn.cluster import KMeans, MiniBatchKMeans
 from sklearn.metrics import mean_squared_error
+import hashlib
 import itertools
+import json
+import os
 from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from year_tag_features import YearTagFeatures, load_year_tag_features
+from artifacts import ArtifactStore
 
 
+# columns of the books read by Step 2
+BOOK_YEAR_COLUMNS = ['average_rating', 'book_id', 'popular_shelves', 'publication_year']
 
 
 class ClusteringUsersStep1(object):
 	""" K-means clustering of users using book ratings 
 		This is the first step of the clustering
 
+	Args:
+		engine (:obj:`str`): 'kmeans' for full batch k-means, 'minibatch' for mini-batch k-means
+		n_init (:obj:`int`): number of initializations, the best one is kept
+		random_state (:obj:`int`): seed of the initializations, for reproducible clusters
+		batch_size (:obj:`int`): number of users per mini-batch
+		chunk_size (:obj:`int`): with the minibatch engine, number of users passed at a time to
+		partial_fit (the whole matrix is passed to fit if None)
+		n_epochs (:obj:`int`): number of passes over the chunks of users with partial_fit
 	"""
 
-	def clustering_users_ratings(self, df_ratings):
+	def __init__(self, engine='kmeans', n_init=10, random_state=None, batch_size=1024, chunk_size=None,
+		n_epochs=5):
+		if engine not in ['kmeans', 'minibatch']:
+			raise ValueError('Unknown clustering engine: {}'.format(engine))
+		self.engine = engine
+		self.n_init = n_init
+		self.random_state = random_state
+		self.batch_size = batch_size
+		self.chunk_size = chunk_size
+		self.n_epochs = n_epochs
+		self.model = None
+		self.books = None
+
+	def get_ratings_matrix(self, df_ratings, books=None):
+		""" Build the sparse users books ratings matrix directly from the ratings,
+		without a dense pivot table (ratings of a repeated user and book are averaged, as in pivot_table)
+	
+		Args:
+			df_ratings (:obj:`DataFrame`): pandas DataFrame of user books ratings
+			books (:obj:`numpy.ndarray`): sorted book_idx of the columns, ratings of other books
+			are ignored; all rated books if None
+		Returns:
+			:obj:`sparse_ratings`: scipy csr matrix of users x books ratings
+			:obj:`users`: numpy array of the user_idx of each row
+			:obj:`books`: numpy array of the book_idx of each column
+		"""
+		user_idx = df_ratings['user_idx'].to_numpy()
+		book_idx = df_ratings['book_idx'].to_numpy()
+		rating = df_ratings['rating'].to_numpy(dtype=np.float64)
+
+		users, user_rows = np.unique(user_idx, return_inverse=True)
+		if books is None:
+			books, book_cols = np.unique(book_idx, return_inverse=True)
+		else:
+			book_cols = np.minimum(np.searchsorted(books, book_idx), len(books) - 1)
+			known = books[book_cols] == book_idx
+			user_rows, book_cols, rating = user_rows.reshape(-1)[known], book_cols[known], rating[known]
+		user_rows = user_rows.reshape(-1)
+		book_cols = book_cols.reshape(-1)
+		shape = (len(users), len(books))
+
+		sparse_ratings = coo_matrix((rating, (user_rows, book_cols)), shape=shape).tocsr()
+		nb_ratings = coo_matrix((np.ones(len(user_rows)), (user_rows, book_cols)), shape=shape).tocsr()
+		if nb_ratings.nnz and nb_ratings.data.max() > 1:
+			sparse_ratings.data /= nb_ratings.data
+
+		return sparse_ratings, users, books
+
+	def fit_clusters(self, sparse_ratings, n_clusters):
+		""" Fit the clustering engine on the users books ratings matrix
+	
+		Args:
+			sparse_ratings (:obj:`csr_matrix`): scipy csr matrix of users x books ratings
+			n_clusters (:obj:`int`): number of k clusters
+		Returns:
+			:obj:`predictions`: numpy array of the cluster of each user
+		"""
+		if self.engine == 'kmeans':
+			self.model = KMeans(n_clusters=n_clusters, n_init=self.n_init, random_state=self.random_state)
+			return self.model.fit_predict(sparse_ratings)
+
+		self.model = MiniBatchKMeans(n_clusters=n_clusters, n_init=self.n_init, random_state=self.random_state,
+			batch_size=self.batch_size)
+		if self.chunk_size is None:
+			return self.model.fit_predict(sparse_ratings)
+
+		# streaming: chunks of users, in a shuffled order at each epoch, after a first
+		# call on a sample of users holding at least a few users per cluster
+		rng = np.random.RandomState(self.random_state)
+		nb_users = sparse_ratings.shape[0]
+		init_users = rng.choice(nb_users, min(nb_users, max(self.chunk_size, 3 * n_clusters)), replace=False)
+		self.model.partial_fit(sparse_ratings[np.sort(init_users)])
+		for epoch in range(self.n_epochs):
+			for start in rng.permutation(np.arange(0, nb_users, self.chunk_size)):
+				self.model.partial_fit(sparse_ratings[start:start + self.chunk_size])
+
+		return self.predict_chunks(sparse_ratings)
+
+	def predict_chunks(self, sparse_ratings):
+		""" Assign users to the fitted clusters, one chunk of users at a time
+	
+		Args:
+			sparse_ratings (:obj:`csr_matrix`): scipy csr matrix of users x books ratings
+		Returns:
+			:obj:`predictions`: numpy array of the cluster of each user
+		"""
+		chunk_size = self.chunk_size or sparse_ratings.shape[0] or 1
+		return np.concatenate([self.model.predict(sparse_ratings[start:start + chunk_size])
+			for start in range(0, sparse_ratings.shape[0], chunk_size)] or [np.zeros(0, dtype=np.int32)])
+
+	def clustering_users_ratings(self, df_ratings, n_clusters=25):
 		""" Cluster users books ratings matrix
 		After evaluation of the optimal number of k for this sparse matrix, the k chosen at this 
 		stage is 25
 	
 		Args:
 			df_ratings (:obj:`DataFrame`): pandas DataFrame of user books ratings
+			n_clusters (:obj:`int`): number of k clusters for k-means
 		Returns:
 			:obj:`user_clustid`: pandas DataFrame with clustered used in 'group' column
 		"""
-		user_book_ratings = pd.pivot_table(df_ratings, index='user_idx', columns='book_idx', values='rating')
+		sparse_ratings, users, self.books = self.get_ratings_matrix(df_ratings)
 
-		# Conversion to sparse csr matrix
-		sparse_ratings = csr_matrix(pd.SparseDataFrame(user_book_ratings).to_coo())
 		# 25 clusters
-		predictions = KMeans(n_clusters=25).fit_predict(sparse_ratings)
+		predictions = self.fit_clusters(sparse_ratings, n_clusters)
 
-		clustered = pd.concat([user_book_ratings.reset_index(), pd.DataFrame({'group':predictions})], axis=1)
-
-		user_clustid = clustered.drop(clustered.columns[1:10269], axis=1)
+		user_clustid = pd.DataFrame({'user_idx': users, 'group': predictions})
 
 		return user_clustid
 
+	def assign_users(self, df_ratings):
+		""" Assign new users to the clusters of clustering_users_ratings without re-clustering,
+		using their ratings of the books of the clustered matrix
+	
+		Args:
+			df_ratings (:obj:`DataFrame`): pandas DataFrame of user books ratings of the new users
+		Returns:
+			:obj:`user_clustid`: pandas DataFrame with clustered used in 'group' column
+		"""
+		if self.model is None:
+			raise ValueError('Users have to be clustered before assigning new users')
+
+		sparse_ratings, users, books = self.get_ratings_matrix(df_ratings, self.books)
+
+		return pd.DataFrame({'user_idx': users, 'group': self.predict_chunks(sparse_ratings)})
+
 
 	def draw_movies_heatmap(user_book_ratings, axis_labels=True):
 		
@@ -94,8 +213,8 @@ class ClusteringUsersStep2(object):
 		listbooks_ratings_idx = list(set(ratings_books['book_idx']))
 		listbooks_year = list(set(book_year['book_id']))
 
-		book_year.rename(columns={'book_id':'book_id_gr', 'publication_year':'pub_year'}, inplace=True)
-		book_year.drop(book_year.columns[[2, 3, 4, 7, 8]], axis=1, inplace=True)
+		book_year = book_year.rename(columns={'book_id':'book_id_gr', 'publication_year':'pub_year'})
+		book_year = book_year.loc[:, ['average_rating', 'book_id_gr', 'popular_shelves', 'pub_year']]
 
 		# Get books publication year from books_sci-fi, matching book_id from rated and reviewed data
 		ratings_book_year = ratings_books[ratings_books['book_id_gr'].isin(listbooks_year)]
@@ -117,38 +236,115 @@ class ClusteringUsersStep2(object):
 			:obj:`tag_year`: pandas DataFrame pivotted with tag and shelve for desired cluster
 		"""
 		df_clust = dfin[dfin['group'] == clustid]
-		df_clust_filtered = df_clust.drop(df_clust.columns[[1, 2, 3, 4, 5, 6, 7, 8, 10]], axis=1)  
-		
-		count_user_year = df_clust_filtered.groupby(['user_idx', 'pub_year']).size().reset_index(name ='year_count')
-		user_year_pivot = pd.pivot_table(count_user_year, index='user_idx', columns= 'pub_year', values='year_count')
+
+		return self.get_tag_year(df_clust)
+
+	def get_tag_year(self, df_clust):
+		""" Getting matrix with publication years and tag of the users of a cluster group
 	
-		count_user_tag = df_clust_filtered.groupby(['user_idx', 'popular_shelves']).size().reset_index(name ='tag_count')
-		listtags = Counter(count_user_tag['popular_shelves'])
-		listtags_freq = [k for k,v in listtags.items() if v>=10]
-		df_u_tags = count_user_tag[count_user_tag['popular_shelves'].isin(listtags_freq)]
-		user_tag_pivot = pd.pivot_table(df_u_tags, index='user_idx', columns= 'popular_shelves', values='tag_count')
+		Args:
+			df_clust (:obj:`DataFrame`): pandas DataFrame with user group, publication year and popular shelve 
+			appended to book ratings/user DataFrame, for the users of one cluster from Step 1
 
-		tag_year = pd.merge(user_year_pivot, user_tag_pivot, on='user_idx')
-		tag_year.fillna(0, inplace=True)
+		Returns:
+			:obj:`tag_year`: pandas DataFrame pivotted with tag and shelve
+		"""
+		features = YearTagFeatures.fit(df_clust)
+
+		return features.to_frame(*features.transform(df_clust))
 
-		return tag_year
+	def get_group_features(self, df_clust, features, min_tag_users=10):
+		""" Getting sparse matrix with publication years and tag of the users of a cluster group,
+		see :obj:`year_tag_features.YearTagFeatures`
+	
+		Args:
+			df_clust (:obj:`DataFrame`): pandas DataFrame with user group, publication year and popular shelve 
+			appended to book ratings/user DataFrame, for the users of one cluster from Step 1
+			features (:obj:`YearTagFeatures`): vocabulary of publication years and tags shared by the groups
+			min_tag_users (:obj:`int`): minimum number of users of a tag in the group
 
-	def compute_clusters(self, tag_year, k):
+		Returns:
+			:obj:`tag_year`: scipy csr matrix of counts of publication years and tags
+			:obj:`users`: numpy array of the user_idx of the rows
+		"""
+		return features.transform(df_clust, min_tag_users)
+
+	def compute_clusters(self, tag_year, k, random_state=None, users=None):
 		""" Compute clusters of users matrix with publication years and tag
 	
 		Args:
-			tag_year (:obj:`DataFrame`): pandas DataFrame pivotted with tag and shelve for desired cluster from Step 1 
+			tag_year (:obj:`DataFrame`): pandas DataFrame pivotted with tag and shelve for desired cluster from Step 1,
+			or scipy sparse matrix of :obj:`get_group_features` 
 			k (:obj:`int`): number of k clusters for k-means
+			random_state (:obj:`int`): seed of k-means, for reproducible clusters
+			users (:obj:`array`): user_idx of the rows of a sparse tag_year
 
 		Returns:
 			:obj:`clustered`: pandas DataFrame of user_idx and resulting cluster number
 		"""			
 
-		predictions = KMeans(n_clusters= k).fit_predict(tag_year)
+		if users is not None:
+			predictions = KMeans(n_clusters= k, random_state=random_state).fit_predict(tag_year)
+			return pd.DataFrame({'user_idx': users, 'group': predictions})
+
+		predictions = KMeans(n_clusters= k, random_state=random_state).fit_predict(tag_year.to_numpy())
 		clustered = pd.concat([tag_year.reset_index(), pd.DataFrame({'group':predictions})], axis=1)
 
 		return clustered
 
+	def cluster_groups(self, dfin, group_k, n_jobs=1, random_state=None, features=None):
+		""" Compute clusters of several cluster groups from Step 1, in parallel
+	
+		Args:
+			dfin (:obj:`DataFrame`): pandas DataFrame with user group, publication year and popular shelve 
+			appended to book ratings/user DataFrame
+			group_k (:obj:`dict` or :obj:`function`): number of k clusters for each cluster group from Step 1,
+			or a module level function returning k from the sparse tag_year matrix of a group, then all groups
+			are clustered
+			n_jobs (:obj:`int`): number of worker processes, 1 to cluster in the current process
+			random_state (:obj:`int`): seed of k-means, for reproducible clusters
+			features (:obj:`YearTagFeatures`): vocabulary of publication years and tags shared by the groups,
+			fitted on dfin if None
+
+		Returns:
+			:obj:`clustered_groups`: dict of cluster group from Step 1 and pandas DataFrame of user_idx and
+			resulting cluster number, in the order of group_k (or of the groups)
+		"""
+		dfin = dfin.loc[:, ['user_idx', 'group', 'pub_year', 'popular_shelves']]
+		if features is None:
+			features = YearTagFeatures.fit(dfin)
+
+		# split the users by group once
+		groups = dict(iter(dfin.groupby('group')))
+		if callable(group_k):
+			wanted = sorted(groups)
+			tasks = [(groups[clustid], group_k, random_state, features) for clustid in wanted]
+		else:
+			wanted = list(group_k)
+			unknown = [clustid for clustid in wanted if clustid not in groups]
+			if unknown:
+				raise ValueError('Cluster groups without users: {}'.format(unknown))
+			tasks = [(groups[clustid], group_k[clustid], random_state, features) for clustid in wanted]
+
+		if n_jobs == 1:
+			results = [_cluster_group(*task) for task in tasks]
+		else:
+			with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+				results = list(executor.map(_cluster_group, *zip(*tasks)))
+
+		return dict(zip(wanted, results))
+
+
+def _cluster_group(df_clust, k, random_state, features):
+	""" Tag and year matrix and clusters of one cluster group, run in the worker processes """
+	step2 = ClusteringUsersStep2()
+	tag_year, users = step2.get_group_features(df_clust, features)
+	if callable(k):
+		k = k(tag_year)
+
+	return step2.compute_clusters(tag_year, k, random_state, users)
+
+
 class GetAllClusters(object):
 	""" In this step clusters from Step 1 which are preserved and not used in Step 2 because of their
 	appropriate size are combined with clusters from Step 2.
@@ -156,29 +352,24 @@ class GetAllClusters(object):
 
 	"""
 
-	def remap_clusters_step1(self, user_clusters):
-		""" Remap cluster group number from Step 1
+	def remap_clusters_step1(self, user_clusters, keep):
+		""" Remap cluster group number from Step 1: the kept clusters are numbered 1, 2...
+		in the order of keep
 	
 		Args:
 			users_clusters (:obj:`DataFrame`): pandas DataFrame of users clusters from Step1
+			keep (:obj:`list`): cluster groups from Step 1 kept as they are, see :obj:`select_groups`
 
 		Returns:
-			:obj:`clust1`: pandas DataFrame of user_idx and group number from cluster 1
-			:obj:`clust2`: pandas DataFrame of user_idx and group number from cluster 2
-			:obj:`clust3`: pandas DataFrame of user_idx and group number from cluster 3
-			:obj:`clust4`: pandas DataFrame of user_idx and group number from cluster 4
-		"""			
-
-		clust1 = user_clusters[user_clusters['group'] == 2]
-		clust1['group'] = clust1['group'].map({2: 1})
-		clust2 = user_clusters[user_clusters['group'] == 10]
-		clust2['group'] = clust2['group'].map({10: 2})
-		clust3 = user_clusters[user_clusters['group'] == 13]
-		clust3['group'] = clust3['group'].map({13: 3})
-		clust4 = user_clusters[user_clusters['group'] == 20]
-		clust4['group'] = clust4['group'].map({20: 4})
+			:obj:`list`: pandas DataFrames of user_idx and new group number of each kept cluster
+		"""
+		kept = []
+		for new_group, clustid in enumerate(keep, 1):
+			clust = user_clusters[user_clusters['group'] == clustid].copy()
+			clust['group'] = new_group
+			kept.append(clust)
 
-		return clust1, clust2, clust3, clust4
+		return kept
 
 	def get_clusters_prop(self, dfcluster, start):
 		""" Extract clusters from Step 2
@@ -220,13 +411,29 @@ class GetAllClusters(object):
 		Returns:
 			:obj:`final_sup10`: pandas DataFrame of user_idx and group number for all
 		"""			
-		clust5 = self.get_clusters_prop(clustered_gp4.loc[:, ['user_idx','group']], 5)
-		clust6 = self.get_clusters_prop(clustered_gp11.loc[:, ['user_idx','group']], 17)
-		clust7 = self.get_clusters_prop(clustered_gp12.loc[:, ['user_idx','group']], 19)
-		clust8 = self.get_clusters_prop(clustered_gp14.loc[:, ['user_idx','group']], 26)
+		return self.merge_all_clusters([clust1, clust2, clust3, clust4],
+			[clustered_gp4, clustered_gp11, clustered_gp12, clustered_gp14])
+
+	def merge_all_clusters(self, step1_clusters, step2_clusters, start=5):
+		""" Merge all clusters and subclusters, the subclusters of each cluster from Step 2 are
+		numbered consecutively from start
+	
+		Args:
+			step1_clusters (:obj:`list`): pandas DataFrames of user_idx and group number of the clusters
+			kept from Step 1
+			step2_clusters (:obj:`list`): pandas DataFrames of user_idx and resulting cluster number
+			from Step 2
+			start (:obj:`int`): group number of the first subcluster
+
+		Returns:
+			:obj:`final_sup10`: pandas DataFrame of user_idx and group number for all
+		"""
+		subclusters = []
+		for clustered in step2_clusters:
+			subclusters.append(self.get_clusters_prop(clustered.loc[:, ['user_idx','group']], start))
+			start += int(clustered['group'].max()) + 1
 
-		final_clusters = pd.concat([clust1, clust2, clust3, clust4, clust5, clust6, 
-			clust7, clust8], ignore_index=True)
+		final_clusters = pd.concat(list(step1_clusters) + subclusters, ignore_index=True)
 
 		count_user_clust_final = final_clusters.groupby(['group']).size().reset_index(name ='gp_count')
 		sup10 = count_user_clust_final[count_user_clust_final['gp_count'] >= 10]
@@ -235,35 +442,107 @@ class GetAllClusters(object):
 
 		return final_sup10
 
+def select_groups(user_clusters, split_fraction=0.1, min_fraction=0.01, min_users=10):
+	""" Cluster groups from Step 1 kept as they are and cluster groups too large, split in Step 2,
+	from the sizes of the clusters; smaller clusters are left out
 
-def main():
+	Args:
+		user_clusters (:obj:`DataFrame`): pandas DataFrame of user_idx and group from Step 1
+		split_fraction (:obj:`float`): clusters with more than this fraction of the users are split
+		min_fraction (:obj:`float`): clusters with less than this fraction of the users are left out
+		min_users (:obj:`int`): clusters with less users are left out
 
-	book_year = pd.read_csv('book_year_1tag-5-10.csv')
-	ratings_books = pd.read_csv('ratings_books_u80_b10.csv')
+	Returns:
+		:obj:`keep`: sorted list of the cluster groups kept
+		:obj:`split`: sorted list of the cluster groups to split
+	"""
+	sizes = user_clusters['group'].value_counts().sort_index()
+	nb_users = sizes.sum()
+	split = sizes.index[sizes > split_fraction * nb_users]
+	keep = sizes.index[(sizes <= split_fraction * nb_users) & (sizes >= max(min_fraction * nb_users, min_users))]
 
-	users_clusters = ClusteringUsersStep1().clustering_users_ratings(ratings_books)
+	return [int(group) for group in keep], [int(group) for group in split]
 
-	#user_clusters = pd.read_csv('user_clustid_k25.csv')
 
-	user_all = ClusteringUsersStep2().get_publication_year(user_clusters, book_year, ratings_books)
+def labels_hash(user_clusters):
+	""" Hash of the cluster of each user, independent of the order of the rows
+
+	Args:
+		user_clusters (:obj:`DataFrame`): pandas DataFrame of user_idx and group
+
+	Returns:
+		:obj:`str`: hexadecimal sha1
+	"""
+	labels = user_clusters.sort_values('user_idx')
+	sha1 = hashlib.sha1(labels['user_idx'].to_numpy(dtype=np.int64).tobytes())
+	sha1.update(labels['group'].to_numpy(dtype=np.int64).tobytes())
+
+	return sha1.hexdigest()
+
+
+def load_k_selection(inputjson):
+	""" Clusters chosen by :obj:`k_selection.KSweep`, see :obj:`k_selection.save_k_selection`
+
+	Args:
+		inputjson (:obj:`str`): name of the json file
+
+	Returns:
+		:obj:`dict`: step1 (number of k clusters of Step 1), random_state (seed of Step 1),
+		step1_hash (:obj:`labels_hash` of the clusters of Step 1), keep (cluster groups kept
+		from Step 1) and step2 (dict of the number of k clusters of each cluster group split in Step 2)
+	"""
+	if not os.path.exists(inputjson):
+		raise FileNotFoundError('No selection of clusters {}, run k_selection.py first'.format(inputjson))
+
+	with open(inputjson) as fin:
+		selection = json.load(fin)
+
+	return {'step1': int(selection['step1']), 'random_state': selection.get('random_state'),
+		'step1_hash': selection.get('step1_hash'), 'keep': [int(group) for group in selection['keep']],
+		'step2': {int(group): int(k) for group, k in selection['step2'].items()}}
+
+
+def read_user_books(store):
+	""" Books rated by the users of the Step 1 clusters, with their publication year and
+	most popular shelf, from the artifacts of the previous stages: the frame the shared
+	vocabulary of the features is fitted on, by this stage and user_similarity.py
+
+	Args:
+		store (:obj:`ArtifactStore`): artifacts of the pipeline
+
+	Returns:
+		:obj:`user_clusters`: pandas DataFrame of user_idx and group of Step 1
+		:obj:`user_all`: pandas DataFrame of :obj:`ClusteringUsersStep2.get_publication_year`
+	"""
+	book_year = store.read('book_year_1tag', BOOK_YEAR_COLUMNS, fallback_csv='book_year_1tag-5-10.csv')
+	ratings_books = store.read('ratings_books', fallback_csv='ratings_books_u80_b10.csv')
+	user_clusters = store.read('user_clusters')
+
+	return user_clusters, ClusteringUsersStep2().get_publication_year(user_clusters, book_year, ratings_books)
+
+
+def main():
 
-	#user_all.to_csv("testusersall.csv",index=False)
-	tag_year_gp4 = ClusteringUsersStep2().get_cluster_group(user_all, 4)
-	tag_year_gp11 = ClusteringUsersStep2().get_cluster_group(user_all, 11)
-	tag_year_gp12 = ClusteringUsersStep2().get_cluster_group(user_all, 12)
-	tag_year_gp14 = ClusteringUsersStep2().get_cluster_group(user_all, 14)
+	# clusters of Step 1 and groups to keep or split, chosen by k_selection.py
+	selection = load_k_selection('k_selection.json')
 
-	clustered_gp4 = ClusteringUsersStep2().compute_clusters(tag_year_gp4, 12)
-	clustered_gp11 = ClusteringUsersStep2().compute_clusters(tag_year_gp11, 2)
-	clustered_gp12 = ClusteringUsersStep2().compute_clusters(tag_year_gp12, 7)
-	clustered_gp14 = ClusteringUsersStep2().compute_clusters(tag_year_gp14, 12)
+	# typed artifacts of the previous stages, with the same Step 1 clusters as the ones
+	# the groups were chosen on
+	store = ArtifactStore()
+	user_clusters, user_all = read_user_books(store)
+	if labels_hash(user_clusters) != selection['step1_hash']:
+		raise ValueError('Clusters of Step 1 differ from the ones of k_selection.json, run k_selection.py again')
 
+	# groups from Step 1 which are too large, split into group_k subclusters in parallel
+	# vocabulary of the features fitted on the new data, and shared with user_similarity
+	features = load_year_tag_features(user_all, 'year_tag_features.npz')
+	clustered_groups = ClusteringUsersStep2().cluster_groups(user_all, selection['step2'], n_jobs=os.cpu_count(),
+		random_state=selection['random_state'], features=features)
 
-	clust1, clust2, clust3, clust4 = GetAllClusters().remap_clusters_step1(user_clusters)
-	final = GetAllClusters().get_merged_clusters(clust1, clust2, clust3, clust4, clustered_gp4, clustered_gp11,
-		clustered_gp12, clustered_gp14)
+	kept = GetAllClusters().remap_clusters_step1(user_clusters, selection['keep'])
+	final = GetAllClusters().merge_all_clusters(kept, list(clustered_groups.values()), start=len(kept) + 1)
 
-	final.to_csv('users-clustered-final.csv', index=False)
+	store.write('clusters_final', final)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,164 @@
+""" Favorite book of each user: one book rated 4 or more per user, picked at random
+(seeded) or ranked by a popularity/rating score of the books, in one vectorized pass
+
+:Author: Yassmine Chebaro <yassmnine.chebaro@mssm.edu>
+:Date: 2019-10-12
+:License: MIT
+"""
+
+import numpy as np
+import pandas as pd
+from artifacts import ArtifactStore
+
+
+def _sort_users(users, candidates=None):
+	""" Stable sort of the rows by user, the rows of each user are then contiguous
+
+	Args:
+		users (:obj:`array`): user of each row
+		candidates (:obj:`array`): boolean mask of the rows to keep, all if None
+
+	Returns:
+		:obj:`order`: positions of the rows sorted by user
+		:obj:`starts`: positions in order of the first row of each user
+		:obj:`counts`: number of rows of each user
+	"""
+	order = np.argsort(users, kind='stable')
+	if candidates is not None:
+		order = order[candidates[order]]
+	sorted_users = users[order]
+	first = np.ones(len(order), dtype=bool)
+	first[1:] = sorted_users[1:] != sorted_users[:-1]
+	starts = np.flatnonzero(first)
+
+	return order, starts, np.diff(np.append(starts, len(order)))
+
+
+def _random_per_user(users, rng, candidates=None):
+	""" One random row of each user, all rows of a user being equally likely
+
+	Args:
+		users (:obj:`array`): user of each row
+		rng (:obj:`RandomState`): random number generator
+		candidates (:obj:`array`): boolean mask of the rows which can be picked, all if None
+
+	Returns:
+		:obj:`array`: positions of the picked rows, in increasing user order
+	"""
+	order, starts, counts = _sort_users(users, candidates)
+	offsets = np.minimum((rng.random_sample(len(starts)) * counts).astype(np.int64), counts - 1)
+
+	return order[starts + offsets]
+
+
+def _liked_books(dfin, min_rating, user_col, book_col):
+	liked = dfin[dfin['rating'].to_numpy() >= min_rating]
+	return liked[user_col].to_numpy(), liked[book_col].to_numpy()
+
+
+def random_favorite_books(dfin, min_rating=4, random_state=None, user_col='user_id', book_col='book_id_gr'):
+	""" One random liked book per user, as the former get_random_good_book but reproducible:
+	a random position among the liked books of each user, after one sort of the users
+
+	Args:
+		dfin (:obj:`DataFrame`): pandas DataFrame of user books ratings
+		min_rating (:obj:`int`): minimum rating of a liked book
+		random_state (:obj:`int`): seed of the random keys
+		user_col (:obj:`str`): column of the users
+		book_col (:obj:`str`): column of the books
+
+	Returns:
+		:obj:`df`: pandas DataFrame of user_id and book_id, one row per user with a liked book
+	"""
+	users, books = _liked_books(dfin, min_rating, user_col, book_col)
+	picked = _random_per_user(users, np.random.RandomState(random_state))
+
+	return pd.DataFrame({'user_id': users[picked], 'book_id': books[picked]})
+
+
+def book_scores(books, prior_count=None):
+	""" Popularity/rating score of the books: average rating shrunk towards the mean
+	rating of all books, weighted by the number of ratings (bayesian average)
+
+	Args:
+		books (:obj:`DataFrame`): pandas DataFrame of books with book_id, average_rating and ratings_count
+		prior_count (:obj:`float`): weight of the mean rating, median number of ratings if None
+
+	Returns:
+		:obj:`scores`: pandas Series of scores indexed by book_id
+	"""
+	books = books.drop_duplicates('book_id')
+	average = books['average_rating'].astype(np.float64).fillna(0).to_numpy()
+	count = books['ratings_count'].astype(np.float64).fillna(0).to_numpy()
+	mean = np.average(average, weights=count) if count.sum() > 0 else average.mean()
+	if prior_count is None:
+		prior_count = np.median(count)
+
+	scores = (prior_count * mean + count * average) / np.maximum(prior_count + count, 1e-9)
+
+	return pd.Series(scores, index=books['book_id'].to_numpy(), name='score')
+
+
+def popular_favorite_books(dfin, scores, min_rating=4, random_state=None, user_col='user_id', book_col='book_id_gr'):
+	""" Liked book with the best score per user, ties (and books without a score)
+	broken at random
+
+	Args:
+		dfin (:obj:`DataFrame`): pandas DataFrame of user books ratings
+		scores (:obj:`Series`): pandas Series of book scores indexed by book id, see :obj:`book_scores`
+		min_rating (:obj:`int`): minimum rating of a liked book
+		random_state (:obj:`int`): seed of the random tie breaks
+		user_col (:obj:`str`): column of the users
+		book_col (:obj:`str`): column of the books
+
+	Returns:
+		:obj:`df`: pandas DataFrame of user_id and book_id, one row per user with a liked book
+	"""
+	users, books = _liked_books(dfin, min_rating, user_col, book_col)
+	book_score = scores.reindex(books).fillna(-np.inf).to_numpy()
+
+	# best score of each user, then a random book among the liked books with that score
+	order, starts, counts = _sort_users(users)
+	best = np.empty(len(users))
+	if len(users):
+		best[order] = np.repeat(np.maximum.reduceat(book_score[order], starts), counts)
+	picked = _random_per_user(users, np.random.RandomState(random_state), book_score == best)
+
+	return pd.DataFrame({'user_id': users[picked], 'book_id': books[picked]})
+
+
+def add_titles(user_books, books):
+	""" Title of the favorite books, users whose book is not in books are left out
+
+	Args:
+		user_books (:obj:`DataFrame`): pandas DataFrame of user_id and book_id
+		books (:obj:`DataFrame`): pandas DataFrame of books with book_id and title
+
+	Returns:
+		:obj:`df`: pandas DataFrame of user_id, book_id and title
+	"""
+	titles = books.drop_duplicates('book_id').loc[:, ['book_id', 'title']]
+
+	return pd.merge(user_books, titles, on='book_id')
+
+
+def main(random_state=0, popularity=False):
+	store = ArtifactStore()
+
+	# Read in data of users ratings and books
+	ratings_books = store.read('ratings_books', ['user_id', 'book_id_gr', 'rating'],
+		fallback_csv='ratings_books_u80_b10.csv')
+	books = store.read('books_scifi', ['book_id', 'title', 'average_rating', 'ratings_count'],
+		fallback_csv='books-scifi-authors.csv')
+
+	# One liked book per user, at random or the best scored one
+	if popularity:
+		user_books = popular_favorite_books(ratings_books, book_scores(books), random_state=random_state)
+	else:
+		user_books = random_favorite_books(ratings_books, random_state=random_state)
+
+	store.write('user_book_fav', add_titles(user_books, books))
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,185 @@
+""" Mapping between ids of the pipeline (user and book, csv and goodreads)
+with numpy arrays instead of dicts
+
+:Author: Yassmine Chebaro <yassmnine.chebaro@mssm.edu>
+:Date: 2019-09-26
+:License: MIT
+"""
+
+import os
+import numpy as np
+import pandas as pd
+
+
+_RAISE = object()
+
+
+class IdMap(object):
+	""" Mapping of ids (keys) to other ids (values). Dense non-negative integer keys
+	are looked up directly in an array indexed by key, other keys with a binary search
+	in the sorted keys
+
+	Args:
+		keys (:obj:`array`): keys, the last value is kept for repeated keys
+		values (:obj:`array`): value of each key
+		density (:obj:`float`): minimum ratio of number of keys to largest key + 1 for the direct lookup
+	"""
+
+	def __init__(self, keys, values, density=0.5):
+		keys = np.asarray(keys)
+		values = np.asarray(values)
+		if values.dtype == object:
+			values = values.astype(str)
+		# like a dict, the last value of a repeated key is kept
+		_, last = np.unique(keys[::-1], return_index=True)
+		if len(last) != len(keys):
+			keep = np.sort(len(keys) - 1 - last)
+			keys = keys[keep]
+			values = values[keep]
+
+		self.keys = keys
+		self.values = values
+		self.dense = (keys.dtype.kind in 'iu' and len(keys) > 0 and keys.min() >= 0 and
+			len(keys) >= density * (keys.max() + 1))
+
+		if self.dense:
+			self._lookup = np.zeros(keys.max() + 1, dtype=values.dtype)
+			self._present = np.zeros(keys.max() + 1, dtype=bool)
+			self._lookup[keys] = values
+			self._present[keys] = True
+		else:
+			order = np.argsort(keys, kind='stable')
+			self._sorted_keys = keys[order]
+			self._sorted_values = values[order]
+
+	@classmethod
+	def from_frame(cls, dfin, key, value):
+		""" Build the mapping from two columns of a DataFrame
+
+		Args:
+			dfin (:obj:`DataFrame`): pandas DataFrame with the mapping
+			key (:obj:`str`): name of the column of keys
+			value (:obj:`str`): name of the column of values
+
+		Returns:
+			:obj:`IdMap`: mapping from key to value
+		"""
+		return cls(dfin[key].to_numpy(), dfin[value].to_numpy())
+
+	@classmethod
+	def from_csv(cls, inputcsv, key, value):
+		""" Build the mapping from two columns of a csv file, reading only these columns
+
+		Args:
+			inputcsv (:obj:`str`): name of the csv file
+			key (:obj:`str`): name of the column of keys
+			value (:obj:`str`): name of the column of values
+
+		Returns:
+			:obj:`IdMap`: mapping from key to value
+		"""
+		return cls.from_frame(pd.read_csv(inputcsv, usecols=[key, value]), key, value)
+
+	@classmethod
+	def load(cls, inputnpz):
+		""" Load a mapping saved with :obj:`save`
+
+		Args:
+			inputnpz (:obj:`str`): name of the npz file
+
+		Returns:
+			:obj:`IdMap`: mapping from key to value
+		"""
+		with np.load(inputnpz) as data:
+			return cls(data['keys'], data['values'])
+
+	def save(self, outputnpz):
+		""" Save the mapping in a npz file
+
+		Args:
+			outputnpz (:obj:`str`): name of the npz file
+		"""
+		with open(outputnpz, 'wb') as fout:
+			np.savez(fout, keys=self.keys, values=self.values)
+
+	def __len__(self):
+		return len(self.keys)
+
+	def inverse(self):
+		""" Mapping from value to key, values have to be unique
+
+		Returns:
+			:obj:`IdMap`: mapping from value to key
+		"""
+		return IdMap(self.values, self.keys)
+
+	def contains(self, ids):
+		""" Whether each id is a key of the mapping
+
+		Args:
+			ids (:obj:`array`): ids to look up
+
+		Returns:
+			:obj:`numpy.ndarray`: boolean array
+		"""
+		ids = np.asarray(ids)
+		if self.dense:
+			inside = (ids >= 0) & (ids < len(self._present))
+			found = np.zeros(ids.shape, dtype=bool)
+			found[inside] = self._present[ids[inside]]
+			return found
+
+		if len(self._sorted_keys) == 0:
+			return np.zeros(ids.shape, dtype=bool)
+		pos = np.minimum(np.searchsorted(self._sorted_keys, ids), len(self._sorted_keys) - 1)
+		return self._sorted_keys[pos] == ids
+
+	def map(self, ids, default=_RAISE):
+		""" Values of the ids
+
+		Args:
+			ids (:obj:`array`): ids to look up, array or pandas Series
+			default (:obj:`object`): value of the ids which are not keys, raises KeyError if not given
+
+		Returns:
+			:obj:`numpy.ndarray`: value of each id
+		"""
+		ids = np.asarray(ids)
+		found = self.contains(ids)
+		if not found.all() and default is _RAISE:
+			raise KeyError('Ids not in mapping: {}'.format(ids[~found][:10].tolist()))
+
+		if self.dense:
+			result = self._lookup[np.where(found, ids, 0)]
+		else:
+			pos = np.searchsorted(self._sorted_keys, ids[found])
+			result = np.zeros(ids.shape, dtype=self.values.dtype)
+			result[found] = self._sorted_values[pos]
+
+		if not found.all():
+			result = np.where(found, result, np.array(default, dtype=np.result_type(result, np.asarray(default))))
+
+		return result
+
+
+def load_id_map(inputcsv, key, value, inputnpz):
+	""" Load a mapping from its npz file, building it from the csv file (and saving
+	it for the next stages) when the npz file is missing or older
+
+	Args:
+		inputcsv (:obj:`str`): name of the csv file
+		key (:obj:`str`): name of the column of keys
+		value (:obj:`str`): name of the column of values
+		inputnpz (:obj:`str`): name of the npz file
+
+	Returns:
+		:obj:`IdMap`: mapping from key to value
+	"""
+	if os.path.exists(inputnpz) and (not os.path.exists(inputcsv) or
+		os.path.getmtime(inputnpz) >= os.path.getmtime(inputcsv)):
+		return IdMap.load(inputnpz)
+
+	id_map = IdMap.from_csv(inputcsv, key, value)
+	id_map.save(inputnpz)
+
+	return id_map
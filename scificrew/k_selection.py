@@ -0,0 +1,278 @@
+""" Choosing the number of k clusters of both clustering steps: sweep of a range of k,
+fitted in parallel, with the inertia, the silhouette on a subsample of users and the
+distribution of cluster sizes, fitted models being cached per (data hash, k). The seeded
+clusters of Step 1 are written once with the groups to keep or split, for clustering_users
+
+:Author: Yassmine Chebaro <yassmnine.chebaro@mssm.edu>
+:Date: 2019-10-07
+:License: MIT
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from scipy.sparse import issparse
+from sklearn.metrics import silhouette_score
+from artifacts import ArtifactStore
+from clustering_users import ClusteringUsersStep1, ClusteringUsersStep2, BOOK_YEAR_COLUMNS, select_groups, \
+	labels_hash
+from year_tag_features import YearTagFeatures
+
+
+# features of the worker processes of KSweep.sweep
+_worker_features = None
+
+
+def data_hash(features):
+	""" Hash of the content of a users x features matrix, dense or scipy sparse
+
+	Args:
+		features (:obj:`array`): users x features matrix
+
+	Returns:
+		:obj:`str`: hexadecimal sha1 of the matrix
+	"""
+	sha1 = hashlib.sha1(repr(features.shape).encode())
+	if issparse(features):
+		features = features.tocsr()
+		arrays = [features.indptr, features.indices, features.data]
+	else:
+		arrays = [np.asarray(features)]
+	for array in arrays:
+		sha1.update(np.ascontiguousarray(array).tobytes())
+
+	return sha1.hexdigest()
+
+
+class KSweep(object):
+	""" Evaluation of k-means for a range of k, see :obj:`clustering_users.ClusteringUsersStep1`
+	for the clustering engines
+
+	Args:
+		engine (:obj:`str`): 'kmeans' for full batch k-means, 'minibatch' for mini-batch k-means
+		n_init (:obj:`int`): number of initializations, the best one is kept
+		random_state (:obj:`int`): seed of the initializations and of the silhouette subsample
+		sample_size (:obj:`int`): number of users of the silhouette subsample
+		cache_dir (:obj:`str`): folder of the fitted models and their scores, no cache if None
+		n_jobs (:obj:`int`): number of worker processes, 1 to fit in the current process
+	"""
+
+	def __init__(self, engine='kmeans', n_init=10, random_state=0, sample_size=2000, cache_dir=None, n_jobs=1):
+		self.step1 = ClusteringUsersStep1(engine, n_init=n_init, random_state=random_state)
+		self.sample_size = sample_size
+		self.cache_dir = cache_dir
+		self.n_jobs = n_jobs
+
+	def sweep(self, features, ks):
+		""" Fit and score k-means for each k
+
+		Args:
+			features (:obj:`array`): users x features matrix, dense or scipy sparse
+			ks (:obj:`iterable`): numbers of k clusters to evaluate
+
+		Returns:
+			:obj:`scores`: pandas DataFrame of k, inertia, silhouette, min_size, median_size, max_size
+			and cached (whether the model was loaded from the cache), sorted by k
+		"""
+		ks = sorted(set(int(k) for k in ks if 1 < k < features.shape[0]))
+		key = data_hash(features)
+		if self.cache_dir is not None:
+			os.makedirs(self.cache_dir, exist_ok=True)
+
+		if self.n_jobs == 1 or len(ks) <= 1:
+			results = [self._evaluate(features, key, k) for k in ks]
+		else:
+			with ProcessPoolExecutor(max_workers=self.n_jobs, initializer=_init_sweep_worker,
+				initargs=(features,)) as executor:
+				results = list(executor.map(_sweep_worker, [self] * len(ks), [key] * len(ks), ks))
+
+		columns = ['k', 'inertia', 'silhouette', 'min_size', 'median_size', 'max_size', 'cached']
+
+		return pd.DataFrame(results, columns=columns)
+
+	def _cache_path(self, key, k):
+		step1 = self.step1
+		return os.path.join(self.cache_dir, '{}-{}-n{}-s{}-{}-k{}.pkl'.format(key, step1.engine, step1.n_init,
+			step1.random_state, self.sample_size, k))
+
+	def _evaluate(self, features, key, k):
+		""" Scores of k-means with k clusters, from the cache if available """
+		path = None if self.cache_dir is None else self._cache_path(key, k)
+		if path is not None and os.path.exists(path):
+			with open(path, 'rb') as fin:
+				scores = pickle.load(fin)['scores']
+			return dict(scores, cached=True)
+
+		labels = self.step1.fit_clusters(features, k)
+		model = self.step1.model
+		sizes = np.bincount(labels, minlength=k)
+		scores = {'k': k, 'inertia': -model.score(features), 'silhouette': self.silhouette(features, labels),
+			'min_size': sizes.min(), 'median_size': np.median(sizes), 'max_size': sizes.max()}
+
+		if path is not None:
+			# written then renamed, for the other workers never to read a partial file
+			with open(path + '.tmp{}'.format(os.getpid()), 'wb') as fout:
+				pickle.dump({'model': model, 'scores': scores}, fout)
+			os.replace(path + '.tmp{}'.format(os.getpid()), path)
+
+		return dict(scores, cached=False)
+
+	def silhouette(self, features, labels):
+		""" Silhouette of the clusters on a subsample of users
+
+		Args:
+			features (:obj:`array`): users x features matrix, dense or scipy sparse
+			labels (:obj:`array`): cluster of each user
+
+		Returns:
+			:obj:`float`: mean silhouette of the subsample, nan with less than 2 clusters in it
+		"""
+		rng = np.random.RandomState(self.step1.random_state)
+		sample = np.arange(features.shape[0])
+		if len(sample) > self.sample_size:
+			sample = np.sort(rng.choice(sample, self.sample_size, replace=False))
+		nb_labels = len(np.unique(labels[sample]))
+		if nb_labels < 2 or nb_labels >= len(sample):
+			return np.nan
+
+		return silhouette_score(features[sample], labels[sample])
+
+	def load_model(self, features, k):
+		""" Fitted model of a previous sweep on the same features
+
+		Args:
+			features (:obj:`array`): users x features matrix, dense or scipy sparse
+			k (:obj:`int`): number of k clusters
+
+		Returns:
+			:obj:`model`: fitted k-means model, None if not in the cache
+		"""
+		path = None if self.cache_dir is None else self._cache_path(data_hash(features), k)
+		if path is None or not os.path.exists(path):
+			return None
+		with open(path, 'rb') as fin:
+			return pickle.load(fin)['model']
+
+	def choose_k(self, scores, min_size=10):
+		""" Number of clusters with the best silhouette, among those without clusters smaller
+		than min_size users (among all if there is none)
+
+		Args:
+			scores (:obj:`DataFrame`): pandas DataFrame of :obj:`sweep`
+			min_size (:obj:`int`): minimum number of users of a cluster
+
+		Returns:
+			:obj:`int`: chosen number of k clusters
+		"""
+		candidates = scores[scores['min_size'] >= min_size]
+		if candidates.empty or candidates['silhouette'].isna().all():
+			candidates = scores
+
+		return int(candidates.loc[candidates['silhouette'].fillna(-np.inf).idxmax(), 'k'])
+
+	def sweep_step1(self, df_ratings, ks):
+		""" Sweep of the first step, on the users books ratings matrix
+
+		Args:
+			df_ratings (:obj:`DataFrame`): pandas DataFrame of user books ratings
+			ks (:obj:`iterable`): numbers of k clusters to evaluate
+
+		Returns:
+			:obj:`scores`: pandas DataFrame of :obj:`sweep`
+		"""
+		sparse_ratings, _, _ = self.step1.get_ratings_matrix(df_ratings)
+
+		return self.sweep(sparse_ratings, ks)
+
+	def sweep_step2(self, user_all, groups, ks, features=None):
+		""" Sweep of the second step for each cluster group from Step 1, on the users
+		publication year and tag matrix of the group
+
+		Args:
+			user_all (:obj:`DataFrame`): pandas DataFrame with user group, publication year and popular shelve
+			groups (:obj:`iterable`): cluster groups from Step 1 to sweep
+			ks (:obj:`iterable`): numbers of k clusters to evaluate
+			features (:obj:`YearTagFeatures`): vocabulary of publication years and tags shared by the groups,
+			fitted on user_all if None
+
+		Returns:
+			:obj:`group_scores`: dict of cluster group and pandas DataFrame of :obj:`sweep`
+		"""
+		user_all = user_all.loc[:, ['user_idx', 'group', 'pub_year', 'popular_shelves']]
+		if features is None:
+			features = YearTagFeatures.fit(user_all)
+
+		step2 = ClusteringUsersStep2()
+		group_users = dict(iter(user_all.groupby('group')))
+		group_scores = {}
+		for clustid in groups:
+			tag_year, _ = step2.get_group_features(group_users[clustid], features)
+			group_scores[clustid] = self.sweep(tag_year, ks)
+
+		return group_scores
+
+
+def _init_sweep_worker(features):
+	global _worker_features
+	_worker_features = features
+
+
+def _sweep_worker(sweep, key, k):
+	return sweep._evaluate(_worker_features, key, k)
+
+
+def save_k_selection(outputjson, step1_k, step2_k, keep, random_state, step1_hash):
+	""" Save the chosen clusters, read by :obj:`clustering_users.load_k_selection`
+
+	Args:
+		outputjson (:obj:`str`): name of the json file
+		step1_k (:obj:`int`): number of k clusters of Step 1
+		step2_k (:obj:`dict`): number of k clusters of each cluster group split in Step 2
+		keep (:obj:`list`): cluster groups kept from Step 1
+		random_state (:obj:`int`): seed of Step 1 and Step 2
+		step1_hash (:obj:`str`): :obj:`clustering_users.labels_hash` of the clusters of Step 1
+	"""
+	selection = {'step1': int(step1_k), 'random_state': None if random_state is None else int(random_state),
+		'step1_hash': step1_hash, 'keep': [int(group) for group in keep],
+		'step2': {str(group): int(k) for group, k in step2_k.items()}}
+	with open(outputjson, 'w') as fout:
+		json.dump(selection, fout, indent=1)
+
+
+def main():
+
+	store = ArtifactStore()
+	book_year = store.read('book_year_1tag', BOOK_YEAR_COLUMNS, fallback_csv='book_year_1tag-5-10.csv')
+	ratings_books = store.read('ratings_books', ['user_idx', 'book_idx', 'book_id_gr', 'rating'],
+		fallback_csv='ratings_books_u80_b10.csv')
+	sweep = KSweep(cache_dir='kmeans_cache', n_jobs=os.cpu_count())
+	random_state = sweep.step1.random_state
+
+	scores1 = sweep.sweep_step1(ratings_books, range(10, 41, 5))
+	print(scores1.to_string(index=False))
+	step1_k = sweep.choose_k(scores1)
+
+	# seeded clusters of Step 1, written once: clustering_users splits the groups of these clusters
+	user_clusters = ClusteringUsersStep1(n_init=sweep.step1.n_init, random_state=random_state).clustering_users_ratings(
+		ratings_books, step1_k)
+	store.write('user_clusters', user_clusters)
+
+	# groups kept or split from their sizes
+	keep, split = select_groups(user_clusters)
+	user_all = ClusteringUsersStep2().get_publication_year(user_clusters, book_year, ratings_books)
+	group_scores = sweep.sweep_step2(user_all, split, range(2, 16))
+	step2_k = {}
+	for clustid, scores in group_scores.items():
+		print('group {}'.format(clustid))
+		print(scores.to_string(index=False))
+		step2_k[clustid] = sweep.choose_k(scores)
+
+	save_k_selection('k_selection.json', step1_k, step2_k, keep, random_state, labels_hash(user_clusters))
+
+
+if __name__ == '__main__':
+	main()
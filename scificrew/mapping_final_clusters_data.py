@@ -8,48 +8,78 @@
 # Import Libraries
 import pandas as pd
 import numpy as np
+import os
 import random
+import sqlite3
 from collections import Counter
-
+from id_mapping import load_id_map
+from artifacts import ArtifactStore, cast_to_schema
+
+
+# indexes of the users table queried by the web application (webapp users_db.py)
+USERS_INDEXES = {
+	'idx_users_user_id_csv': 'user_id_csv',
+	'idx_users_user_idx': 'user_idx',
+	'idx_users_group_y': 'group_y',
+}
+
+
+def write_users_db(users, outputdb):
+	""" Write the users table of the web application and its indexes, so that the web
+	application only opens the database read-only
+
+	Args:
+		users (:obj:`DataFrame`): pandas DataFrame with the columns of the clusters artifact
+		outputdb (:obj:`str`): name of the sqlite database file, replaced if it exists
+	"""
+	# written then renamed, for the web application never to see a partial database
+	tmp_path = '{}.tmp{}'.format(outputdb, os.getpid())
+	if os.path.exists(tmp_path):
+		os.remove(tmp_path)
+	conn = sqlite3.connect(tmp_path)
+	try:
+		with conn:
+			cast_to_schema(users, 'clusters').to_sql('users', conn, index=False)
+			for name, column in USERS_INDEXES.items():
+				conn.execute('create index {} on users ({})'.format(name, column))
+	finally:
+		conn.close()
+	os.replace(tmp_path, outputdb)
 
 
 def main():
+	store = ArtifactStore()
+
 	# clusters group user id
-	clusters_users = pd.read_csv('clusters_final.csv')
+	clusters_users = store.read('clusters_final', fallback_csv='clusters_final.csv')
 
 	# clusters group user id
-	clusters_users_names = pd.read_csv('clusters_group_names.csv')
+	clusters_users_names = store.read('clusters_group_names', fallback_csv='clusters_group_names.csv')
 
 	# user average sentiment
-	users_sentiment = pd.read_csv('users_ave_sentiment.csv')
+	users_sentiment = store.read('users_ave_sentiment', fallback_csv='users_ave_sentiment.csv')
 
 	# user favorite book
-	users_favbook = pd.read_csv('user_book_fav.csv')
+	users_favbook = store.read('user_book_fav', fallback_csv='user_book_fav.csv')
 
 	# map user idx with user id to extract from this df
-	ratings_books = pd.read_csv('ratings_books_u80_b10.csv')
+	ratings_books = store.read('ratings_books', ['user_id', 'user_idx'], fallback_csv='ratings_books_u80_b10.csv')
 
 	# map user id with user goodreads id
-	user_id_map = pd.read_csv('user_id_map.csv')
+	user_id_map = load_id_map('user_id_map.csv', 'user_id_csv', 'user_id', 'user_id_map.npz')
 
 	# Mapping user idx for clustering to user id from csv
-	user_idx_id = ratings_books.drop(ratings_books.columns[[1, 2, 3, 4, 5, 6, 8]], axis=1)
-	user_id_list = list(set(user_idx_id['user_id']))
-	user_idx_list = list(set(user_idx_id['user_idx']))
-	user_idx_id = user_idx_id.drop_duplicates()
+	user_idx_id = ratings_books.drop_duplicates()
 	user_idx_id.columns = ['user_id_csv', 'user_idx']
 
 	# map user id with user id gr
-	user_dict = user_id_map.set_index('user_id_csv').T.to_dict('list')
-	user_idx_id['user_id_gr'] = user_idx_id['user_id_csv'].map(user_dict)
-	user_idx_id['user_id_gr'] = user_idx_id['user_id_gr'].str.get(0)
+	user_idx_id['user_id_gr'] = user_id_map.map(user_idx_id['user_id_csv'])
 
 	# map user sentiment with user id gr
-	user_dict = user_id_map.set_index('user_id').T.to_dict('list')
 	users_sentiment.columns = ['user_id_gr', 'Average sentiment']
 
 	# merging DataFrames of user idx and sentiment
-	test = pd.merge(user_idx_id, users_sentiment, on='user_id_gr')
+	test = pd.merge(user_idx_id, users_sentiment.astype({'user_id_gr': object}), on='user_id_gr')
 
 	# merging with clustering DataFrame
 	test2 = pd.merge(test, clusters_users, on='user_idx')
@@ -60,7 +90,10 @@ def main():
 
 	# merging with users names
 	final = pd.merge(test3, clusters_users_names, on='user_idx')
-	final.to_csv('clusters.csv', index=False)
+	store.write('clusters', final)
+
+	# users table of the web application, to copy to webapp/application_folder/static/data
+	write_users_db(final, 'db.sqlite')
 
 
 if __name__ == '__main__':
@@ -0,0 +1,374 @@
+""" Runner of the stages of the pipeline: the stages form a graph through their
+input and output files, a stage is run only when the fingerprint of its inputs, code
+and parameters changed since its last run (or its outputs are missing), and
+independent stages run concurrently
+
+Run from the data folder, ex:
+	python pipeline.py --jobs 2
+	python pipeline.py clustering --dry-run
+
+:Author: Yassmine Chebaro <yassmnine.chebaro@mssm.edu>
+:Date: 2019-10-11
+:License: MIT
+"""
+
+import argparse
+import ast
+import hashlib
+import importlib
+import importlib.util
+import inspect
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+
+class Stage(object):
+	""" Stage of the pipeline
+
+	Args:
+		name (:obj:`str`): name of the stage
+		func (:obj:`str` or :obj:`function`): 'module:function' run for the stage (imported in
+		the worker process), or a module level function
+		inputs (:obj:`list`): files read by the stage, missing files are part of the fingerprint
+		outputs (:obj:`list`): files written by the stage
+		params (:obj:`dict`): keyword arguments of func, part of the fingerprint
+		code (:obj:`list`): other source files the stage depends on, part of the fingerprint
+		(in addition to its module and the modules it imports from the same folder)
+	"""
+
+	def __init__(self, name, func, inputs=(), outputs=(), params=None, code=()):
+		self.name = name
+		self.func = func
+		self.inputs = list(inputs)
+		self.outputs = list(outputs)
+		self.params = dict(params or {})
+		self.code = list(code)
+
+	def resolve(self):
+		""" Function of the stage """
+		if callable(self.func):
+			return self.func
+		module, function = self.func.split(':')
+		return getattr(importlib.import_module(module), function)
+
+	def code_file(self):
+		""" Source file of the function of the stage """
+		if callable(self.func):
+			return inspect.getsourcefile(self.func)
+		spec = importlib.util.find_spec(self.func.split(':')[0])
+		return None if spec is None else spec.origin
+
+	def code_files(self):
+		""" Source files of the stage, part of the fingerprint: the module of its function,
+		the modules it imports (directly or not) from the same folder, and the code files
+
+		Returns:
+			:obj:`list`: sorted absolute file names
+		"""
+		code_file = self.code_file()
+		files = set(os.path.abspath(path) for path in self.code)
+		if code_file is None:
+			return sorted(files)
+
+		folder = os.path.dirname(os.path.abspath(code_file))
+		todo = [os.path.abspath(code_file)]
+		while todo:
+			path = todo.pop()
+			if path in files:
+				continue
+			files.add(path)
+			todo.extend(_local_imports(path, folder))
+
+		return sorted(files)
+
+
+def _local_imports(path, folder):
+	""" Files of the modules of folder imported by a python file """
+	with open(path) as fin:
+		tree = ast.parse(fin.read(), path)
+
+	names = set()
+	for node in ast.walk(tree):
+		if isinstance(node, ast.Import):
+			names.update(alias.name.split('.')[0] for alias in node.names)
+		elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+			names.add(node.module.split('.')[0])
+
+	return [os.path.join(folder, name + '.py') for name in sorted(names)
+		if os.path.exists(os.path.join(folder, name + '.py'))]
+
+
+# stages of the pipeline, in the order they were run by hand, with the files of their main()
+PIPELINE_STAGES = [
+	Stage('clean_books', 'cleaning_books:main',
+		inputs=['goodreads_books.json.gz'],
+		outputs=['books_en_nochild.json.gz', 'books_scifi.json', 'books_scifi_shelves.npz',
+			'books_scifi.parquet', 'book_year_1tag.parquet']),
+	Stage('ratings', 'users_books_ratings:main',
+		inputs=['book_id_map.csv', 'goodreads_interactions.csv', 'books_scifi.parquet'],
+		outputs=['ratings_books.parquet']),
+	Stage('k_selection', 'k_selection:main',
+		inputs=['book_year_1tag.parquet', 'ratings_books.parquet'],
+		outputs=['k_selection.json', 'user_clusters.parquet']),
+	Stage('clustering', 'clustering_users:main',
+		inputs=['book_year_1tag.parquet', 'ratings_books.parquet', 'k_selection.json', 'user_clusters.parquet'],
+		outputs=['clusters_final.parquet', 'year_tag_features.npz']),
+	Stage('sentiment', 'reviews_sent_analysis:main',
+		inputs=['ratings_books.parquet', 'books_scifi.parquet', 'user_id_map.csv', 'goodreads_reviews_dedup.json.gz'],
+		outputs=['users_ave_sentiment.parquet']),
+	Stage('favorite_books', 'favorite_books:main',
+		inputs=['ratings_books.parquet', 'books_scifi.parquet'],
+		outputs=['user_book_fav.parquet'], params={'random_state': 0}),
+	Stage('cluster_names', 'cluster_names:main',
+		inputs=['clusters_final.parquet', 'names_64.csv'],
+		outputs=['clusters_group_names.parquet'], params={'random_state': 0}),
+	Stage('final_mapping', 'mapping_final_clusters_data:main',
+		inputs=['clusters_final.parquet', 'clusters_group_names.parquet', 'users_ave_sentiment.parquet',
+			'user_book_fav.parquet', 'ratings_books.parquet', 'user_id_map.csv'],
+		outputs=['clusters.parquet', 'db.sqlite']),
+	Stage('similarity', 'user_similarity:main',
+		inputs=['book_year_1tag.parquet', 'ratings_books.parquet', 'user_clusters.parquet', 'clusters_final.parquet',
+			'year_tag_features.npz'],
+		outputs=['user_user_similarity.csv']),
+]
+
+
+def _run_stage(stage, workdir):
+	""" Run the function of a stage in the data folder, in the current or a worker process """
+	func = stage.resolve()
+	cwd = os.getcwd()
+	os.chdir(workdir)
+	try:
+		func(**stage.params)
+	finally:
+		os.chdir(cwd)
+
+
+class Pipeline(object):
+	""" Graph of stages, a stage depends on the stages writing its inputs
+
+	Args:
+		stages (:obj:`list`): stages of the pipeline
+		workdir (:obj:`str`): data folder, file names of the stages are relative to it
+		state_file (:obj:`str`): json file of the fingerprints of the last runs, in workdir
+	"""
+
+	def __init__(self, stages=None, workdir='.', state_file='.pipeline_state.json'):
+		self.stages = {stage.name: stage for stage in (PIPELINE_STAGES if stages is None else stages)}
+		self.workdir = workdir
+		self.state_file = os.path.join(workdir, state_file)
+
+		producers = {}
+		for stage in self.stages.values():
+			for output in stage.outputs:
+				if output in producers:
+					raise ValueError('Output {} written by {} and {}'.format(output, producers[output], stage.name))
+				producers[output] = stage.name
+		self.dependencies = {name: {producers[path] for path in stage.inputs if path in producers} - {name}
+			for name, stage in self.stages.items()}
+		self.order = self._topological_order()
+
+	def _topological_order(self):
+		order = []
+		remaining = dict(self.dependencies)
+		while remaining:
+			ready = [name for name, deps in remaining.items() if not deps & set(remaining)]
+			if not ready:
+				raise ValueError('Cycle between stages: {}'.format(sorted(remaining)))
+			for name in ready:
+				order.append(name)
+				del remaining[name]
+
+		return order
+
+	def upstream(self, targets):
+		""" Stages needed for the targets, in order
+
+		Args:
+			targets (:obj:`list`): names of the stages, all if None
+
+		Returns:
+			:obj:`list`: names of the stages and of the stages they depend on
+		"""
+		if targets is None:
+			return list(self.order)
+		unknown = [name for name in targets if name not in self.stages]
+		if unknown:
+			raise ValueError('Unknown stages: {}'.format(unknown))
+
+		needed = set()
+		todo = list(targets)
+		while todo:
+			name = todo.pop()
+			if name not in needed:
+				needed.add(name)
+				todo.extend(self.dependencies[name])
+
+		return [name for name in self.order if name in needed]
+
+	def _load_state(self):
+		if not os.path.exists(self.state_file):
+			return {'stages': {}, 'files': {}}
+		with open(self.state_file) as fin:
+			return json.load(fin)
+
+	def _save_state(self, state):
+		tmp_file = '{}.tmp{}'.format(self.state_file, os.getpid())
+		with open(tmp_file, 'w') as fout:
+			json.dump(state, fout, indent=1, sort_keys=True)
+		os.replace(tmp_file, self.state_file)
+
+	def file_hash(self, path, state):
+		""" sha1 of the content of a file, reused while its size and modification time
+		are unchanged; None for a missing file
+
+		Args:
+			path (:obj:`str`): file name, relative to workdir
+			state (:obj:`dict`): state of the pipeline, with the hashes of the files
+
+		Returns:
+			:obj:`str`: hexadecimal sha1 of the file
+		"""
+		full_path = path if os.path.isabs(path) else os.path.join(self.workdir, path)
+		if not os.path.exists(full_path):
+			return None
+		stat = os.stat(full_path)
+		known = state['files'].get(full_path)
+		if known is not None and known['size'] == stat.st_size and known['mtime'] == stat.st_mtime_ns:
+			return known['sha1']
+
+		sha1 = hashlib.sha1()
+		with open(full_path, 'rb') as fin:
+			for block in iter(lambda: fin.read(1 << 20), b''):
+				sha1.update(block)
+		state['files'][full_path] = {'size': stat.st_size, 'mtime': stat.st_mtime_ns, 'sha1': sha1.hexdigest()}
+
+		return sha1.hexdigest()
+
+	def fingerprint(self, stage, state):
+		""" Fingerprint of the inputs, code and parameters of a stage
+
+		Args:
+			stage (:obj:`Stage`): stage of the pipeline
+			state (:obj:`dict`): state of the pipeline, with the hashes of the files
+
+		Returns:
+			:obj:`str`: hexadecimal sha1
+		"""
+		content = {'func': stage.func if isinstance(stage.func, str) else stage.func.__qualname__,
+			'params': stage.params,
+			'code': {os.path.basename(path): self.file_hash(path, state) for path in stage.code_files()},
+			'inputs': {path: self.file_hash(path, state) for path in stage.inputs}}
+
+		return hashlib.sha1(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+
+	def is_up_to_date(self, stage, state):
+		""" Whether the outputs of the last run of a stage are still valid: same fingerprint,
+		and outputs unchanged since """
+		last = state['stages'].get(stage.name)
+		if last is None or last['fingerprint'] != self.fingerprint(stage, state):
+			return False
+
+		return all(last['outputs'].get(path) is not None and self.file_hash(path, state) == last['outputs'][path]
+			for path in stage.outputs)
+
+	def plan(self, targets=None, force=False):
+		""" Stages to run for the targets, from the fingerprints of the current files
+		(downstream stages of a stage to run are run too)
+
+		Returns:
+			:obj:`plan`: dict of stage name and 'run' or 'skip', in order
+		"""
+		state = self._load_state()
+		plan = {}
+		for name in self.upstream(targets):
+			stale = force or any(plan.get(dep) == 'run' for dep in self.dependencies[name])
+			plan[name] = 'run' if stale or not self.is_up_to_date(self.stages[name], state) else 'skip'
+
+		return plan
+
+	def run(self, targets=None, force=False, n_jobs=1):
+		""" Run the stages which are not up to date, independent stages concurrently in
+		n_jobs worker processes. Fingerprints are checked once the stages a stage depends on are done
+
+		Args:
+			targets (:obj:`list`): names of the stages to bring up to date, all if None
+			force (:obj:`bool`): run the stages even if they are up to date
+			n_jobs (:obj:`int`): number of worker processes, 1 to run in the current process
+
+		Returns:
+			:obj:`status`: dict of stage name and 'run' or 'skip', in the order the stages finished
+		"""
+		names = self.upstream(targets)
+		state = self._load_state()
+		status = {}
+		running = {}
+
+		def running_names():
+			return {name for name, _ in running.values()}
+
+		def start_ready(executor):
+			for name in names:
+				if name in status or name in running_names() or not self.dependencies[name] <= set(status):
+					continue
+				stage = self.stages[name]
+				if not force and self.is_up_to_date(stage, state):
+					status[name] = 'skip'
+					return True
+				fingerprint = self.fingerprint(stage, state)
+				if executor is None:
+					_run_stage(stage, self.workdir)
+					self._finish(stage, fingerprint, state, status)
+					return True
+				running[executor.submit(_run_stage, stage, self.workdir)] = (name, fingerprint)
+			return False
+
+		if n_jobs == 1:
+			while start_ready(None):
+				pass
+			return status
+
+		with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+			while True:
+				while start_ready(executor):
+					pass
+				if not running:
+					break
+				done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+				for future in done:
+					name, fingerprint = running.pop(future)
+					future.result()
+					self._finish(self.stages[name], fingerprint, state, status)
+
+		return status
+
+	def _finish(self, stage, fingerprint, state, status):
+		""" Record the fingerprint and the outputs of a successful run """
+		state['stages'][stage.name] = {'fingerprint': fingerprint,
+			'outputs': {path: self.file_hash(path, state) for path in stage.outputs}}
+		self._save_state(state)
+		status[stage.name] = 'run'
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument('stages', nargs='*', help='stages to bring up to date (all if none)')
+	parser.add_argument('--jobs', type=int, default=1, help='number of stages run concurrently')
+	parser.add_argument('--force', action='store_true', help='run the stages even if they are up to date')
+	parser.add_argument('--dry-run', action='store_true', help='only print the stages to run')
+	args = parser.parse_args()
+
+	pipeline = Pipeline()
+	targets = args.stages or None
+	if args.dry_run:
+		for name, action in pipeline.plan(targets, args.force).items():
+			print('{:15s} {}'.format(name, action))
+		return
+
+	for name, action in pipeline.run(targets, args.force, args.jobs).items():
+		print('{:15s} {}'.format(name, action))
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,124 @@
+""" Streaming reader of the reviews of a set of users from the GoodReads json dump:
+the user id is matched on the raw line against a hash set, and only the lines
+of wanted users are decoded, optionally over several processes
+
+:Author: Yassmine Chebaro <yassmnine.chebaro@mssm.edu>
+:Date: 2019-10-09
+:License: MIT
+"""
+
+import json
+import re
+import pandas as pd
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from books_filter import open_json, _batches
+
+
+REVIEW_FIELDS = ('book_id', 'user_id', 'rating', 'review_text')
+
+# first "user_id" key of a raw json line, quotes inside json strings are escaped
+_USER_ID = re.compile(rb'"user_id":\s*"([^"]*)"')
+
+# users of the worker processes of iter_review_batches
+_worker_users = None
+
+
+def filter_review_lines(lines, users, fields=REVIEW_FIELDS):
+	""" Decode the json lines of reviews of the wanted users
+
+	Args:
+		lines (:obj:`list`): list of json lines (bytes)
+		users (:obj:`set`): set of goodreads user ids (str)
+		fields (:obj:`tuple`): keys of the reviews to keep
+
+	Returns:
+		:obj:`columns`: dict of field and list of values of the selected reviews
+	"""
+	columns = {field: [] for field in fields}
+	for line in lines:
+		match = _USER_ID.search(line)
+		if match is None or match.group(1).decode('utf-8') not in users:
+			continue
+		review = json.loads(line)
+		if review['user_id'] not in users:
+			continue
+		for field in fields:
+			columns[field].append(review[field])
+
+	return columns
+
+
+def _init_reviews_worker(users):
+	global _worker_users
+	_worker_users = users
+
+
+def _filter_review_worker(lines, fields):
+	return filter_review_lines(lines, _worker_users, fields)
+
+
+def iter_review_batches(inputdata, users, fields=REVIEW_FIELDS, n_jobs=1, batch_size=10000):
+	""" Reviews of the wanted users in columnar batches, in the order of the input file.
+	Batches of lines are filtered in n_jobs worker processes, which receive the set of users once
+
+	Args:
+		inputdata (:obj:`str`): name of input json file, gzip'd or not
+		users (:obj:`iterable`): goodreads user ids
+		fields (:obj:`tuple`): keys of the reviews to keep
+		n_jobs (:obj:`int`): number of worker processes, 1 to filter in the current process
+		batch_size (:obj:`int`): number of lines per batch
+
+	Yields:
+		:obj:`DataFrame`: pandas DataFrame of the fields of the selected reviews of a batch of lines,
+		batches without selected review are skipped
+	"""
+	users = set(users)
+	fields = tuple(fields)
+	with open_json(inputdata) as json_file:
+		batches = _batches(json_file, batch_size)
+		if n_jobs == 1:
+			results = (filter_review_lines(batch, users, fields) for batch in batches)
+			for columns in results:
+				if columns[fields[0]]:
+					yield pd.DataFrame(columns, columns=list(fields))
+			return
+
+		with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_reviews_worker,
+			initargs=(users,)) as executor:
+			# keep a bounded number of batches in flight, collected in input order
+			pending = deque()
+			for batch in batches:
+				pending.append(executor.submit(_filter_review_worker, batch, fields))
+				if len(pending) >= 2 * n_jobs:
+					columns = pending.popleft().result()
+					if columns[fields[0]]:
+						yield pd.DataFrame(columns, columns=list(fields))
+			while pending:
+				columns = pending.popleft().result()
+				if columns[fields[0]]:
+					yield pd.DataFrame(columns, columns=list(fields))
+
+
+def iter_reviews(inputdata, users, fields=REVIEW_FIELDS, n_jobs=1, batch_size=10000):
+	""" Reviews of the wanted users one at a time, see :obj:`iter_review_batches`
+
+	Yields:
+		:obj:`dict`: fields of a selected review
+	"""
+	for batch in iter_review_batches(inputdata, users, fields, n_jobs, batch_size):
+		for review in batch.to_dict('records'):
+			yield review
+
+
+def read_reviews(inputdata, users, fields=REVIEW_FIELDS, n_jobs=1, batch_size=10000):
+	""" All the reviews of the wanted users in a DataFrame, see :obj:`iter_review_batches`
+
+	Returns:
+		:obj:`DataFrame`: pandas DataFrame of the fields of the selected reviews
+	"""
+	batches = list(iter_review_batches(inputdata, users, fields, n_jobs, batch_size))
+	if not batches:
+		return pd.DataFrame(columns=list(fields))
+
+	return pd.concat(batches, ignore_index=True)
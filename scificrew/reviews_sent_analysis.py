@@ -11,8 +11,13 @@ import numpy as np
 import gzip
 import json
 import itertools
+import os
 from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
 from collections import Counter, defaultdict
+from id_mapping import load_id_map
+from artifacts import ArtifactStore
+from reviews_reader import iter_reviews, read_reviews
+from sentiment_scoring import SentimentScorer, SentimentCache, score_texts
 
 
 
@@ -21,22 +26,12 @@ def get_reviews_data(inputdata, list_users):
 	
 	Args:
 		inputdata (:obj:`json`): json file of reviews per user
-		list_users (:obj:`list`): list of users from rating matrix
+		list_users (:obj:`iterable`): users from rating matrix, matched with a set,
+		see :obj:`reviews_reader.iter_review_batches`
 	Returns:
-		:obj:`reviews`: dict of reviews
+		:obj:`reviews`: list of dict of reviews
 	"""
-	reviews = []
-	with gzip.open(inputdata) as json_file:
-		for lines in json_file:
-			review = {}
-			line = json.loads(lines)
-			if line['user_id'] in list_users:
-				review['book_id'] = line['book_id']
-				review['user_id'] = line['user_id']
-				review['rating'] = line['rating']
-				review['review_text'] = line['review_text']
-				reviews.append(review)
-	return reviews
+	return list(iter_reviews(inputdata, list_users))
 
 
 def sentiment_scores(dfin, analyser):
@@ -49,12 +44,37 @@ def sentiment_scores(dfin, analyser):
 		:obj:`user_sentiment`: dict of user and sentiment compound score
 	"""	
 	user_sentiment = defaultdict(list)
-	for i in range(dfin.shape[0]):
-		sentiment_dict = analyser.polarity_scores(dfin.iloc[i][4])
-		user_sentiment[dfin.iloc[i][5]].append(sentiment_dict['compound'])
+	scores = score_texts(dfin['review_text'].tolist(), analyser)
+	for user, score in zip(dfin['user_id'].tolist(), scores.tolist()):
+		user_sentiment[user].append(score)
 	
 	return user_sentiment
 
+def user_average_sentiment(dfin, n_jobs=1, batch_size=1000, cache_db=None):
+	""" Calculate nature of average sentiment score per user, scoring batches of reviews
+	in n_jobs worker processes and averaging the scores on the fly,
+	see :obj:`sentiment_scoring.SentimentScorer`
+	
+	Args:
+		dfin (:obj:`DataFrame`): pandas DataFrame of user book review
+		n_jobs (:obj:`int`): number of worker processes
+		batch_size (:obj:`int`): number of reviews per batch
+		cache_db (:obj:`str`): name of the SQLite cache of the review scores, only reviews
+		with a text missing from the cache are scored; no cache if None
+	Returns:
+		:obj:`user_sent`: pandas DataFrame of User and Average sentiment
+		:obj:`stats`: dict of hits and misses of the cache (None without cache)
+	"""	
+	cache = None if cache_db is None else SentimentCache(cache_db)
+	try:
+		scorer = SentimentScorer(n_jobs, batch_size, cache)
+		user_sent = scorer.user_sentiment(dfin['user_id'].to_numpy(), dfin['review_text'].to_numpy()).to_frame()
+	finally:
+		if cache is not None:
+			cache.close()
+
+	return user_sent, None if cache is None else cache.stats()
+
 def get_average_sentiment(inputdict):
 	""" Calculate average sentiment score per user 
 	
@@ -91,56 +111,40 @@ def get_nature_avsent(inputdict):
 
 def main():
 
-	# Read in clustering results from csv to get user ids
-	user_clustid = pd.read_csv('user_clustid_k25.csv')
+	store = ArtifactStore()
 
-	# Ratings books matrix to get book ids
-	ratings_books = pd.read_csv('ratings_books_u80_b10.csv')
+	# Ratings books matrix to get user and book ids
+	ratings_books = store.read('ratings_books', ['user_id', 'book_id_gr'], fallback_csv='ratings_books_u80_b10.csv')
 
 	# Mapping between user is from csv to goodreads id (23 characters alphanumerical code)
-	usermap = pd.read_csv('user_id_map.csv')
+	usermap = load_id_map('user_id_map.csv', 'user_id_csv', 'user_id', 'user_id_map.npz')
 
-	# Sci Fi books dataframe
-	bookssf = pd.read_csv('books-authors.csv')
+	# Sci Fi books
+	bookssf = store.read('books_scifi', ['book_id'])
 
 	# Map user id from csv to goodreads id
-	user_dict = usermap.set_index('user_id_csv').T.to_dict('list')
-	ratings_books['user_id_gr'] = ratings_books['user_id'].map(user_dict)
-	ratings_books['user_id_gr'] = ratings_books['user_id_gr'].str.get(0)
-
-	# Clean up the DataFrame
-	idx_idgr = ratings_books.drop(ratings_books.columns[[1, 2, 3, 5, 6]], axis=1)
-	list_user_gr = list(set(idx_idgr['user_id_gr']))
-
-	# Get reviews per user
-	reviews = get_reviews_data('goodreads_reviews_dedup.json.gz', list_user_gr)
+	ratings_books['user_id_gr'] = usermap.map(ratings_books['user_id'])
+	list_user_gr = list(set(ratings_books['user_id_gr']))
 
-	# Reviews to DataFrame
-	dfreviews = pd.DataFrame(reviews)
+	# Get reviews per user, streamed in batches and filtered in parallel
+	dfreviews = read_reviews('goodreads_reviews_dedup.json.gz', list_user_gr, n_jobs=os.cpu_count())
 
 	# Extract books matching user-book matrix
-	list_book_gr = list(set(idx_idgr['book_id_gr']))
+	list_book_gr = list(set(ratings_books['book_id_gr']))
 	user_book = bookssf[bookssf['book_id'].isin(list_book_gr)]
 
 	# Convert book id to string for further manipulation
-	user_book['book_id'] = user_book['book_id'].astype(str)
+	user_book = user_book.assign(book_id=user_book['book_id'].astype(str))
 
 	# Merge into user/book/reviews DataFrame
-	u_b_r = pd.merge(user_book, dfreviews, on='book_id')
-	ubr_filtered = u_b_r.drop(u_b_r.columns[[3, 4, 5, 6, 7, 8, 10]], axis=1)
+	ubr_filtered = pd.merge(user_book, dfreviews, on='book_id')
 
 	# Sentiment analysis, get average and nature of average
-	analyser = SentimentIntensityAnalyzer()
-	user_sentiment = sentiment_scores(ubr_filtered, analyser)
-
-	user_sentiment_av = get_average_sentiment(user_sentiment)
-
-	user_sent_nature = get_nature_avsent(user_sentiment_av)
-
-	user_sent = pd.DataFrame(zip(list(user_sent_nature.keys()), 
-		list(user_sent_nature.values())), columns=['User', 'Average sentiment'])
+	# (scores of reviews already seen in a previous run are read from the cache)
+	user_sent, stats = user_average_sentiment(ubr_filtered, n_jobs=os.cpu_count(), cache_db='sentiment_cache.sqlite')
+	print('sentiment cache: {hits} hits, {misses} misses ({hit_rate:.1%})'.format(**stats))
 
-	user_sent.to_csv('users_ave_sentiment.csv', index=False)
+	store.write('users_ave_sentiment', user_sent)
 
 if __name__ == '__main__':
 	main()
\ No newline at end of file
@@ -0,0 +1,303 @@
+""" VADER sentiment scoring of reviews, batches of review texts scored in worker
+processes with one analyser each, and running per-user average sentiment. Scores
+can be kept in a SQLite cache keyed by a hash of the review text
+
+:Author: Yassmine Chebaro <yassmnine.chebaro@mssm.edu>
+:Date: 2019-10-08
+:License: MIT
+"""
+
+import hashlib
+import sqlite3
+import numpy as np
+import pandas as pd
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+
+
+# analyser of the worker processes of SentimentScorer
+_worker_analyser = None
+
+
+def score_texts(texts, analyser):
+	""" Compound VADER score of each text
+
+	Args:
+		texts (:obj:`iterable`): review texts
+		analyser (:obj:`SentimentIntensityAnalyzer`): instance of SentimentIntensityAnalyzer
+
+	Returns:
+		:obj:`numpy.ndarray`: compound score of each text
+	"""
+	return np.array([analyser.polarity_scores(text)['compound'] for text in texts], dtype=np.float64)
+
+
+def sentiment_label(scores):
+	""" Nature of sentiment scores: positive from 0.05, negative up to -0.05, neutral in between
+
+	Args:
+		scores (:obj:`array`): sentiment compound scores
+
+	Returns:
+		:obj:`numpy.ndarray`: label of each score
+	"""
+	scores = np.asarray(scores, dtype=np.float64)
+	return np.select([scores >= 0.05, scores <= -0.05], ['positive', 'negative'], 'neutral').astype(object)
+
+
+def _init_sentiment_worker():
+	global _worker_analyser
+	_worker_analyser = SentimentIntensityAnalyzer()
+
+
+def _score_worker(texts):
+	return score_texts(texts, _worker_analyser)
+
+
+def text_key(text):
+	""" Key of a review text in the cache: sha1 of its utf-8 encoding """
+	return hashlib.sha1(str(text).encode('utf-8')).hexdigest()
+
+
+class SentimentCache(object):
+	""" Persistent SQLite cache of compound scores keyed by the hash of the review text,
+	counting the hits and misses of its lookups
+
+	Args:
+		database (:obj:`str`): name of the SQLite database file
+		chunk_size (:obj:`int`): number of keys per SELECT query
+	"""
+
+	def __init__(self, database, chunk_size=500):
+		self.connection = sqlite3.connect(database)
+		self.connection.execute('CREATE TABLE IF NOT EXISTS scores (key TEXT PRIMARY KEY, compound REAL NOT NULL)')
+		self.connection.commit()
+		self.chunk_size = chunk_size
+		self.hits = 0
+		self.misses = 0
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+	def close(self):
+		self.connection.close()
+
+	def __len__(self):
+		return self.connection.execute('SELECT COUNT(*) FROM scores').fetchone()[0]
+
+	def lookup(self, keys):
+		""" Cached scores of keys
+
+		Args:
+			keys (:obj:`list`): keys of review texts
+
+		Returns:
+			:obj:`numpy.ndarray`: cached score of each key, nan if not in the cache
+		"""
+		found = {}
+		unique_keys = list(set(keys))
+		for start in range(0, len(unique_keys), self.chunk_size):
+			chunk = unique_keys[start:start + self.chunk_size]
+			found.update(self.connection.execute('SELECT key, compound FROM scores WHERE key IN ({})'.format(
+				','.join('?' * len(chunk))), chunk))
+
+		scores = np.array([found.get(key, np.nan) for key in keys], dtype=np.float64)
+		nb_hits = int(np.count_nonzero(~np.isnan(scores)))
+		self.hits += nb_hits
+		self.misses += len(keys) - nb_hits
+
+		return scores
+
+	def store(self, keys, scores):
+		""" Add scores to the cache
+
+		Args:
+			keys (:obj:`list`): keys of review texts
+			scores (:obj:`array`): compound score of each key
+		"""
+		self.connection.executemany('INSERT OR REPLACE INTO scores (key, compound) VALUES (?, ?)',
+			zip(keys, np.asarray(scores, dtype=np.float64).tolist()))
+		self.connection.commit()
+
+	def stats(self):
+		""" Hits and misses of the lookups
+
+		Returns:
+			:obj:`stats`: dict of hits, misses and hit_rate
+		"""
+		total = self.hits + self.misses
+		return {'hits': self.hits, 'misses': self.misses, 'hit_rate': self.hits / total if total else 0.}
+
+
+class UserSentiment(object):
+	""" Running sum and count of the sentiment scores of each user, the
+	scores of single reviews are not kept
+	"""
+
+	def __init__(self):
+		self.sums = {}
+		self.counts = {}
+
+	def add(self, users, scores):
+		""" Add the scores of a batch of reviews
+
+		Args:
+			users (:obj:`array`): user of each review
+			scores (:obj:`array`): sentiment compound score of each review
+		"""
+		codes, uniques = pd.factorize(np.asarray(users, dtype=object))
+		sums = np.bincount(codes, weights=scores, minlength=len(uniques))
+		counts = np.bincount(codes, minlength=len(uniques))
+		for user, user_sum, user_count in zip(uniques.tolist(), sums.tolist(), counts.tolist()):
+			self.sums[user] = self.sums.get(user, 0.) + user_sum
+			self.counts[user] = self.counts.get(user, 0) + user_count
+
+	def __len__(self):
+		return len(self.counts)
+
+	def means(self):
+		""" Average sentiment score per user, in the order users were first seen
+
+		Returns:
+			:obj:`outputdict`: dict of user and average sentiment compound score
+		"""
+		return {user: self.sums[user] / count for user, count in self.counts.items()}
+
+	def labels(self):
+		""" Nature of the average sentiment score per user
+
+		Returns:
+			:obj:`outputdict`: dict of user and nature of average sentiment compound score
+		"""
+		means = self.means()
+		return dict(zip(means, sentiment_label(list(means.values())).tolist()))
+
+	def to_frame(self):
+		""" Users and nature of their average sentiment
+
+		Returns:
+			:obj:`user_sent`: pandas DataFrame of User and Average sentiment
+		"""
+		labels = self.labels()
+		return pd.DataFrame({'User': list(labels), 'Average sentiment': list(labels.values())},
+			columns=['User', 'Average sentiment'])
+
+
+class SentimentScorer(object):
+	""" Scoring of review texts in batches, in the current process or in worker processes
+
+	Args:
+		n_jobs (:obj:`int`): number of worker processes, 1 to score in the current process
+		batch_size (:obj:`int`): number of reviews per batch
+		cache (:obj:`SentimentCache`): cache of the scores, only the texts missing from it are scored
+	"""
+
+	def __init__(self, n_jobs=1, batch_size=1000, cache=None):
+		self.n_jobs = n_jobs
+		self.batch_size = batch_size
+		self.cache = cache
+
+	def iter_scores(self, batches):
+		""" Scores of batches of reviews, in the order of the batches
+
+		Args:
+			batches (:obj:`iterable`): (users, texts) batches of reviews
+
+		Yields:
+			:obj:`tuple`: users and numpy array of the compound score of each text of a batch
+		"""
+		if self.n_jobs == 1:
+			analyser = SentimentIntensityAnalyzer()
+			for users, texts in batches:
+				known = self._lookup(texts)
+				yield users, self._complete(known, score_texts(known[2], analyser))
+			return
+
+		with ProcessPoolExecutor(max_workers=self.n_jobs, initializer=_init_sentiment_worker) as executor:
+			# keep a bounded number of batches in flight, collected in input order
+			pending = deque()
+			for users, texts in batches:
+				known = self._lookup(texts)
+				pending.append((users, known, executor.submit(_score_worker, known[2])))
+				if len(pending) >= 2 * self.n_jobs:
+					users, known, future = pending.popleft()
+					yield users, self._complete(known, future.result())
+			while pending:
+				users, known, future = pending.popleft()
+				yield users, self._complete(known, future.result())
+
+	def _lookup(self, texts):
+		""" Cached scores of a batch, and the keys and texts to score """
+		texts = list(texts)
+		if self.cache is None:
+			return None, None, texts
+
+		keys = [text_key(text) for text in texts]
+		scores = self.cache.lookup(keys)
+		missing = np.flatnonzero(np.isnan(scores))
+
+		return scores, [keys[i] for i in missing], [texts[i] for i in missing]
+
+	def _complete(self, known, new_scores):
+		""" Scores of a batch, from the cache and the new scores which are added to the cache """
+		scores, missing_keys, _ = known
+		if scores is None:
+			return new_scores
+
+		scores[np.isnan(scores)] = new_scores
+		if missing_keys:
+			self.cache.store(missing_keys, new_scores)
+
+		return scores
+
+	def batches(self, users, texts):
+		""" Batches of batch_size reviews of parallel users and texts iterables
+
+		Args:
+			users (:obj:`iterable`): user of each review
+			texts (:obj:`iterable`): text of each review
+
+		Yields:
+			:obj:`tuple`: lists of users and texts of a batch
+		"""
+		reviews = zip(users, texts)
+		while True:
+			batch = list(islice(reviews, self.batch_size))
+			if not batch:
+				return
+			yield [user for user, _ in batch], [text for _, text in batch]
+
+	def score(self, texts):
+		""" Compound score of each text
+
+		Args:
+			texts (:obj:`iterable`): review texts
+
+		Returns:
+			:obj:`numpy.ndarray`: compound score of each text
+		"""
+		texts = list(texts)
+		scores = [batch_scores for _, batch_scores in self.iter_scores(self.batches(texts, texts))]
+
+		return np.concatenate(scores) if scores else np.zeros(0)
+
+	def user_sentiment(self, users, texts):
+		""" Average sentiment per user of a stream of reviews
+
+		Args:
+			users (:obj:`iterable`): user of each review, array, pandas Series or generator
+			texts (:obj:`iterable`): text of each review, in the same order
+
+		Returns:
+			:obj:`UserSentiment`: running sum and count of the scores of each user
+		"""
+		user_sentiment = UserSentiment()
+		for batch_users, scores in self.iter_scores(self.batches(users, texts)):
+			user_sentiment.add(batch_users, scores)
+
+		return user_sentiment
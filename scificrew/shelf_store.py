@@ -0,0 +1,296 @@
+""" Columnar storage of the book tags (popular shelves):
+an interned tag vocabulary, flat int32 arrays of tag ids and counts
+and one offset per book, saved in a numpy npz file
+
+:Author: Yassmine Chebaro <yassmnine.chebaro@mssm.edu>
+:Date: 2019-10-04
+:License: MIT
+"""
+
+import json
+import numpy as np
+from tag_cleaning import TagCleaner, TagReplacer, SF_TAG_PATTERNS, parse_shelves
+
+
+class ShelfStore(object):
+	""" Tags of all books, the tags of book i are tag_ids[offsets[i]:offsets[i + 1]]
+
+	Args:
+		vocabulary (:obj:`numpy.ndarray`): tag names, indexed by tag id
+		tag_ids (:obj:`numpy.ndarray`): int32 tag ids of all books, concatenated
+		counts (:obj:`numpy.ndarray`): int32 tag counts of all books, concatenated
+		offsets (:obj:`numpy.ndarray`): int64 start of the tags of each book, of length books + 1
+		book_ids (:obj:`numpy.ndarray`): goodreads book id of each book, optional
+	"""
+
+	def __init__(self, vocabulary, tag_ids, counts, offsets, book_ids=None):
+		self.vocabulary = np.asarray(vocabulary, dtype=str)
+		self.tag_ids = np.asarray(tag_ids, dtype=np.int32)
+		self.counts = np.asarray(counts, dtype=np.int32)
+		self.offsets = np.asarray(offsets, dtype=np.int64)
+		self.book_ids = None if book_ids is None else np.asarray(book_ids, dtype=np.int64)
+
+	@classmethod
+	def from_lists(cls, popular_shelves, count_shelves, book_ids=None):
+		""" Build the store from lists of tags and counts per book
+
+		Args:
+			popular_shelves (:obj:`iterable`): lists of tag names, or their string representation
+			count_shelves (:obj:`iterable`): lists of tag counts, or their string representation
+			book_ids (:obj:`iterable`): goodreads book id of each book, optional
+
+		Returns:
+			:obj:`ShelfStore`: store of the tags
+		"""
+		builder = _ShelfBuilder()
+		for elm, elmc in zip(popular_shelves, count_shelves):
+			builder.add(parse_shelves(elm), parse_shelves(elmc))
+
+		return builder.build(book_ids)
+
+	@classmethod
+	def from_json(cls, inputdata):
+		""" Build the store from the popular shelves of a json file of books
+
+		Args:
+			inputdata (:obj:`str`): name of the input json file
+
+		Returns:
+			:obj:`ShelfStore`: store of the tags, with the book ids
+		"""
+		return read_books_json(inputdata)[1]
+
+	@classmethod
+	def load(cls, inputnpz):
+		""" Load a store saved with :obj:`save`
+
+		Args:
+			inputnpz (:obj:`str`): name of the npz file
+
+		Returns:
+			:obj:`ShelfStore`: store of the tags
+		"""
+		with np.load(inputnpz) as data:
+			book_ids = data['book_ids'] if 'book_ids' in data else None
+			return cls(data['vocabulary'], data['tag_ids'], data['counts'], data['offsets'], book_ids)
+
+	def save(self, outputnpz):
+		""" Save the store in a compressed npz file
+
+		Args:
+			outputnpz (:obj:`str`): name of the npz file
+		"""
+		arrays = dict(vocabulary=self.vocabulary, tag_ids=self.tag_ids, counts=self.counts, offsets=self.offsets)
+		if self.book_ids is not None:
+			arrays['book_ids'] = self.book_ids
+		with open(outputnpz, 'wb') as fout:
+			np.savez_compressed(fout, **arrays)
+
+	def __len__(self):
+		return len(self.offsets) - 1
+
+	def lengths(self):
+		""" Number of tags of each book """
+		return np.diff(self.offsets)
+
+	def book_index(self):
+		""" Book of each tag of the flat arrays """
+		return np.repeat(np.arange(len(self)), self.lengths())
+
+	def book(self, i):
+		""" Tag names and counts of a book
+
+		Args:
+			i (:obj:`int`): position of the book
+
+		Returns:
+			:obj:`tags`: list of tag names
+			:obj:`counts`: list of int tag counts
+		"""
+		start, end = self.offsets[i], self.offsets[i + 1]
+		return self.vocabulary[self.tag_ids[start:end]].tolist(), self.counts[start:end].tolist()
+
+	def to_lists(self):
+		""" Tag names and counts of all books
+
+		Returns:
+			:obj:`popular_shelves`: list of lists of tag names
+			:obj:`count_shelves`: list of lists of int tag counts
+		"""
+		names = self.vocabulary[self.tag_ids].tolist()
+		counts = self.counts.tolist()
+		bounds = self.offsets.tolist()
+		return ([names[start:end] for start, end in zip(bounds[:-1], bounds[1:])],
+			[counts[start:end] for start, end in zip(bounds[:-1], bounds[1:])])
+
+	def _with(self, vocabulary, tag_ids, counts, offsets):
+		return ShelfStore(vocabulary, tag_ids, counts, offsets, self.book_ids)
+
+	def remove(self, keep):
+		""" Keep only some tags of the flat arrays
+
+		Args:
+			keep (:obj:`numpy.ndarray`): boolean mask over the flat arrays
+
+		Returns:
+			:obj:`ShelfStore`: store of the kept tags
+		"""
+		kept_per_book = np.bincount(self.book_index()[keep], minlength=len(self))
+		offsets = np.concatenate([[0], np.cumsum(kept_per_book)])
+
+		return self._with(self.vocabulary, self.tag_ids[keep], self.counts[keep], offsets)
+
+	def remove_tags(self, cleaner):
+		""" Remove the tags matched by a tag cleaner, each tag name is matched only once
+
+		Args:
+			cleaner (:obj:`TagCleaner`): tag cleaner with the patterns to remove
+
+		Returns:
+			:obj:`ShelfStore`: store of the kept tags
+		"""
+		bad = np.fromiter((cleaner.is_bad(tag) for tag in self.vocabulary), dtype=bool, count=len(self.vocabulary))
+
+		return self.remove(~bad[self.tag_ids])
+
+	def clean_data_bad_tags(self):
+		""" Remove irrelevant tags, see :obj:`tag_cleaning.TagCleaner` """
+		return self.remove_tags(TagCleaner())
+
+	def remove_sf_tags(self):
+		""" Remove science-fiction tags to extract other subgenre tags """
+		return self.remove_tags(TagCleaner(SF_TAG_PATTERNS, drop_lengths=()))
+
+	def replace_tags(self, replacer=None):
+		""" Replace tag names with homogeneous tags in the vocabulary,
+		tags with the same new name get the same tag id
+
+		Args:
+			replacer (:obj:`TagReplacer`): tag replacer, default replacements if None
+
+		Returns:
+			:obj:`ShelfStore`: store of the replaced tags
+		"""
+		replacer = TagReplacer() if replacer is None else replacer
+		vocabulary, new_ids = np.unique([replacer.replace(tag) for tag in self.vocabulary.tolist()],
+			return_inverse=True)
+		new_ids = new_ids.reshape(-1).astype(np.int32)
+
+		return self._with(vocabulary, new_ids[self.tag_ids], self.counts, self.offsets)
+
+	def merge_similar_tags(self):
+		""" Merge repeated tags of each book: the first occurrence is removed and the
+		second one gets the sum of the counts, see :obj:`tag_cleaning.merge_similar_tags`
+
+		Returns:
+			:obj:`ShelfStore`: store of the merged tags
+		"""
+		nb_tags = len(self.tag_ids)
+		if nb_tags == 0:
+			return self
+
+		# group the occurrences of the same tag in the same book, in order of position
+		book = self.book_index()
+		order = np.lexsort((np.arange(nb_tags), self.tag_ids, book))
+		sorted_book = book[order]
+		sorted_tag = self.tag_ids[order]
+		new_group = np.concatenate([[True], (sorted_book[1:] != sorted_book[:-1]) | (sorted_tag[1:] != sorted_tag[:-1])])
+		starts = np.flatnonzero(new_group)
+		group = np.cumsum(new_group) - 1
+		rank = np.arange(nb_tags) - starts[group]
+		repeated = np.diff(np.concatenate([starts, [nb_tags]]))[group] > 1
+
+		sums = np.add.reduceat(self.counts[order].astype(np.int64), starts)
+		counts = self.counts.copy()
+		second = repeated & (rank == 1)
+		counts[order[second]] = sums[group[second]]
+
+		keep = np.ones(nb_tags, dtype=bool)
+		keep[order[repeated & (rank == 0)]] = False
+
+		return self._with(self.vocabulary, self.tag_ids, counts, self.offsets).remove(keep)
+
+	def first_tags(self, cutoff):
+		""" Most populated tag of each book among the first cutoff tags
+
+		Args:
+			cutoff (:obj:`int`): cutoff for the number of first tags to keep
+
+		Returns:
+			:obj:`popnew`: list of the first tag name of each book, 'none' if there is no tag
+			:obj:`cnew`: list of the first tag count of each book, 0 if there is no tag
+		"""
+		has_tags = (self.lengths() > 0) & (int(cutoff) > 0)
+		first = self.offsets[:-1][has_tags]
+
+		popnew = np.full(len(self), 'none', dtype=object)
+		cnew = np.zeros(len(self), dtype=np.int64)
+		popnew[has_tags] = self.vocabulary[self.tag_ids[first]].tolist()
+		cnew[has_tags] = self.counts[first]
+
+		return popnew.tolist(), cnew.tolist()
+
+	def normalize_tags(self, cutoff):
+		""" Same steps as :obj:`tag_cleaning.book_tags_pipeline` on the columnar store
+
+		Args:
+			cutoff (:obj:`int`): cutoff for the number of first tags to keep
+
+		Returns:
+			:obj:`popnew`: list of the first tag name of each book, 'none' if there is no tag
+			:obj:`cnew`: list of the first tag count of each book, 0 if there is no tag
+		"""
+		store = self.clean_data_bad_tags().replace_tags().remove_sf_tags().merge_similar_tags()
+
+		return store.first_tags(cutoff)
+
+
+def read_books_json(inputdata, fields=()):
+	""" Single pass over a json file of books: some scalar fields of each book and the
+	store of their popular shelves, without building per book lists of tags
+
+	Args:
+		inputdata (:obj:`str`): name of the input json file
+		fields (:obj:`iterable`): keys of the scalar fields to extract
+
+	Returns:
+		:obj:`columns`: dict of field name and list of values of each book
+		:obj:`shelves`: ShelfStore of the tags, with the book ids
+	"""
+	builder = _ShelfBuilder()
+	columns = {field: [] for field in fields}
+	book_ids = []
+	with open(inputdata) as json_file:
+		for lines in json_file:
+			line = json.loads(lines)
+			shelves = line['popular_shelves']
+			builder.add([elm['name'] for elm in shelves], [elm['count'] for elm in shelves])
+			book_ids.append(line['book_id'])
+			for field, values in columns.items():
+				values.append(line[field])
+
+	return columns, builder.build(book_ids)
+
+
+class _ShelfBuilder(object):
+	""" Accumulates tags of books one at a time, interning tag names """
+
+	def __init__(self):
+		self.tag_index = {}
+		self.tag_ids = []
+		self.counts = []
+		self.lengths = []
+
+	def add(self, tags, counts):
+		self.tag_ids.extend(self.tag_index.setdefault(tag, len(self.tag_index)) for tag in tags)
+		self.counts.extend(int(count) for count in counts[:len(tags)])
+		self.lengths.append(len(tags))
+
+	def build(self, book_ids=None):
+		offsets = np.concatenate([[0], np.cumsum(self.lengths, dtype=np.int64)])
+		vocabulary = np.array(list(self.tag_index), dtype=str)
+		if book_ids is not None:
+			book_ids = np.array([int(book_id) for book_id in book_ids], dtype=np.int64)
+
+		return ShelfStore(vocabulary, np.array(self.tag_ids, dtype=np.int32),
+			np.array(self.counts, dtype=np.int32), offsets, book_ids)
@@ -0,0 +1,255 @@
+""" Cleaning book tags (popular shelves) with precompiled patterns
+
+:Author: Yassmine Chebaro <yassmnine.chebaro@mssm.edu>
+:Date: 2019-09-16
+:License: MIT
+"""
+
+import ast
+import re
+
+
+# Irrelevant tags, ex: to_read, must_read, 2018-read... (matched at the start of the tag)
+BAD_TAG_PATTERNS = ['.*book*', '.*read*', '.*favorite*', '.*need*', '.*own*', '.*shelve*', '.*like*',
+	'.*shelf*', '.*buy*', 'tbr', '.*finish*', '.*kindle*', '.*list*', '.*year*', '.*audio*', '.*library*']
+
+_SINGLE_QUOTED = re.compile(r"'([^']*)'")
+_QUOTED = re.compile(r"'([^'\\]*)'|\"([^\"\\]*)\"")
+
+
+def parse_shelves(cell):
+	""" Parse a list of shelves (or counts) written as a string in a csv file,
+	ex: "['to-read', 'horror']", without calling eval
+
+	Args:
+		cell (:obj:`str`): string representation of a list of strings, or a list
+
+	Returns:
+		:obj:`list`: list of strings
+	"""
+	if isinstance(cell, list):
+		return cell
+	if '\\' in cell:
+		# escaped characters, let python parse the literal
+		return list(ast.literal_eval(cell))
+	if '"' not in cell:
+		return _SINGLE_QUOTED.findall(cell)
+	return [single or double for single, double in _QUOTED.findall(cell)]
+
+
+class TagCleaner(object):
+	""" Removes irrelevant tags using a single regular expression compiled
+	once from a list of stop patterns
+
+	Args:
+		patterns (:obj:`list`): regular expressions matched at the start of the tags to remove
+		drop_lengths (:obj:`iterable`): lengths of the tags to remove, single letters by default
+		(empty tags are kept, as in the former cleaning)
+	"""
+
+	def __init__(self, patterns=BAD_TAG_PATTERNS, drop_lengths=(1,)):
+		self.patterns = list(patterns)
+		self.drop_lengths = frozenset(drop_lengths)
+		self.regex = re.compile('|'.join('(?:{})'.format(pattern) for pattern in self.patterns))
+		# tags repeat a lot between books, each tag is matched only once
+		self._is_bad = {}
+
+	def is_bad(self, tag):
+		""" Whether a tag is irrelevant
+
+		Args:
+			tag (:obj:`str`): tag name
+
+		Returns:
+			:obj:`bool`: True if the tag should be removed
+		"""
+		bad = self._is_bad.get(tag)
+		if bad is None:
+			bad = len(tag) in self.drop_lengths or self.regex.match(tag) is not None
+			self._is_bad[tag] = bad
+		return bad
+
+	def clean(self, tags, counts):
+		""" Removes irrelevant tags of a book and their counts
+
+		Args:
+			tags (:obj:`list`): list of tag names
+			counts (:obj:`list`): list of tag counts
+
+		Returns:
+			:obj:`tags`: list of kept tag names
+			:obj:`counts`: list of kept tag counts
+		"""
+		keep = [not self.is_bad(tag) for tag in tags]
+		return ([tag for tag, k in zip(tags, keep) if k],
+			[count for count, k in zip(counts, keep) if k])
+
+	def __call__(self, tags, counts):
+		return self.clean(tags, counts)
+
+	def clean_shelves(self, popular_shelves, count_shelves):
+		""" Removes irrelevant tags of all books
+
+		Args:
+			popular_shelves (:obj:`iterable`): lists of tag names, or their string representation
+			count_shelves (:obj:`iterable`): lists of tag counts, or their string representation
+
+		Returns:
+			:obj:`popnew`: list with removed irrelevant tag names
+			:obj:`cnew`: list with removed count of irrelevant tag names
+		"""
+		popnew = []
+		cnew = []
+		for elm_str, elmc_str in zip(popular_shelves, count_shelves):
+			elm, elmc = self.clean(parse_shelves(elm_str), parse_shelves(elmc_str))
+			popnew.append(elm)
+			cnew.append(elmc)
+
+		return popnew, cnew
+
+
+# Homogeneous tag names, ex: scifi to science-fiction (substrings replaced in this order)
+TAG_REPLACEMENTS = [('classics', 'classic'), ('scifi', 'science-fiction'), ('sci-fi', 'science-fiction'),
+	('ya', 'young-adult')]
+
+# Science-fiction tags, removed to extract other subgenre tags
+SF_TAG_PATTERNS = ['.*science-fiction*']
+
+
+class TagReplacer(object):
+	""" Replaces some tag names with homogeneous tags
+
+	Args:
+		replacements (:obj:`list`): list of (old, new) substrings, replaced in this order
+	"""
+
+	def __init__(self, replacements=TAG_REPLACEMENTS):
+		self.replacements = list(replacements)
+		self._replaced = {}
+
+	def replace(self, tag):
+		""" Homogeneous name of a tag
+
+		Args:
+			tag (:obj:`str`): tag name
+
+		Returns:
+			:obj:`str`: tag name with all replacements applied
+		"""
+		new = self._replaced.get(tag)
+		if new is None:
+			new = tag
+			for old, rep in self.replacements:
+				new = new.replace(old, rep)
+			self._replaced[tag] = new
+		return new
+
+	def __call__(self, tags, counts):
+		return [self.replace(tag) for tag in tags], list(counts)
+
+
+def merge_similar_tags(tags, counts):
+	""" Merge repeated tags of a book (ex: ya and young-adult after replacing ya with young-adult):
+	the first occurrence is removed and the second one gets the sum of the counts
+
+	Args:
+		tags (:obj:`list`): list of tag names
+		counts (:obj:`list`): list of tag counts (int or str)
+
+	Returns:
+		:obj:`tags`: list of merged tag names
+		:obj:`counts`: list of int counts of merged tag names
+	"""
+	counts = [int(count) for count in counts]
+	positions = {}
+	for i, tag in enumerate(tags):
+		positions.setdefault(tag, []).append(i)
+	if len(positions) == len(tags):
+		return list(tags), counts
+
+	to_remove = set()
+	for rep_idx in positions.values():
+		if len(rep_idx) > 1:
+			counts[rep_idx[1]] = sum(counts[i] for i in rep_idx)
+			to_remove.add(rep_idx[0])
+
+	return ([tag for i, tag in enumerate(tags) if i not in to_remove],
+		[count for i, count in enumerate(counts) if i not in to_remove])
+
+
+class FirstTags(object):
+	""" Keeps the most populated tag of a book among the first cutoff tags
+
+	Args:
+		cutoff (:obj:`int`): cutoff for the number of first tags to keep
+	"""
+
+	def __init__(self, cutoff):
+		self.cutoff = int(cutoff)
+
+	def __call__(self, tags, counts):
+		if self.cutoff <= 0 or len(tags) == 0:
+			return 'none', 0
+		return tags[0], counts[0]
+
+
+class TagPipeline(object):
+	""" Chain of per book tag transforms, applied to all books in a single pass
+	without intermediate Series or DataFrame
+
+	Args:
+		stages (:obj:`list`): callables taking and returning the (tags, counts) of a book
+	"""
+
+	def __init__(self, stages):
+		self.stages = list(stages)
+
+	def transform(self, tags, counts):
+		""" Applies all stages to the tags of a book
+
+		Args:
+			tags (:obj:`list`): list of tag names, or its string representation
+			counts (:obj:`list`): list of tag counts, or its string representation
+
+		Returns:
+			:obj:`tags`: output of the last stage for the tag names
+			:obj:`counts`: output of the last stage for the tag counts
+		"""
+		tags, counts = parse_shelves(tags), parse_shelves(counts)
+		for stage in self.stages:
+			tags, counts = stage(tags, counts)
+		return tags, counts
+
+	def run(self, popular_shelves, count_shelves):
+		""" Applies all stages to the tags of all books
+
+		Args:
+			popular_shelves (:obj:`iterable`): lists of tag names, or their string representation
+			count_shelves (:obj:`iterable`): lists of tag counts, or their string representation
+
+		Returns:
+			:obj:`popnew`: list of tag names output per book
+			:obj:`cnew`: list of tag counts output per book
+		"""
+		popnew = []
+		cnew = []
+		for elm, elmc in zip(popular_shelves, count_shelves):
+			tags, counts = self.transform(elm, elmc)
+			popnew.append(tags)
+			cnew.append(counts)
+
+		return popnew, cnew
+
+
+def book_tags_pipeline(cutoff=1):
+	""" Tag pipeline of the books cleaning: removes irrelevant tags, homogenizes tag names,
+	removes science-fiction tags, merges similar tags and keeps the first populated tag
+
+	Args:
+		cutoff (:obj:`int`): cutoff for the number of first tags to keep
+
+	Returns:
+		:obj:`TagPipeline`: pipeline with one (tag, count) output per book
+	"""
+	return TagPipeline([TagCleaner(), TagReplacer(), TagCleaner(SF_TAG_PATTERNS, drop_lengths=()),
+		merge_similar_tags, FirstTags(cutoff)])
@@ -0,0 +1,60 @@
+""" Typed columnar files passed between the stages of the pipeline
+    Unit Testing
+
+:Author: Yassmine Chebaro <yassmnine.chebaro@mssm.edu>
+:Date: 2019-10-10
+:License: MIT
+"""
+
+import pandas as pd
+import numpy as np
+import os
+import tempfile
+import unittest
+from artifacts import ArtifactStore, SCHEMAS, cast_to_schema
+from cleaning_books import CleaningBooks
+
+
+class ArtifactsTestCase(unittest.TestCase):
+
+	def test_methods(self):
+
+		# books as extracted from the json file: all fields are strings
+		books = pd.DataFrame(CleaningBooks().get_books_data(os.path.join('tests', 'fixtures', 'books_scifi_test.json')))
+		books = books.drop(['popular_shelves', 'count_shelves'], axis=1)
+		books_scifi = cast_to_schema(books, 'books_scifi')
+		self.assertEqual(list(books_scifi.columns), list(SCHEMAS['books_scifi']))
+		self.assertEqual(books_scifi['book_id'].dtype, np.int64)
+		self.assertEqual(books_scifi['book_id'].tolist(), books['book_id'].astype(int).tolist())
+		self.assertEqual(books_scifi['num_pages'].isna().tolist(), (books['num_pages'] == '').tolist())
+
+		ratings_books = pd.read_csv(os.path.join('tests', 'fixtures', 'ratings_books_u80-b10_test.csv'))
+		with tempfile.TemporaryDirectory() as tmpdir:
+			for fmt in ['parquet', 'feather']:
+				store = ArtifactStore(tmpdir, fmt)
+				self.assertFalse(store.exists('books_scifi'))
+				self.assertEqual(store.write('books_scifi', books), os.path.join(tmpdir, 'books_scifi.' + fmt))
+				pd.testing.assert_frame_equal(store.read('books_scifi'), books_scifi)
+
+				# only some columns, with compact dtypes
+				store.write('ratings_books', ratings_books)
+				read = store.read('ratings_books', ['user_idx', 'rating'])
+				self.assertEqual(list(read.columns), ['user_idx', 'rating'])
+				self.assertEqual(read.dtypes.tolist(), [np.int32, np.int8])
+				self.assertEqual(read['rating'].tolist(), ratings_books['rating'].tolist())
+
+			# csv file of a previous run
+			inputcsv = os.path.join(tmpdir, 'clusters_final.csv')
+			pd.DataFrame({'user_idx': [3, 1], 'group': [5, 6], 'other': [0, 0]}).to_csv(inputcsv, index=False)
+			clusters = ArtifactStore(tmpdir).read('clusters_final', fallback_csv=inputcsv)
+			self.assertEqual(clusters.to_dict('list'), {'user_idx': [3, 1], 'group': [5, 6]})
+			self.assertEqual(clusters.dtypes.tolist(), [np.int32, np.int32])
+
+		with self.assertRaises(ValueError):
+			ArtifactStore(fmt='csv')
+		with self.assertRaises(ValueError):
+			ArtifactStore().path('unknown')
+		with self.assertRaises(ValueError):
+			cast_to_schema(ratings_books.drop('rating', axis=1), 'ratings_books')
+		with self.assertRaises(ValueError):
+			cast_to_schema(ratings_books, 'ratings_books', ['user_idx', 'other'])
@@ -0,0 +1,64 @@
+""" Filtering book entries from the GoodReads json dump
+    Unit Testing
+
+:Author: Yassmine Chebaro <yassmnine.chebaro@mssm.edu>
+:Date: 2019-09-20
+:License: MIT
+"""
+
+import gzip
+import json
+import os
+import tempfile
+import unittest
+from books_filter import filter_books
+from cleaning_books import CleaningBooks
+
+
+class BooksFilterTestCase(unittest.TestCase):
+
+	def setUp(self):
+		with open(os.path.join('tests', 'fixtures', 'books_scifi_test.json')) as json_file:
+			self.books = [json.loads(line) for line in json_file]
+
+		# a french book, a children book and a book without scifi shelf
+		self.books[1]['language_code'] = 'fre'
+		self.books[2]['popular_shelves'].insert(0, {'count': '10', 'name': 'children'})
+		self.books[6]['popular_shelves'] = [elm for elm in self.books[6]['popular_shelves'] if
+			elm['name'] not in ['science-fiction', 'sci-fi', 'scifi']]
+
+		self.tmpdir = tempfile.TemporaryDirectory()
+		self.inputdata = os.path.join(self.tmpdir.name, 'goodreads_books.json.gz')
+		with gzip.open(self.inputdata, 'wt') as fout:
+			for book in self.books:
+				fout.write('{}\n'.format(json.dumps(book)))
+
+	def tearDown(self):
+		self.tmpdir.cleanup()
+
+	def read_ids(self, outputfile):
+		with gzip.open(outputfile, 'rt') if outputfile.endswith('.gz') else open(outputfile) as json_file:
+			return [json.loads(line)['book_id'] for line in json_file]
+
+	def test_methods(self):
+
+		en_nochild = os.path.join(self.tmpdir.name, 'books_en_nochild.json.gz')
+		scifi = os.path.join(self.tmpdir.name, 'books_scifi.json')
+		all_scifi = os.path.join(self.tmpdir.name, 'books_all_scifi.json')
+		ids = [book['book_id'] for book in self.books]
+
+		for n_jobs in [1, 2]:
+			counts = filter_books(self.inputdata, {en_nochild: ['english_nochild'],
+				scifi: ['english_nochild', 'scifi'], all_scifi: ['scifi']}, n_jobs=n_jobs, batch_size=3)
+
+			self.assertEqual(self.read_ids(en_nochild), [ids[i] for i in [0, 3, 4, 5, 6, 7, 8, 9]])
+			self.assertEqual(self.read_ids(scifi), [ids[i] for i in [0, 3, 4, 5, 7, 8, 9]])
+			self.assertEqual(self.read_ids(all_scifi), [ids[i] for i in [0, 1, 2, 3, 4, 5, 7, 8, 9]])
+			self.assertEqual(counts[scifi], 7)
+
+		# the single filter methods write the same books
+		CleaningBooks().get_scifi(self.inputdata, scifi)
+		self.assertEqual(self.read_ids(scifi), self.read_ids(all_scifi))
+
+		with self.assertRaises(ValueError):
+			filter_books(self.inputdata, {scifi: ['horror']})
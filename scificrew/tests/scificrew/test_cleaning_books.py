@@ -59,3 +59,32 @@ class CleaningBooksTestCase(unittest.TestCase):
 		self.assertEqual(popclean, ['horror', 'young-adult', 'dystopia', 'historical-fiction', 'historical-fiction', 'fantasy'])
 		self.assertEqual(cclean, [1526, 160, 13, 22, 977, 4315])
 
+
+	def test_normalize_tags(self):
+
+		df_scifi = pd.read_csv(os.path.join('tests', 'fixtures', 'books_scifi_test.csv'))
+
+		# single pass, same result as the chained methods
+		popclean, cclean = CleaningBooks().normalize_tags(df_scifi, 1)
+
+		self.assertEqual(popclean, ['horror', 'young-adult', 'dystopia', 'historical-fiction', 'historical-fiction', 'fantasy'])
+		self.assertEqual(cclean, [1526, 160, 13, 22, 977, 4315])
+
+		popclean, cclean = CleaningBooks().normalize_tags(df_scifi, 0)
+		self.assertEqual(popclean, ['none'] * 6)
+		self.assertEqual(cclean, [0] * 6)
+
+	def test_get_books_data_shelves(self):
+
+		inputjson = os.path.join('tests', 'fixtures', 'books_scifi_test.json')
+		cleaning = CleaningBooks()
+
+		# single pass, same books and tags as the separate reads
+		books, shelves = cleaning.get_books_data_shelves(inputjson)
+		expected = pd.DataFrame(cleaning.get_books_data(inputjson))
+		pd.testing.assert_frame_equal(books, expected.drop(['popular_shelves', 'count_shelves'], axis=1))
+
+		expected_shelves = cleaning.get_books_shelves(inputjson)
+		self.assertEqual(shelves.to_lists(), expected_shelves.to_lists())
+		self.assertEqual(shelves.book_ids.tolist(), expected_shelves.book_ids.tolist())
+		self.assertEqual(shelves.to_lists()[0], expected['popular_shelves'].tolist())
@@ -0,0 +1,51 @@
+""" Names of the users of the final clusters
+    Unit Testing
+
+:Author: Yassmine Chebaro <yassmnine.chebaro@mssm.edu>
+:Date: 2019-10-13
+:License: MIT
+"""
+
+import pandas as pd
+import numpy as np
+import os
+import tempfile
+import unittest
+from cluster_names import assign_names, load_names
+
+
+class ClusterNamesTestCase(unittest.TestCase):
+
+	def test_methods(self):
+
+		names = ['Ann', 'Bob', 'Cid', 'Dee', 'Eve']
+		clusters = pd.DataFrame({'user_idx': [9, 3, 4, 0, 7, 1, 2, 8, 5, 6, 10],
+			'group': [5, 6, 5, 5, 6, 5, 5, 5, 5, 6, 7]})
+
+		users_names = assign_names(clusters, names, random_state=0)
+		self.assertEqual(list(users_names.columns), ['user_idx', 'group', 'names'])
+		pd.testing.assert_frame_equal(users_names.loc[:, ['user_idx', 'group']], clusters)
+		pd.testing.assert_frame_equal(assign_names(clusters, names, random_state=0), users_names)
+
+		# distinct names while the group is not larger than the pool, then the same cycle again
+		for group, group_names in users_names.sort_values('user_idx').groupby('group')['names']:
+			group_names = group_names.tolist()
+			self.assertEqual(len(set(group_names)), min(len(group_names), len(names)))
+			self.assertEqual(group_names[len(names):], group_names[:max(len(group_names) - len(names), 0)])
+		self.assertTrue(set(users_names['names']) <= set(names))
+
+		# the names do not depend on the order of the rows
+		shuffled = assign_names(clusters.iloc[::-1], names, random_state=0)
+		pd.testing.assert_frame_equal(shuffled.sort_values('user_idx', ignore_index=True),
+			users_names.sort_values('user_idx', ignore_index=True))
+
+		with self.assertRaises(ValueError):
+			assign_names(clusters, [])
+		with self.assertRaises(ValueError):
+			assign_names(pd.concat([clusters, clusters]), names)
+
+		with tempfile.TemporaryDirectory() as tmpdir:
+			inputcsv = os.path.join(tmpdir, 'names.csv')
+			with open(inputcsv, 'w') as fout:
+				fout.write('Bob\nAnn\nBob\n')
+			self.assertEqual(load_names(inputcsv).tolist(), ['Ann', 'Bob'])
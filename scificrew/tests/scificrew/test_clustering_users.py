@@ -14,9 +14,13 @@ from sklearn.cluster import KMeans
 from sklearn.metrics import mean_squared_error
 import itertools
 import os
+import tempfile
 from collections import Counter
 import unittest
-from clustering_users import ClusteringUsersStep1, ClusteringUsersStep2, GetAllClusters
+from artifacts import ArtifactStore
+from clustering_users import (ClusteringUsersStep1, ClusteringUsersStep2, GetAllClusters, select_groups, labels_hash,
+	read_user_books)
+from year_tag_features import load_year_tag_features
 
 
 
@@ -24,17 +28,153 @@ class CleaningBooksTestCase(unittest.TestCase):
 
 	def test_methods(self):
 
-		book_year = pd.read_csv(os.path.join('tests', 'fixtures', 'book_year_1tag_test.csv'))
 		ratings_books = pd.read_csv(os.path.join('tests', 'fixtures', 'ratings_books_u80-b10_test.csv'))
 
+		spm, users, books = ClusteringUsersStep1().get_ratings_matrix(ratings_books)
+
+		self.assertEqual(spm.shape, (11, 762))
+		self.assertEqual(spm.nnz, len(ratings_books))
+		spm_test = spm[np.searchsorted(users, 1), :].toarray()
+
+		self.assertEqual(spm_test.item(np.searchsorted(books, 597)), 5)
+
+		# same matrix as the dense pivot table
 		df_ratings = pd.pivot_table(ratings_books, index='user_idx', columns='book_idx', values='rating')
+		np.testing.assert_array_equal(spm.toarray(), df_ratings.fillna(0).to_numpy())
+
+		user_clustid = ClusteringUsersStep1().clustering_users_ratings(ratings_books, n_clusters=3)
+		self.assertEqual(list(user_clustid.columns), ['user_idx', 'group'])
+		self.assertEqual(user_clustid['user_idx'].tolist(), sorted(set(ratings_books['user_idx'])))
+
+	def test_engines(self):
+
+		ratings_books = pd.read_csv(os.path.join('tests', 'fixtures', 'ratings_books_u80-b10_test.csv'))
+		users = sorted(set(ratings_books['user_idx']))
+
+		for engine in [ClusteringUsersStep1(random_state=0), ClusteringUsersStep1('minibatch', random_state=0),
+			ClusteringUsersStep1('minibatch', random_state=0, batch_size=4, chunk_size=4)]:
+			user_clustid = engine.clustering_users_ratings(ratings_books, n_clusters=3)
+			self.assertEqual(user_clustid['user_idx'].tolist(), users)
+			self.assertTrue(set(user_clustid['group']) <= {0, 1, 2})
+
+			# seeded engines give the same clusters
+			self.assertEqual(engine.clustering_users_ratings(ratings_books, n_clusters=3)['group'].tolist(),
+				user_clustid['group'].tolist())
+
+			# existing users with a new id are assigned to their own cluster, unknown books are ignored
+			new_users = ratings_books[ratings_books['user_idx'] == users[0]].assign(user_idx=1000)
+			new_users = pd.concat([new_users, pd.DataFrame({'user_idx': [1000], 'book_idx': [-5], 'rating': [5]})])
+			assigned = engine.assign_users(new_users)
+			self.assertEqual(assigned['user_idx'].tolist(), [1000])
+			self.assertEqual(assigned['group'].item(), user_clustid['group'].iloc[0])
+
+		with self.assertRaises(ValueError):
+			ClusteringUsersStep1('dbscan')
+
+	def test_cluster_groups(self):
+
+		# 3 groups of 20 users rating books with a publication year and a tag
+		rng = np.random.RandomState(0)
+		user_idx = np.repeat(np.arange(60), 30)
+		book_idx = rng.randint(0, 50, len(user_idx))
+		user_all = pd.DataFrame({'user_idx': user_idx, 'group': user_idx // 20})
+		for column in ['user_id', 'is_read', 'rating', 'is_reviewed', 'book_id_gr', 'user_counts', 'book_counts']:
+			user_all[column] = 1
+		user_all['book_idx'] = book_idx
+		user_all['average_rating'] = 4.
+		user_all['popular_shelves'] = np.array(['fantasy', 'horror', 'dystopia', 'space-opera'])[book_idx % 4]
+		user_all['pub_year'] = 1990 + book_idx % 5
+
+		step2 = ClusteringUsersStep2()
+		tag_year = step2.get_cluster_group(user_all, 1)
+		self.assertEqual(tag_year.index.tolist(), list(range(20, 40)))
+		self.assertEqual(tag_year.shape, (20, 9))
+
+		group_k = {2: 3, 0: 2}
+		serial = step2.cluster_groups(user_all, group_k, random_state=0)
+		parallel = step2.cluster_groups(user_all, group_k, n_jobs=2, random_state=0)
+		self.assertEqual(list(serial), [2, 0])
+		for clustid, k in group_k.items():
+			# same clusters from the sparse matrix with the shared vocabulary as from the dense pivot
+			expected = step2.compute_clusters(step2.get_cluster_group(user_all, clustid), k, random_state=0)
+			expected = expected.loc[:, ['user_idx', 'group']]
+			pd.testing.assert_frame_equal(serial[clustid], expected, check_dtype=False)
+			pd.testing.assert_frame_equal(parallel[clustid], serial[clustid])
+
+		# k from the tag_year matrix of each group
+		ruled = step2.cluster_groups(user_all, _two_clusters, random_state=0)
+		self.assertEqual(list(ruled), [0, 1, 2])
+		self.assertTrue(all(set(clustered['group']) == {0, 1} for clustered in ruled.values()))
+
+		# subclusters numbered consecutively after the clusters kept from Step 1
+		kept = pd.DataFrame({'user_idx': range(100, 140), 'group': [1] * 20 + [2] * 20})
+		final = GetAllClusters().merge_all_clusters([kept], [serial[2], serial[0]], start=3)
+		merged = pd.concat([kept, serial[2].loc[:, ['user_idx', 'group']].assign(group=lambda df: df['group'] + 3),
+			serial[0].loc[:, ['user_idx', 'group']].assign(group=lambda df: df['group'] + 6)], ignore_index=True)
+		sizes = merged['group'].value_counts()
+		merged = merged[merged['group'].isin(sizes[sizes >= 10].index)]
+		self.assertEqual(final['user_idx'].tolist(), merged['user_idx'].tolist())
+		self.assertEqual(final['group'].tolist(), merged['group'].tolist())
+
+		with self.assertRaises(ValueError):
+			step2.cluster_groups(user_all, {5: 2})
+
+	def test_select_groups(self):
+
+		# 1000 users: groups of 300 and 150 are split, 5 is left out
+		sizes = {0: 300, 3: 150, 4: 100, 7: 5, 9: 95, 12: 350}
+		user_clusters = pd.DataFrame({'user_idx': np.arange(1000),
+			'group': np.repeat(list(sizes), list(sizes.values()))})
+		keep, split = select_groups(user_clusters)
+		self.assertEqual(keep, [4, 9])
+		self.assertEqual(split, [0, 3, 12])
+		self.assertEqual(select_groups(user_clusters, split_fraction=0.2, min_fraction=0.001), ([3, 4, 9], [0, 12]))
+		self.assertEqual(select_groups(user_clusters, min_fraction=0, min_users=1), ([4, 7, 9], [0, 3, 12]))
+
+		# kept groups renumbered from 1 in the order of the selection
+		kept = GetAllClusters().remap_clusters_step1(user_clusters, [9, 4])
+		self.assertEqual([clust['group'].unique().tolist() for clust in kept], [[1], [2]])
+		self.assertEqual([len(clust) for clust in kept], [95, 100])
+		self.assertEqual(user_clusters['group'].nunique(), 6)
+
+		# same hash whatever the order of the rows
+		self.assertEqual(labels_hash(user_clusters), labels_hash(user_clusters.iloc[::-1]))
+		self.assertNotEqual(labels_hash(user_clusters), labels_hash(user_clusters.assign(group=0)))
+
+	def test_read_user_books(self):
 
-		spm = csr_matrix(pd.SparseDataFrame(df_ratings).to_coo())
+		rng = np.random.RandomState(0)
+		book_id = np.arange(100, 130)
+		book_year = pd.DataFrame({'average_rating': 4., 'book_id': book_id, 'count_shelves': 10, 'isbn': 'x',
+			'num_pages': 300, 'popular_shelves': np.array(['fantasy', 'horror', 'space-opera'])[book_id % 3],
+			'publication_year': 1980 + book_id % 7, 'ratings_count': 50, 'title': 'Book'})
+		ratings_books = pd.DataFrame({'user_id': 0, 'is_read': 1, 'rating': rng.randint(1, 6, 200), 'is_reviewed': 0,
+			'book_id_gr': rng.choice(book_id, 200), 'user_counts': 10, 'book_counts': 10,
+			'user_idx': rng.randint(0, 20, 200)})
+		ratings_books['book_idx'] = ratings_books['book_id_gr'] - 100
+		user_clusters = pd.DataFrame({'user_idx': np.arange(20), 'group': np.arange(20) % 3})
 
-		spm.todense()
-		spm_test = spm[df_ratings.index.get_loc(1), :].toarray()
+		with tempfile.TemporaryDirectory() as tmpdir:
+			store = ArtifactStore(tmpdir)
+			store.write('book_year_1tag', book_year)
+			store.write('ratings_books', ratings_books)
+			store.write('user_clusters', user_clusters)
 
-		self.assertEqual(spm_test[df_ratings.index.get_loc(1)].item(df_ratings.columns.get_loc(597)), 5)
+			clusters, user_all = read_user_books(store)
+			pd.testing.assert_frame_equal(clusters, store.read('user_clusters'))
+			self.assertEqual(len(user_all), len(ratings_books))
+			self.assertEqual(sorted(user_all['pub_year'].unique()), list(range(1980, 1987)))
 
+			# the vocabulary saved by the clustering is loaded, not refitted, from the same frame
+			outputnpz = os.path.join(tmpdir, 'year_tag_features.npz')
+			features = load_year_tag_features(user_all, outputnpz)
+			mtime = os.path.getmtime(outputnpz) - 10
+			os.utime(outputnpz, (mtime, mtime))
+			loaded = load_year_tag_features(read_user_books(store)[1], outputnpz)
+			self.assertEqual(os.path.getmtime(outputnpz), mtime)
+			self.assertEqual(loaded.data_hash, features.data_hash)
+			self.assertEqual(list(loaded.tags), list(features.tags))
 
 
+def _two_clusters(tag_year):
+	return 2
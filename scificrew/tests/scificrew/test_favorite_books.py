@@ -0,0 +1,48 @@
+""" Favorite book of each user
+    Unit Testing
+
+:Author: Yassmine Chebaro <yassmnine.chebaro@mssm.edu>
+:Date: 2019-10-12
+:License: MIT
+"""
+
+import pandas as pd
+import numpy as np
+import os
+import unittest
+from favorite_books import random_favorite_books, popular_favorite_books, book_scores, add_titles
+
+
+class FavoriteBooksTestCase(unittest.TestCase):
+
+	def test_methods(self):
+
+		ratings_books = pd.read_csv(os.path.join('tests', 'fixtures', 'ratings_books_u80-b10_test.csv'))
+		liked = ratings_books[ratings_books['rating'] >= 4]
+		liked_books = liked.groupby('user_id')['book_id_gr'].apply(set).to_dict()
+
+		# one liked book for each user with a liked book, reproducible with the seed
+		fav = random_favorite_books(ratings_books, random_state=0)
+		self.assertEqual(list(fav.columns), ['user_id', 'book_id'])
+		self.assertEqual(fav['user_id'].tolist(), sorted(liked_books))
+		self.assertTrue(all(book in liked_books[user] for user, book in zip(fav['user_id'], fav['book_id'])))
+		pd.testing.assert_frame_equal(random_favorite_books(ratings_books, random_state=0), fav)
+		self.assertFalse(random_favorite_books(ratings_books, random_state=1).equals(fav))
+
+		# best scored liked book
+		toy = pd.DataFrame({'user_id': [1, 1, 1, 2, 2, 3], 'book_id_gr': [10, 11, 12, 10, 12, 11],
+			'rating': [5, 4, 2, 4, 5, 3]})
+		scores = pd.Series([1., 2., 3.], index=[10, 11, 12])
+		pop = popular_favorite_books(toy, scores, random_state=0)
+		self.assertEqual(pop.to_dict('list'), {'user_id': [1, 2], 'book_id': [11, 12]})
+
+		# bayesian average: many ratings keep their average, few are pulled to the mean
+		books = pd.DataFrame({'book_id': [10, 11, 12], 'title': ['a', 'b', 'c'],
+			'average_rating': [4.5, 5.0, 3.0], 'ratings_count': [1000, 1, 1000]})
+		scores = book_scores(books)
+		self.assertAlmostEqual(scores[10], (1000 * 3.75 + 1000 * 4.5) / 2000, places=2)
+		self.assertLess(scores[11], scores[10])
+		self.assertEqual(popular_favorite_books(toy, scores)['book_id'].tolist(), [10, 10])
+
+		self.assertEqual(add_titles(pop, books).to_dict('list'),
+			{'user_id': [1, 2], 'book_id': [11, 12], 'title': ['b', 'c']})
@@ -0,0 +1,54 @@
+""" Mapping between ids of the pipeline
+    Unit Testing
+
+:Author: Yassmine Chebaro <yassmnine.chebaro@mssm.edu>
+:Date: 2019-09-26
+:License: MIT
+"""
+
+import pandas as pd
+import numpy as np
+import os
+import tempfile
+import unittest
+from id_mapping import IdMap, load_id_map
+
+
+class IdMappingTestCase(unittest.TestCase):
+
+	def test_methods(self):
+
+		bookmap = pd.read_csv(os.path.join('tests', 'fixtures', 'book_id_map.csv'))
+		book_map = IdMap.from_frame(bookmap, 'book_id_csv', 'book_id')
+
+		# sparse csv ids, looked up in the sorted keys
+		self.assertFalse(book_map.dense)
+		self.assertEqual(len(book_map), 13)
+		self.assertEqual(book_map.map([35166, 47960, 47970]).tolist(), [44688, 649077, 820465])
+		self.assertEqual(book_map.map(pd.Series([35166, 1]), default=-1).tolist(), [44688, -1])
+		with self.assertRaises(KeyError):
+			book_map.map([1])
+
+		self.assertEqual(book_map.inverse().map([44688]).tolist(), [35166])
+
+		# dense ids, looked up directly, with string values
+		user_map = IdMap(np.array([2, 0, 1, 3]), np.array(['c', 'a', 'b', 'd'], dtype=object))
+		self.assertTrue(user_map.dense)
+		self.assertEqual(user_map.map(pd.Series([3, 0, 0])).tolist(), ['d', 'a', 'a'])
+		self.assertEqual(user_map.contains([-1, 0, 4]).tolist(), [False, True, False])
+		self.assertEqual(user_map.inverse().map(['b', 'd']).tolist(), [1, 3])
+
+		# last value of repeated keys, as in a dict
+		self.assertEqual(IdMap([1, 5, 1], [2, 3, 4]).map([1, 5]).tolist(), [4, 3])
+
+	def test_load_id_map(self):
+
+		inputcsv = os.path.join('tests', 'fixtures', 'book_id_map.csv')
+		with tempfile.TemporaryDirectory() as tmpdir:
+			inputnpz = os.path.join(tmpdir, 'book_id_map.npz')
+			built = load_id_map(inputcsv, 'book_id_csv', 'book_id', inputnpz)
+			self.assertTrue(os.path.exists(inputnpz))
+			loaded = load_id_map(inputcsv, 'book_id_csv', 'book_id', inputnpz)
+
+		self.assertEqual(loaded.map([35166]).tolist(), built.map([35166]).tolist())
+		self.assertEqual(len(loaded), len(built))
@@ -0,0 +1,76 @@
+""" Choosing the number of k clusters
+    Unit Testing
+
+:Author: Yassmine Chebaro <yassmnine.chebaro@mssm.edu>
+:Date: 2019-10-07
+:License: MIT
+"""
+
+import pandas as pd
+import numpy as np
+import os
+import tempfile
+import unittest
+from scipy.sparse import csr_matrix
+from clustering_users import load_k_selection
+from k_selection import KSweep, data_hash, save_k_selection
+
+
+class KSelectionTestCase(unittest.TestCase):
+
+	def setUp(self):
+		# 3 well separated blobs of 30 users
+		rng = np.random.RandomState(0)
+		centers = np.array([[0, 0, 10], [10, 0, 0], [0, 10, 0]])
+		self.features = np.repeat(centers, 30, axis=0) + rng.rand(90, 3)
+
+	def test_sweep(self):
+
+		with tempfile.TemporaryDirectory() as tmpdir:
+			sweep = KSweep(n_init=3, random_state=0, sample_size=50, cache_dir=tmpdir)
+			scores = sweep.sweep(self.features, [2, 3, 4, 5, 200])
+			self.assertEqual(scores['k'].tolist(), [2, 3, 4, 5])
+			self.assertFalse(scores['cached'].any())
+			self.assertTrue((np.diff(scores['inertia']) < 0).all())
+			self.assertEqual(scores.loc[scores['k'] == 3, ['min_size', 'max_size']].values.tolist(), [[30, 30]])
+			self.assertEqual(sweep.choose_k(scores), 3)
+
+			# second sweep from the cache, in parallel
+			parallel = KSweep(n_init=3, random_state=0, sample_size=50, cache_dir=tmpdir, n_jobs=2)
+			cached = parallel.sweep(self.features, [2, 3, 4, 5, 6])
+			self.assertEqual(cached['cached'].tolist(), [True, True, True, True, False])
+			pd.testing.assert_frame_equal(cached.iloc[:4].drop(columns='cached'), scores.drop(columns='cached'))
+			self.assertEqual(parallel.load_model(self.features, 3).n_clusters, 3)
+			self.assertIsNone(parallel.load_model(self.features + 1, 3))
+
+		# same hash for the same content, dense or sparse
+		self.assertEqual(data_hash(self.features), data_hash(self.features.copy()))
+		self.assertNotEqual(data_hash(self.features), data_hash(self.features[:-1]))
+		self.assertEqual(data_hash(csr_matrix(self.features)), data_hash(csr_matrix(self.features.copy())))
+
+		# no cluster smaller than min_size
+		self.assertEqual(sweep.choose_k(pd.DataFrame({'k': [2, 3], 'silhouette': [.5, .8], 'min_size': [40, 5]})), 2)
+
+	def test_steps(self):
+
+		ratings_books = pd.read_csv(os.path.join('tests', 'fixtures', 'ratings_books_u80-b10_test.csv'))
+		scores = KSweep(n_init=1, random_state=0).sweep_step1(ratings_books, [2, 3])
+		self.assertEqual(scores['k'].tolist(), [2, 3])
+		self.assertEqual(scores['min_size'].add(scores['max_size']).le(11).tolist(), [True, True])
+
+		rng = np.random.RandomState(0)
+		user_idx = np.repeat(np.arange(40), 20)
+		book_idx = rng.randint(0, 50, len(user_idx))
+		user_all = pd.DataFrame({'user_idx': user_idx, 'group': user_idx // 20, 'pub_year': 1990 + book_idx % 5,
+			'popular_shelves': np.array(['fantasy', 'horror', 'dystopia'])[book_idx % 3]})
+		group_scores = KSweep(n_init=1, random_state=0).sweep_step2(user_all, [1, 0], [2, 3])
+		self.assertEqual(list(group_scores), [1, 0])
+		self.assertTrue(all(scores['k'].tolist() == [2, 3] for scores in group_scores.values()))
+
+		with tempfile.TemporaryDirectory() as tmpdir:
+			outputjson = os.path.join(tmpdir, 'k_selection.json')
+			with self.assertRaises(FileNotFoundError):
+				load_k_selection(outputjson)
+			save_k_selection(outputjson, np.int64(20), {4: np.int64(8), 11: 3}, [np.int64(2), 10], 0, 'abc')
+			self.assertEqual(load_k_selection(outputjson), {'step1': 20, 'random_state': 0, 'step1_hash': 'abc',
+				'keep': [2, 10], 'step2': {4: 8, 11: 3}})
@@ -0,0 +1,42 @@
+""" Getting final clusters data
+    Unit Testing
+
+:Author: Yassmine Chebaro <yassmnine.chebaro@mssm.edu>
+:Date: 2019-10-17
+:License: MIT
+"""
+
+import os
+import pandas as pd
+import sqlite3
+import tempfile
+import unittest
+from mapping_final_clusters_data import write_users_db, USERS_INDEXES
+
+
+class MappingFinalClustersDataTestCase(unittest.TestCase):
+
+	def test_write_users_db(self):
+
+		users = pd.DataFrame({'user_id_csv': [1073, 1272, 1440], 'user_idx': [0, 1, 2],
+			'user_id_gr': ['b5f9', '8bf7', '7543'], 'Average sentiment': ['positive', 'negative', 'neutral'],
+			'group_x': [35, 34, 34], 'book_id': [13827, 44688, 1307], 'title': ['This Immortal', "Magician's Gambit",
+			'Fire Sea'], 'group_y': [35, 34, 34], 'names': ['Will', 'Khaldoon', 'Anson'], 'extra': 0})
+
+		with tempfile.TemporaryDirectory() as tmpdir:
+			outputdb = os.path.join(tmpdir, 'db.sqlite')
+			for _ in range(2):
+				# replaced when written again
+				write_users_db(users, outputdb)
+				self.assertEqual(os.listdir(tmpdir), ['db.sqlite'])
+
+				conn = sqlite3.connect('file:{}?mode=ro'.format(outputdb), uri=True)
+				try:
+					written = pd.read_sql('select * from users', conn)
+					indexes = dict(conn.execute("select name, sql from sqlite_master where type = 'index'"))
+				finally:
+					conn.close()
+				pd.testing.assert_frame_equal(written, users.drop(columns=['extra']), check_dtype=False)
+				self.assertEqual(sorted(indexes), sorted(USERS_INDEXES))
+				for name, column in USERS_INDEXES.items():
+					self.assertIn('({})'.format(column), indexes[name])
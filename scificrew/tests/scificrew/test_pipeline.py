@@ -0,0 +1,161 @@
+""" Runner of the stages of the pipeline
+    Unit Testing
+
+:Author: Yassmine Chebaro <yassmnine.chebaro@mssm.edu>
+:Date: 2019-10-11
+:License: MIT
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+from pipeline import Pipeline, Stage, PIPELINE_STAGES
+
+
+def _log(name):
+	with open('runs.log', 'a') as fout:
+		fout.write(name + '\n')
+
+
+def stage_a(suffix=''):
+	_log('a')
+	with open('src.txt') as fin, open('a.txt', 'w') as fout:
+		fout.write(fin.read() + suffix)
+
+
+def stage_copy(name, source, text=None):
+	_log(name)
+	with open(source) as fin, open(name + '.txt', 'w') as fout:
+		fout.write(fin.read() + (name if text is None else text))
+
+
+def stage_d():
+	_log('d')
+	with open('b.txt') as fin_b, open('c.txt') as fin_c, open('d.txt', 'w') as fout:
+		fout.write(fin_b.read() + fin_c.read())
+
+
+def toy_stages(c_text=None):
+	return [
+		Stage('d', stage_d, inputs=['b.txt', 'c.txt'], outputs=['d.txt']),
+		Stage('a', stage_a, inputs=['src.txt'], outputs=['a.txt']),
+		Stage('b', stage_copy, inputs=['a.txt'], outputs=['b.txt'], params={'name': 'b', 'source': 'a.txt'}),
+		Stage('c', 'test_pipeline:stage_copy', inputs=['a.txt'], outputs=['c.txt'],
+			params={'name': 'c', 'source': 'a.txt', 'text': c_text}),
+	]
+
+
+class PipelineTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self.tmpdir = tempfile.TemporaryDirectory()
+		self.workdir = self.tmpdir.name
+		self.write('src.txt', 'source')
+
+	def tearDown(self):
+		self.tmpdir.cleanup()
+
+	def write(self, name, content):
+		with open(os.path.join(self.workdir, name), 'w') as fout:
+			fout.write(content)
+
+	def runs(self):
+		path = os.path.join(self.workdir, 'runs.log')
+		if not os.path.exists(path):
+			return []
+		with open(path) as fin:
+			runs = fin.read().split()
+		os.remove(path)
+		return runs
+
+	def test_methods(self):
+
+		pipeline = Pipeline(toy_stages(), self.workdir)
+		self.assertEqual(pipeline.order, ['a', 'b', 'c', 'd'])
+		self.assertEqual(pipeline.dependencies['d'], {'b', 'c'})
+		self.assertEqual(pipeline.upstream(['b']), ['a', 'b'])
+		self.assertEqual(pipeline.plan(), {'a': 'run', 'b': 'run', 'c': 'run', 'd': 'run'})
+
+		self.assertEqual(pipeline.run(), {'a': 'run', 'b': 'run', 'c': 'run', 'd': 'run'})
+		self.assertEqual(self.runs(), ['a', 'b', 'c', 'd'])
+		with open(os.path.join(self.workdir, 'd.txt')) as fin:
+			self.assertEqual(fin.read(), 'sourcebsourcec')
+
+		# nothing changed
+		self.assertEqual(pipeline.plan(), dict.fromkeys('abcd', 'skip'))
+		self.assertEqual(set(pipeline.run().values()), {'skip'})
+		self.assertEqual(self.runs(), [])
+
+		# new parameter of c: c and its downstream stage
+		self.assertEqual(set(Pipeline(toy_stages('e'), self.workdir).run(n_jobs=2).items()),
+			{('a', 'skip'), ('b', 'skip'), ('c', 'run'), ('d', 'run')})
+		self.assertEqual(self.runs(), ['c', 'd'])
+
+		# missing output
+		os.remove(os.path.join(self.workdir, 'b.txt'))
+		self.assertEqual(Pipeline(toy_stages('e'), self.workdir).run(['b']), {'a': 'skip', 'b': 'run'})
+		self.assertEqual(self.runs(), ['b'])
+
+		# new input, everything runs, b and c concurrently after a, d last
+		self.write('src.txt', 'new source')
+		status = Pipeline(toy_stages('e'), self.workdir).run(n_jobs=2)
+		self.assertEqual(set(status.values()), {'run'})
+		self.assertEqual(list(status)[0], 'a')
+		self.assertEqual(list(status)[-1], 'd')
+		self.assertEqual(self.runs()[-1], 'd')
+
+		self.assertEqual(set(Pipeline(toy_stages('e'), self.workdir).run(force=True).values()), {'run'})
+
+	def test_code_files(self):
+
+		# stage module importing a helper module of its folder, and a standard module
+		self.write('toy_helper.py', 'VALUE = 1\n')
+		self.write('toy_stage.py', 'import os\nfrom toy_helper import VALUE\n\ndef main():\n\tpass\n')
+		self.write('notes.txt', 'notes')
+		sys.path.insert(0, self.workdir)
+		try:
+			stage = Stage('toy', 'toy_stage:main', code=[os.path.join(self.workdir, 'notes.txt')])
+			self.assertEqual([os.path.basename(path) for path in stage.code_files()],
+				['notes.txt', 'toy_helper.py', 'toy_stage.py'])
+
+			pipeline = Pipeline([stage], self.workdir)
+			self.assertEqual(pipeline.run(), {'toy': 'run'})
+			self.assertEqual(pipeline.plan(), {'toy': 'skip'})
+
+			# edits of the helper module or of the code files make the stage stale
+			self.write('toy_helper.py', 'VALUE = 2\n')
+			self.assertEqual(pipeline.plan(), {'toy': 'run'})
+			self.assertEqual(pipeline.run(), {'toy': 'run'})
+			self.write('notes.txt', 'new notes')
+			self.assertEqual(pipeline.plan(), {'toy': 'run'})
+		finally:
+			sys.path.remove(self.workdir)
+
+		# helper modules of the stages of the pipeline
+		code_files = [os.path.basename(path) for path in Pipeline().stages['clean_books'].code_files()]
+		self.assertTrue({'cleaning_books.py', 'tag_cleaning.py', 'shelf_store.py'} <= set(code_files))
+
+	def test_errors(self):
+
+		with self.assertRaises(ValueError):
+			Pipeline([Stage('x', stage_d, ['y.txt'], ['x.txt']), Stage('y', stage_d, ['x.txt'], ['y.txt'])])
+		with self.assertRaises(ValueError):
+			Pipeline([Stage('x', stage_d, [], ['x.txt']), Stage('y', stage_d, [], ['x.txt'])])
+		with self.assertRaises(ValueError):
+			Pipeline(toy_stages()).upstream(['unknown'])
+
+		# stages of the pipeline: sentiment does not wait for the clustering
+		pipeline = Pipeline()
+		self.assertEqual(pipeline.order[0], 'clean_books')
+		self.assertEqual(pipeline.dependencies['sentiment'], {'clean_books', 'ratings'})
+		self.assertEqual(pipeline.dependencies['clustering'], {'clean_books', 'ratings', 'k_selection'})
+		self.assertEqual(pipeline.dependencies['final_mapping'], {'clustering', 'ratings', 'sentiment', 'favorite_books', 'cluster_names'})
+		self.assertEqual(pipeline.upstream(['similarity']), ['clean_books', 'ratings', 'k_selection', 'clustering', 'similarity'])
+		self.assertEqual(pipeline.dependencies['similarity'], {'clean_books', 'ratings', 'k_selection', 'clustering'})
+
+		# inputs are downloaded goodreads files or outputs of the stages
+		outputs = set(output for stage in PIPELINE_STAGES for output in stage.outputs)
+		downloads = set(input for stage in PIPELINE_STAGES for input in stage.inputs) - outputs
+		self.assertEqual(downloads, {'goodreads_books.json.gz', 'book_id_map.csv', 'goodreads_interactions.csv',
+			'user_id_map.csv', 'goodreads_reviews_dedup.json.gz', 'names_64.csv'})
@@ -0,0 +1,57 @@
+""" Streaming reader of the reviews of a set of users
+    Unit Testing
+
+:Author: Yassmine Chebaro <yassmnine.chebaro@mssm.edu>
+:Date: 2019-10-09
+:License: MIT
+"""
+
+import pandas as pd
+import gzip
+import json
+import os
+import tempfile
+import unittest
+from reviews_reader import filter_review_lines, iter_review_batches, iter_reviews, read_reviews
+from reviews_sent_analysis import get_reviews_data
+
+
+class ReviewsReaderTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self.tmpdir = tempfile.TemporaryDirectory()
+		self.reviews = []
+		for i in range(40):
+			self.reviews.append({'user_id': 'u{}'.format(i % 7), 'book_id': str(1000 + i), 'review_id': 'r{}'.format(i),
+				'rating': i % 5, 'review_text': 'Review {} "user_id": "u1"'.format(i), 'n_votes': 0})
+		self.inputdata = os.path.join(self.tmpdir.name, 'goodreads_reviews_test.json.gz')
+		with gzip.open(self.inputdata, 'wt') as fout:
+			for review in self.reviews:
+				fout.write(json.dumps(review) + '\n')
+
+	def tearDown(self):
+		self.tmpdir.cleanup()
+
+	def test_methods(self):
+
+		users = ['u1', 'u3']
+		expected = [{'book_id': review['book_id'], 'user_id': review['user_id'], 'rating': review['rating'],
+			'review_text': review['review_text']} for review in self.reviews if review['user_id'] in users]
+		self.assertEqual(len(expected), 12)
+
+		# the user id in the review text is not matched
+		self.assertEqual(list(iter_reviews(self.inputdata, users)), expected)
+		self.assertEqual(list(iter_reviews(self.inputdata, ['u0'], batch_size=3)),
+			get_reviews_data(self.inputdata, {'u0'}))
+		self.assertEqual(get_reviews_data(self.inputdata, users), expected)
+
+		# columnar batches, in the order of the file, in parallel
+		batches = list(iter_review_batches(self.inputdata, users, ('user_id', 'rating'), n_jobs=2, batch_size=5))
+		self.assertTrue(all(len(batch) for batch in batches))
+		pd.testing.assert_frame_equal(pd.concat(batches, ignore_index=True),
+			pd.DataFrame(expected).loc[:, ['user_id', 'rating']])
+		pd.testing.assert_frame_equal(read_reviews(self.inputdata, users, n_jobs=2, batch_size=5), pd.DataFrame(expected))
+
+		self.assertEqual(read_reviews(self.inputdata, ['u9']).shape, (0, 4))
+		self.assertEqual(filter_review_lines([b'{"rating": 5}', json.dumps(self.reviews[1]).encode()], {'u1'}, ('rating',)),
+			{'rating': [1]})
@@ -0,0 +1,97 @@
+""" VADER sentiment scoring of reviews
+    Unit Testing
+
+:Author: Yassmine Chebaro <yassmnine.chebaro@mssm.edu>
+:Date: 2019-10-08
+:License: MIT
+"""
+
+import pandas as pd
+import numpy as np
+import os
+import tempfile
+import unittest
+from vaderSentiment.vaderSentiment import SentimentIntensityAnalyzer
+from sentiment_scoring import SentimentScorer, SentimentCache, UserSentiment, score_texts, sentiment_label, \
+	text_key
+from reviews_sent_analysis import sentiment_scores, get_average_sentiment, get_nature_avsent, \
+	user_average_sentiment
+
+
+class SentimentScoringTestCase(unittest.TestCase):
+
+	def setUp(self):
+		texts = ['A wonderful book, I loved it!', 'Terrible, boring and way too long.', 'It is a book.',
+			'Great world building but awful characters.', 'The best space opera ever written :)']
+		rng = np.random.RandomState(0)
+		self.reviews = pd.DataFrame({'book_id': '1', 'user_id': rng.choice(['u1', 'u2', 'u3', 'u4'], 50),
+			'rating': 4, 'review_text': rng.choice(texts, 50)})
+
+	def test_methods(self):
+
+		analyser = SentimentIntensityAnalyzer()
+		expected = [analyser.polarity_scores(text)['compound'] for text in self.reviews['review_text']]
+		np.testing.assert_array_equal(score_texts(self.reviews['review_text'], analyser), expected)
+		np.testing.assert_array_equal(SentimentScorer(batch_size=7).score(self.reviews['review_text']), expected)
+		np.testing.assert_array_equal(SentimentScorer(n_jobs=2, batch_size=7).score(self.reviews['review_text']),
+			expected)
+		self.assertEqual(SentimentScorer().score([]).tolist(), [])
+
+		self.assertEqual(sentiment_label([0.05, 0.049, -0.049, -0.05]).tolist(),
+			['positive', 'neutral', 'neutral', 'negative'])
+
+		# same averages and natures as the lists of scores per user
+		user_lists = sentiment_scores(self.reviews, analyser)
+		self.assertEqual(sum(len(scores) for scores in user_lists.values()), 50)
+		averages = get_average_sentiment(user_lists)
+		for n_jobs in [1, 2]:
+			user_sentiment = SentimentScorer(n_jobs, batch_size=7).user_sentiment(self.reviews['user_id'],
+				iter(self.reviews['review_text']))
+			self.assertEqual(list(user_sentiment.means()), list(averages))
+			np.testing.assert_allclose(list(user_sentiment.means().values()), list(averages.values()))
+			self.assertEqual(user_sentiment.labels(), get_nature_avsent(averages))
+
+		user_sent, stats = user_average_sentiment(self.reviews, batch_size=7)
+		self.assertIsNone(stats)
+		self.assertEqual(list(user_sent.columns), ['User', 'Average sentiment'])
+		self.assertEqual(dict(zip(user_sent['User'], user_sent['Average sentiment'])), get_nature_avsent(averages))
+
+	def test_user_sentiment(self):
+
+		user_sentiment = UserSentiment()
+		user_sentiment.add(['a', 'b', 'a'], np.array([0.5, -0.5, 0.]))
+		user_sentiment.add(['c', 'a'], np.array([0., 1.]))
+		self.assertEqual(len(user_sentiment), 3)
+		self.assertEqual(user_sentiment.means(), {'a': 0.5, 'b': -0.5, 'c': 0.})
+		self.assertEqual(user_sentiment.labels(), {'a': 'positive', 'b': 'negative', 'c': 'neutral'})
+		self.assertEqual(UserSentiment().to_frame().shape, (0, 2))
+
+	def test_cache(self):
+
+		texts = self.reviews['review_text']
+		expected = SentimentScorer().score(texts)
+		with tempfile.TemporaryDirectory() as tmpdir:
+			cache_db = os.path.join(tmpdir, 'sentiment_cache.sqlite')
+
+			# first run: each distinct text is scored and cached once per batch
+			with SentimentCache(cache_db, chunk_size=3) as cache:
+				np.testing.assert_array_equal(SentimentScorer(batch_size=50, cache=cache).score(texts), expected)
+				self.assertEqual(cache.stats()['hits'], 0)
+				self.assertEqual(len(cache), 5)
+
+			# rerun after a refresh: only the new review is scored
+			new_texts = pd.concat([texts, pd.Series(['An average novel.'])], ignore_index=True)
+			with SentimentCache(cache_db) as cache:
+				scores = SentimentScorer(n_jobs=2, batch_size=7, cache=cache).score(new_texts)
+				self.assertEqual(cache.stats(), {'hits': 50, 'misses': 1, 'hit_rate': 50 / 51})
+				self.assertEqual(len(cache), 6)
+			np.testing.assert_array_equal(scores[:50], expected)
+			np.testing.assert_array_equal(scores[50:], SentimentScorer().score(['An average novel.']))
+
+			with SentimentCache(cache_db) as cache:
+				cached = cache.lookup([text_key('A wonderful book, I loved it!'), 'missing'])
+				self.assertEqual(np.isnan(cached).tolist(), [False, True])
+
+			user_sent, stats = user_average_sentiment(self.reviews, cache_db=cache_db)
+			self.assertEqual(stats['misses'], 0)
+			self.assertEqual(user_sent.values.tolist(), user_average_sentiment(self.reviews)[0].values.tolist())
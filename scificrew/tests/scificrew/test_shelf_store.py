@@ -0,0 +1,66 @@
+""" Columnar storage of the book tags
+    Unit Testing
+
+:Author: Yassmine Chebaro <yassmnine.chebaro@mssm.edu>
+:Date: 2019-10-04
+:License: MIT
+"""
+
+import pandas as pd
+import numpy as np
+import os
+import tempfile
+import unittest
+from shelf_store import ShelfStore
+from tag_cleaning import TagCleaner, TagPipeline, book_tags_pipeline
+
+
+class ShelfStoreTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self.df_scifi = pd.read_csv(os.path.join('tests', 'fixtures', 'books_scifi_test.csv'))
+		self.store = ShelfStore.from_lists(self.df_scifi['popular_shelves'], self.df_scifi['count_shelves'],
+			self.df_scifi['book_id'])
+
+	def test_store(self):
+
+		self.assertEqual(len(self.store), 6)
+		self.assertEqual(self.store.tag_ids.dtype, np.int32)
+		self.assertEqual(self.store.counts.dtype, np.int32)
+
+		tags, counts = self.store.book(0)
+		self.assertEqual(tags[:3], ['to-read', 'horror', 'stephen-king'])
+		self.assertEqual(counts[:3], [7615, 1526, 1108])
+
+		with tempfile.TemporaryDirectory() as tmpdir:
+			outputnpz = os.path.join(tmpdir, 'books_scifi_shelves.npz')
+			self.store.save(outputnpz)
+			loaded = ShelfStore.load(outputnpz)
+
+		self.assertEqual(loaded.to_lists(), self.store.to_lists())
+		self.assertEqual(loaded.book_ids.tolist(), self.df_scifi['book_id'].tolist())
+
+	def test_methods(self):
+
+		# vectorized steps give the same tags as the per book pipeline
+		popnew, cnew = TagPipeline([TagCleaner()]).run(self.df_scifi['popular_shelves'], self.df_scifi['count_shelves'])
+		self.assertEqual(self.store.clean_data_bad_tags().to_lists(), (popnew, [[int(c) for c in elmc] for elmc in cnew]))
+
+		self.assertEqual(self.store.normalize_tags(1), book_tags_pipeline(1).run(self.df_scifi['popular_shelves'],
+			self.df_scifi['count_shelves']))
+		self.assertEqual(self.store.normalize_tags(0), (['none'] * 6, [0] * 6))
+
+		# empty tags are kept as by the former cleaning, only single letters are removed
+		shelves = [['', 'to-read', 'horror'], ['a', 'sci-fi', 'b', 'space'], ['to-read', '', 'x'], ['z']]
+		counts = [[9, 8, 7], [6, 5, 4, 3], [3, 2, 1], [1]]
+		store = ShelfStore.from_lists(shelves, counts)
+		self.assertEqual(store.clean_data_bad_tags().to_lists(),
+			([['', 'horror'], ['sci-fi', 'space'], [''], []], [[9, 7], [5, 3], [2], []]))
+		self.assertEqual(store.normalize_tags(1), book_tags_pipeline(1).run(shelves, counts))
+		self.assertEqual(store.normalize_tags(1), (['', 'space', '', 'none'], [9, 3, 2, 0]))
+
+		# repeated tags after replacement
+		store = ShelfStore.from_lists([['ya', 'sf', 'young-adult', 'ya'], []], [[5, 4, 3, 1], []])
+		self.assertEqual(store.replace_tags().merge_similar_tags().to_lists(),
+			([['sf', 'young-adult', 'young-adult'], []], [[4, 9, 1], []]))
+		self.assertEqual(store.first_tags(1), (['ya', 'none'], [5, 0]))
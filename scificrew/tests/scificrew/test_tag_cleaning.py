@@ -0,0 +1,61 @@
+""" Cleaning book tags (popular shelves) with precompiled patterns
+    Unit Testing
+
+:Author: Yassmine Chebaro <yassmnine.chebaro@mssm.edu>
+:Date: 2019-09-20
+:License: MIT
+"""
+
+import pandas as pd
+import os
+import re
+import unittest
+from tag_cleaning import TagCleaner, TagReplacer, parse_shelves, merge_similar_tags
+
+
+class TagCleaningTestCase(unittest.TestCase):
+
+	def test_parse_shelves(self):
+
+		self.assertEqual(parse_shelves("['to-read', 'horror', \"children's\", '']"), ['to-read', 'horror', "children's", ''])
+		self.assertEqual(parse_shelves("['7615', '1526']"), ['7615', '1526'])
+		self.assertEqual(parse_shelves("['back\\\\slash', 'sf']"), ['back\\slash', 'sf'])
+		self.assertEqual(parse_shelves('[]'), [])
+		self.assertEqual(parse_shelves(['sf']), ['sf'])
+
+	def test_methods(self):
+
+		df_scifi = pd.read_csv(os.path.join('tests', 'fixtures', 'books_scifi_test.csv'))
+
+		popnew, cnew = TagCleaner().clean_shelves(df_scifi['popular_shelves'], df_scifi['count_shelves'])
+
+		# same tags as matching each pattern separately
+		for elm_str, elmc_str, elm_clean, elmc_clean in zip(df_scifi['popular_shelves'], df_scifi['count_shelves'], popnew, cnew):
+			elm = eval(elm_str)
+			elmc = eval(elmc_str)
+			keep = [i for i in range(len(elm)) if len(elm[i]) != 1 and not any(re.match(p, elm[i]) for p in
+				['.*book*', '.*read*', '.*favorite*', '.*need*', '.*own*', '.*shelve*', '.*like*', '.*shelf*',
+				'.*buy*', 'tbr', '.*finish*', '.*kindle*', '.*list*', '.*year*', '.*audio*', '.*library*'])]
+			self.assertEqual(elm_clean, [elm[i] for i in keep])
+			self.assertEqual(elmc_clean, [elmc[i] for i in keep])
+
+		self.assertEqual(popnew[0][:4], ['horror', 'stephen-king', 'fiction', 'sci-fi'])
+		self.assertEqual(cnew[0][:4], ['1526', '1108', '866', '317'])
+
+		# removed tags: single letters (not empty tags), stop patterns at the start or anywhere with .*
+		cleaner = TagCleaner()
+		self.assertEqual(cleaner.clean(['a', 'tbr', 'my-tbr', 'owned', 'sf', 'kindle-books', ''], [1, 2, 3, 4, 5, 6, 7]),
+			(['my-tbr', 'sf', ''], [3, 5, 7]))
+
+		# configurable patterns
+		cleaner = TagCleaner(patterns=['.*horror'], drop_lengths=(1, 2))
+		self.assertEqual(cleaner.clean(['horror-thriller', 'sf', 'scifi'], [1, 2, 3]), (['scifi'], [3]))
+
+	def test_replace_merge_tags(self):
+
+		tags, counts = TagReplacer()(['ya', 'sci-fi', 'young-adult', 'science-fiction', 'ya', 'classics'], ['5', '4', '3', '2', '1', '6'])
+		self.assertEqual(tags, ['young-adult', 'science-fiction', 'young-adult', 'science-fiction', 'young-adult', 'classic'])
+
+		# first occurrence removed, second one with the sum of counts
+		self.assertEqual(merge_similar_tags(tags, counts), (['young-adult', 'science-fiction', 'young-adult', 'classic'], [9, 6, 1, 6]))
+		self.assertEqual(merge_similar_tags(['sf', 'horror'], ['2', '1']), (['sf', 'horror'], [2, 1]))
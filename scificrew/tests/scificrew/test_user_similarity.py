@@ -0,0 +1,77 @@
+""" Computing user-user similarity within each cluster
+    Unit Testing
+
+:Author: Yassmine Chebaro <yassmnine.chebaro@mssm.edu>
+:Date: 2019-10-01
+:License: MIT
+"""
+
+import pandas as pd
+import numpy as np
+import os
+import tempfile
+import unittest
+from itertools import product
+from scipy.sparse import csr_matrix
+from user_similarity import cosine_similarity_clusters, get_similarity_flat, write_similarity_flat, \
+	topk_cosine_similarity, get_topk_similarity_flat
+
+
+class UserSimilarityTestCase(unittest.TestCase):
+
+	def setUp(self):
+		features = np.random.RandomState(0).randint(0, 5, size=(7, 4))
+		tag_year = pd.DataFrame(features, index=pd.Index([3, 8, 11, 12, 20, 21, 40], name='user_idx'))
+		self.tag_year = tag_year
+		self.similarity = cosine_similarity_clusters(tag_year)
+
+	def test_similarity_flat(self):
+
+		flat = get_similarity_flat(self.similarity, 5)
+
+		# same pairs in the same order as the product of the index with itself
+		pairs = [(u1, u2) for u1, u2 in product(self.similarity.index, self.similarity.index) if u1 != u2]
+		self.assertEqual(list(zip(flat['User1'], flat['User2'])), pairs)
+		self.assertEqual(list(flat['Similarity']), [self.similarity.loc[u1][u2] for u1, u2 in pairs])
+		self.assertEqual(set(flat['Group']), {5})
+
+		upper = get_similarity_flat(self.similarity, 5, upper=True)
+		self.assertEqual(len(upper), len(pairs) // 2)
+		self.assertTrue((upper['User1'] < upper['User2']).all())
+
+	def test_write_similarity_flat(self):
+
+		with tempfile.TemporaryDirectory() as tmpdir:
+			outputcsv = os.path.join(tmpdir, 'user_user_similarity.csv')
+			count = write_similarity_flat(self.similarity, 5, outputcsv, chunksize=3)
+			count += write_similarity_flat(self.similarity, 6, outputcsv, chunksize=3, header=False)
+			written = pd.read_csv(outputcsv)
+
+		self.assertEqual(count, 2 * 7 * 6)
+		self.assertEqual(len(written), count)
+		self.assertEqual(list(written.columns), ['User1', 'User2', 'Similarity', 'Group'])
+		np.testing.assert_allclose(written['Similarity'][:42], get_similarity_flat(self.similarity, 5)['Similarity'])
+
+	def test_topk_cosine_similarity(self):
+
+		# dense similarity sorted per user, without the user itself
+		dense = self.similarity.to_numpy()
+		np.fill_diagonal(dense, -np.inf)
+		expected = -np.sort(-dense, axis=1)[:, :3]
+
+		neighbors, similarity = topk_cosine_similarity(self.tag_year, k=3, block_size=2)
+		np.testing.assert_allclose(similarity, expected)
+		np.testing.assert_allclose(np.take_along_axis(dense, neighbors, axis=1), expected)
+		self.assertFalse((neighbors == np.arange(7)[:, None]).any())
+
+		# same result from a sparse matrix and from worker processes
+		sparse_neighbors, sparse_similarity = topk_cosine_similarity(csr_matrix(self.tag_year.to_numpy()), k=3)
+		pool_neighbors, pool_similarity = topk_cosine_similarity(self.tag_year, k=3, block_size=2, n_jobs=2)
+		np.testing.assert_array_equal(sparse_neighbors, neighbors)
+		np.testing.assert_array_equal(pool_neighbors, neighbors)
+		np.testing.assert_allclose(pool_similarity, similarity)
+
+		# k larger than the group keeps every other user
+		flat = get_topk_similarity_flat(self.tag_year, 5, k=100)
+		self.assertEqual(len(flat), 7 * 6)
+		self.assertTrue((flat.groupby('User1')['Similarity'].diff().dropna() <= 0).all())
@@ -15,7 +15,9 @@ import numpy as np
 import itertools
 import unittest
 import os
-from users_books_ratings import get_users_books
+import tempfile
+from unittest import mock
+from users_books_ratings import get_users_books, get_users_books_chunked
 
 ## Important note: testing is not clean here
 ## Need to use more explicitly function in the code
@@ -43,3 +45,42 @@ class UsersBooksRatingsTestCase(unittest.TestCase):
 		self.assertEqual(user, 1272)
 		self.assertEqual(book_csv, 35166)
 		self.assertEqual(book_id_gr, 44688)
+
+	def test_chunked(self):
+
+		# 40 users with 150 interactions among 200 books, 150 of which are sci-fi
+		rng = np.random.RandomState(0)
+		bookmap = pd.DataFrame({'book_id_csv': np.arange(200), 'book_id': rng.permutation(200) * 10 + 7})
+		books_sci = pd.DataFrame({'book_id': bookmap['book_id'][:150]})
+		ratings = pd.DataFrame({'user_id': np.repeat(np.arange(40), 150),
+			'book_id': np.concatenate([rng.choice(200, 150, replace=False) for _ in range(40)]),
+			'is_read': rng.binomial(1, 0.95, 6000), 'rating': rng.randint(0, 6, 6000),
+			'is_reviewed': rng.binomial(1, 0.85, 6000)})
+
+		expected = get_users_books(books_sci, bookmap, ratings.copy())
+
+		with tempfile.TemporaryDirectory() as tmpdir:
+			interactions = os.path.join(tmpdir, 'goodreads_interactions.csv')
+			ratings.to_csv(interactions, index=False)
+			df2 = get_users_books_chunked(books_sci, bookmap, interactions, chunksize=700)
+
+		self.assertGreater(len(df2), 0)
+		self.assertLess(len(df2), len(ratings))
+		self.assertEqual(list(df2.columns), list(expected.columns))
+		np.testing.assert_array_equal(df2.to_numpy(dtype=np.int64), expected.to_numpy(dtype=np.int64))
+
+		# no users or books passing the cuts, or no interactions: empty frames with the same columns
+		with tempfile.TemporaryDirectory() as tmpdir:
+			interactions = os.path.join(tmpdir, 'goodreads_interactions.csv')
+			ratings.to_csv(interactions, index=False)
+			strict = get_users_books_chunked(books_sci, bookmap, interactions, chunksize=700, minreviews=1000)
+			ratings.iloc[:0].to_csv(interactions, index=False)
+			no_rows = get_users_books_chunked(books_sci, bookmap, interactions, chunksize=700)
+		for empty in [strict, no_rows]:
+			self.assertEqual(len(empty), 0)
+			self.assertEqual(list(empty.columns), list(expected.columns))
+
+		with mock.patch('users_books_ratings._read_reviewed_scifi', return_value=iter([])):
+			empty = get_users_books_chunked(books_sci, bookmap, 'goodreads_interactions.csv')
+		self.assertEqual(len(empty), 0)
+		self.assertEqual(list(empty.columns), list(expected.columns))
@@ -0,0 +1,107 @@
+""" Users x (publication year, tag) sparse features
+    Unit Testing
+
+:Author: Yassmine Chebaro <yassmnine.chebaro@mssm.edu>
+:Date: 2019-10-06
+:License: MIT
+"""
+
+import pandas as pd
+import numpy as np
+import os
+import tempfile
+import unittest
+from collections import Counter
+from year_tag_features import YearTagFeatures, load_year_tag_features
+
+
+def reference_tag_year(df_clust):
+	""" Previous implementation: merge of the dense year and tag pivot tables """
+	count_user_year = df_clust.groupby(['user_idx', 'pub_year']).size().reset_index(name ='year_count')
+	user_year_pivot = pd.pivot_table(count_user_year, index='user_idx', columns= 'pub_year', values='year_count')
+
+	count_user_tag = df_clust.groupby(['user_idx', 'popular_shelves']).size().reset_index(name ='tag_count')
+	listtags = Counter(count_user_tag['popular_shelves'])
+	listtags_freq = [k for k,v in listtags.items() if v>=10]
+	df_u_tags = count_user_tag[count_user_tag['popular_shelves'].isin(listtags_freq)]
+	user_tag_pivot = pd.pivot_table(df_u_tags, index='user_idx', columns= 'popular_shelves', values='tag_count')
+
+	tag_year = pd.merge(user_year_pivot, user_tag_pivot, on='user_idx')
+	tag_year.fillna(0, inplace=True)
+
+	return tag_year
+
+
+class YearTagFeaturesTestCase(unittest.TestCase):
+
+	def setUp(self):
+		# two groups of users, some tags are rare or read by a single group
+		rng = np.random.RandomState(0)
+		user_idx = np.repeat(np.arange(40), 15)
+		tags = np.array(['fantasy', 'horror', 'dystopia', 'space-opera', 'steampunk', 'cyberpunk'])
+		tag = rng.choice(6, len(user_idx), p=[.3, .3, .2, .1, .08, .02])
+		tag[user_idx < 20] = np.minimum(tag[user_idx < 20], 2)
+		self.user_all = pd.DataFrame({'user_idx': user_idx, 'group': (user_idx >= 20).astype(int),
+			'pub_year': rng.randint(1950, 2018, len(user_idx)).astype(float), 'popular_shelves': tags[tag]})
+
+	def test_methods(self):
+
+		for clustid, df_clust in self.user_all.groupby('group'):
+			expected = reference_tag_year(df_clust)
+
+			# vocabulary fitted on the group: same matrix as the pivot tables
+			features = YearTagFeatures.fit(df_clust)
+			tag_year, users = features.transform(df_clust)
+			self.assertEqual(features.columns(), expected.columns.tolist())
+			self.assertEqual(users.tolist(), expected.index.tolist())
+			np.testing.assert_array_equal(tag_year.toarray(), expected.to_numpy())
+			pd.testing.assert_frame_equal(features.to_frame(tag_year, users), expected, check_names=False)
+
+			# vocabulary shared by the groups: same non-zero columns
+			shared = YearTagFeatures.fit(self.user_all)
+			tag_year, users = shared.transform(df_clust, min_tag_users=10)
+			nonzero = tag_year.getnnz(axis=0) > 0
+			self.assertEqual(np.array(shared.columns(), dtype=object)[nonzero].tolist(), expected.columns.tolist())
+			self.assertEqual(users.tolist(), expected.index.tolist())
+			np.testing.assert_array_equal(tag_year.toarray()[:, nonzero], expected.to_numpy())
+
+		# unknown years and tags are left out
+		features = YearTagFeatures([1990.], ['fantasy'])
+		tag_year, users = features.transform(pd.DataFrame({'user_idx': [3, 3, 5, 7], 'pub_year': [1990., 1991., 1990., 2000.],
+			'popular_shelves': ['fantasy', 'fantasy', 'horror', 'fantasy']}))
+		self.assertEqual(users.tolist(), [3, 7])
+		self.assertEqual(tag_year.toarray().tolist(), [[1, 2], [0, 1]])
+
+	def test_decades(self):
+
+		features = YearTagFeatures.fit(self.user_all, decades=True)
+		self.assertEqual(features.years.tolist(), [1950., 1960., 1970., 1980., 1990., 2000., 2010.])
+
+		tag_year, users = features.transform(self.user_all)
+		nb_books = self.user_all.groupby('user_idx').size()
+		np.testing.assert_array_equal(tag_year[:, :len(features.years)].sum(axis=1).A1, nb_books.loc[users].to_numpy())
+
+		with tempfile.TemporaryDirectory() as tmpdir:
+			outputnpz = os.path.join(tmpdir, 'year_tag_features.npz')
+			saved = load_year_tag_features(self.user_all, outputnpz, decades=True)
+			mtime = os.path.getmtime(outputnpz)
+
+			# same data (in another order) and parameters: loaded from the npz file
+			loaded = load_year_tag_features(self.user_all.iloc[::-1], outputnpz, decades=True)
+			self.assertEqual(os.path.getmtime(outputnpz), mtime)
+			self.assertEqual(loaded.data_hash, saved.data_hash)
+			self.assertEqual(loaded.min_tag_users, 10)
+
+			# other parameters or other data: fitted again
+			other = load_year_tag_features(self.user_all, outputnpz, decades=False)
+			self.assertFalse(other.decades)
+			self.assertFalse(YearTagFeatures.load(outputnpz).decades)
+			other = load_year_tag_features(self.user_all, outputnpz, min_tag_users=1)
+			self.assertGreater(len(other.tags), len(saved.tags))
+			other = load_year_tag_features(self.user_all.iloc[:10], outputnpz, min_tag_users=1)
+			self.assertNotEqual(other.data_hash, saved.data_hash)
+			self.assertEqual(len(other.tags), len(set(self.user_all['popular_shelves'].iloc[:10])))
+
+		self.assertTrue(loaded.decades)
+		self.assertEqual(loaded.columns(), saved.columns())
+		self.assertEqual(loaded.columns(), features.columns())
@@ -0,0 +1,284 @@
+""" Computing user-user similarity within each cluster
+based on book publication year and most populated tag
+
+:Author: Yassmine Chebaro <yassmnine.chebaro@mssm.edu>
+:Date: 2019-10-01
+:License: MIT
+"""
+
+# Import Libraries
+import pandas as pd
+import numpy as np
+from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
+from concurrent.futures import ProcessPoolExecutor
+from year_tag_features import YearTagFeatures, load_year_tag_features
+from clustering_users import read_user_books
+from artifacts import ArtifactStore
+
+
+# features of the worker processes of topk_cosine_similarity
+_worker_features = None
+
+
+def clust_group(dfin, dfclusters, clustid):
+	""" Get the user vs book year and tag matrix of a group
+
+	Args:
+		dfin (:obj:`DataFrame`): pandas DataFrame of user and features
+		dfclusters (:obj:`DataFrame`): pandas DataFrame of user_idx and group number
+		clustid (:obj:`int`): number of group
+
+	Returns:
+		:obj:`tag_year`: pandas DataFrame pivoted with user vs book year and tag
+	"""
+
+	# first find the users in the group needed from the user_idx group DataFrame
+	df_cluster = dfclusters[dfclusters['group'] == clustid]
+
+	# get the list of users belonging to this group
+	listusers = list(set(df_cluster['user_idx']))
+
+	# now get the corresponding columns from the features matrix
+	df_cluster_features = dfin[dfin['user_idx'].isin(listusers)]
+
+	# count the number of years and of category tags per user
+	features = YearTagFeatures.fit(df_cluster_features)
+
+	return features.to_frame(*features.transform(df_cluster_features))
+
+
+def clust_group_features(dfin, dfclusters, clustid, features, min_tag_users=10):
+	""" Get the sparse user vs book year and tag matrix of a group, with the columns
+	of a vocabulary shared by the groups, see :obj:`year_tag_features.YearTagFeatures`
+
+	Args:
+		dfin (:obj:`DataFrame`): pandas DataFrame of user and features
+		dfclusters (:obj:`DataFrame`): pandas DataFrame of user_idx and group number
+		clustid (:obj:`int`): number of group
+		features (:obj:`YearTagFeatures`): vocabulary of publication years and tags
+		min_tag_users (:obj:`int`): minimum number of users of a tag in the group
+
+	Returns:
+		:obj:`tag_year`: scipy csr matrix of counts of publication years and tags
+		:obj:`users`: numpy array of the user_idx of the rows
+	"""
+	listusers = dfclusters.loc[dfclusters['group'] == clustid, 'user_idx'].unique()
+	df_cluster_features = dfin[dfin['user_idx'].isin(listusers)]
+
+	return features.transform(df_cluster_features, min_tag_users)
+
+
+def cosine_similarity_clusters(dfin):
+	""" Calculate cosine similarity between users based on book year and category tags
+
+	Args:
+		dfin (:obj:`DataFrame`): pandas DataFrame pivoted with user vs book year and tag
+
+	Returns:
+		:obj:`similarity_with_tag_year`: pandas DataFrame of user-user similarity
+	"""
+	cosine = cosine_similarity(dfin)
+	np.fill_diagonal(cosine, 0)
+	similarity_with_tag_year = pd.DataFrame(cosine, index=dfin.index)
+	similarity_with_tag_year.columns = dfin.index
+
+	return similarity_with_tag_year
+
+
+def iter_similarity_flat(similarity, group, chunksize=1000, upper=False):
+	""" Flatten similarity matrix into User1, User2, Similarity, Group format,
+	one block of rows of the matrix at a time
+
+	Args:
+		similarity (:obj:`DataFrame`): pandas DataFrame of user-user similarity
+		group (:obj:`int`): number of group
+		chunksize (:obj:`int`): number of rows of the similarity matrix per block
+		upper (:obj:`bool`): only keep pairs with User1 before User2 (upper triangle)
+
+	Returns:
+		:obj:`generator`: pandas DataFrames of User1, User2, Similarity and Group, pairs of
+		the same user excluded
+	"""
+	values = similarity.to_numpy()
+	index = similarity.index.to_numpy()
+	columns = np.arange(len(index))
+
+	for start in range(0, len(index), chunksize):
+		block = values[start:start + chunksize]
+		rows = np.arange(start, start + len(block))
+
+		# mask out the diagonal (and the lower triangle)
+		if upper:
+			keep = columns[None, :] > rows[:, None]
+		else:
+			keep = columns[None, :] != rows[:, None]
+		block_rows, block_cols = np.nonzero(keep)
+
+		yield pd.DataFrame({'User1': index[rows[block_rows]], 'User2': index[block_cols],
+			'Similarity': block[block_rows, block_cols], 'Group': group})
+
+
+def get_similarity_flat(similarity, group, upper=False):
+	""" Flatten similarity matrix into User1, User2, Similarity, Group format
+
+	Args:
+		similarity (:obj:`DataFrame`): pandas DataFrame of user-user similarity
+		group (:obj:`int`): number of group
+		upper (:obj:`bool`): only keep pairs with User1 before User2 (upper triangle)
+
+	Returns:
+		:obj:`users_similarity`: pandas DataFrame of User1, User2, Similarity and Group
+	"""
+	return next(iter_similarity_flat(similarity, group, chunksize=max(len(similarity), 1), upper=upper))
+
+
+def write_similarity_flat(similarity, group, outputcsv, chunksize=1000, header=True):
+	""" Write flattened similarity matrix to csv file block by block,
+	so the full list of pairs never sits in memory
+
+	Args:
+		similarity (:obj:`DataFrame`): pandas DataFrame of user-user similarity
+		group (:obj:`int`): number of group
+		outputcsv (:obj:`str`): name of the output csv file, appended to if header is False
+		chunksize (:obj:`int`): number of rows of the similarity matrix per block
+		header (:obj:`bool`): start a new file with the column names
+
+	Returns:
+		:obj:`int`: number of pairs written
+	"""
+	count = 0
+	mode = 'w' if header else 'a'
+	for chunk in iter_similarity_flat(similarity, group, chunksize):
+		chunk.to_csv(outputcsv, mode=mode, header=header, index=False)
+		count += len(chunk)
+		mode = 'a'
+		header = False
+
+	return count
+
+
+def _init_topk_worker(normalized):
+	global _worker_features
+	_worker_features = normalized
+
+
+def _topk_block(normalized, start, stop, k):
+	""" Best k neighbors of the rows start to stop of row-normalized features
+
+	Args:
+		normalized (:obj:`array`): row-normalized features, dense or sparse
+		start (:obj:`int`): first row of the block
+		stop (:obj:`int`): row after the last row of the block
+		k (:obj:`int`): number of neighbors to keep
+
+	Returns:
+		:obj:`neighbors`: numpy array of neighbor rows, most similar first
+		:obj:`similarity`: numpy array of their cosine similarity
+	"""
+	block = normalized[start:stop] @ normalized.T
+	if hasattr(block, 'toarray'):
+		block = block.toarray()
+	block = np.asarray(block, dtype=np.float64)
+
+	# a user is not its own neighbor
+	rows = np.arange(stop - start)
+	block[rows, rows + start] = -np.inf
+
+	# unordered best k, then sorted by decreasing similarity (lowest row first for ties)
+	best = np.argpartition(-block, k - 1, axis=1)[:, :k]
+	best_sim = np.take_along_axis(block, best, axis=1)
+	order = np.lexsort((best, -best_sim), axis=1)
+
+	return np.take_along_axis(best, order, axis=1), np.take_along_axis(best_sim, order, axis=1)
+
+
+def _topk_worker_block(start, stop, k):
+	return _topk_block(_worker_features, start, stop, k)
+
+
+def topk_cosine_similarity(features, k=10, block_size=1000, n_jobs=1):
+	""" Best k neighbors of each user by cosine similarity, computed one block of
+	users at a time so that at most block_size x n similarities are in memory
+
+	Args:
+		features (:obj:`array`): users x features matrix, dense or scipy sparse
+		k (:obj:`int`): number of neighbors to keep per user
+		block_size (:obj:`int`): number of users per block
+		n_jobs (:obj:`int`): number of worker processes, blocks are computed in the current
+		process for 1
+
+	Returns:
+		:obj:`neighbors`: numpy array (users x k) of neighbor rows, most similar first
+		:obj:`similarity`: numpy array (users x k) of their cosine similarity
+	"""
+	if hasattr(features, 'to_numpy'):
+		features = features.to_numpy()
+	normalized = normalize(features.astype(np.float64))
+
+	nb_rows = normalized.shape[0]
+	k = min(int(k), nb_rows - 1)
+	if k <= 0:
+		return np.empty((nb_rows, 0), dtype=np.int64), np.empty((nb_rows, 0))
+
+	blocks = [(start, min(start + block_size, nb_rows)) for start in range(0, nb_rows, block_size)]
+
+	if n_jobs == 1 or len(blocks) == 1:
+		results = [_topk_block(normalized, start, stop, k) for start, stop in blocks]
+	else:
+		with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_topk_worker,
+			initargs=(normalized,)) as executor:
+			results = list(executor.map(_topk_worker_block, *zip(*blocks), [k] * len(blocks)))
+
+	neighbors = np.concatenate([res[0] for res in results])
+	similarity = np.concatenate([res[1] for res in results])
+
+	return neighbors, similarity
+
+
+def get_topk_similarity_flat(tag_year, group, k=10, block_size=1000, n_jobs=1, users=None):
+	""" Best k neighbors of each user of a group in User1, User2, Similarity, Group format
+
+	Args:
+		tag_year (:obj:`DataFrame`): pandas DataFrame pivoted with user vs book year and tag,
+		or scipy sparse matrix of :obj:`clust_group_features`
+		group (:obj:`int`): number of group
+		k (:obj:`int`): number of neighbors to keep per user
+		block_size (:obj:`int`): number of users per block
+		n_jobs (:obj:`int`): number of worker processes
+		users (:obj:`array`): user_idx of the rows of a sparse tag_year
+
+	Returns:
+		:obj:`users_similarity`: pandas DataFrame of User1, User2, Similarity and Group,
+		sorted by decreasing similarity for each User1
+	"""
+	neighbors, similarity = topk_cosine_similarity(tag_year, k, block_size, n_jobs)
+	index = tag_year.index.to_numpy() if users is None else np.asarray(users)
+
+	return pd.DataFrame({'User1': np.repeat(index, neighbors.shape[1]), 'User2': index[neighbors.ravel()],
+		'Similarity': similarity.ravel(), 'Group': group})
+
+
+def main():
+	# Books of the users, built from the artifacts as by the clustering, and final clusters
+	store = ArtifactStore()
+	_, user_all = read_user_books(store)
+	cluster = store.read('clusters_final', fallback_csv='clusters_final.csv')
+
+	# Keep the 100 most similar users, more than the web application ever shows
+	nb_neighbors = 100
+
+	# Publication years and tags of the sparse features, saved by the clustering from the same frame
+	features = load_year_tag_features(user_all, 'year_tag_features.npz')
+
+	# Similarity per group, written group after group
+	header = True
+	for group in sorted(set(cluster['group'])):
+		tag_year, users = clust_group_features(user_all, cluster, group, features)
+		sim = get_topk_similarity_flat(tag_year, group, nb_neighbors, users=users)
+		sim.to_csv('user_user_similarity.csv', mode='w' if header else 'a', header=header, index=False)
+		header = False
+
+
+if __name__ == '__main__':
+	main()
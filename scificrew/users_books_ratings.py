@@ -12,6 +12,13 @@ import pandas as pd
 import matplotlib.pyplot as plt
 import numpy as np
 import itertools
+from id_mapping import IdMap, load_id_map
+from artifacts import ArtifactStore
+
+
+# Compact dtypes for the interactions csv file (hundreds of millions of rows)
+INTERACTIONS_DTYPES = {'user_id': np.int32, 'book_id': np.int32, 'is_read': np.int8, 'rating': np.int8,
+	'is_reviewed': np.int8}
 
 
 def get_users_books(books_sci, bookmap, ratings):
@@ -20,16 +27,16 @@ def get_users_books(books_sci, bookmap, ratings):
 	
 	Args:
 		dfscifi (:obj:`DataFrame`): pandas DataFrame of scifi books
-		bookmap (:obj:`DataFrame`): pandas DataFrame of users and ratings per book
+		bookmap (:obj:`DataFrame`): pandas DataFrame of book id from csv and goodreads book id, or IdMap
 		dfusers (:obj:`DataFrame`): pandas DataFrame of users interactions
 	Returns:
 		:obj:`df`: pandas DataFrame corresponding to the criteria
 	"""
 
 	# Replacing book_id from csv with goodread book_id_gr
-	book_dict = bookmap.set_index('book_id_csv').T.to_dict('list')
-	ratings['book_id_gr'] = ratings['book_id'].map(book_dict)
-	ratings['book_id_gr'] = ratings['book_id_gr'].str.get(0)
+	# (-1 for books which are not in the mapping)
+	book_map = bookmap if isinstance(bookmap, IdMap) else IdMap.from_frame(bookmap, 'book_id_csv', 'book_id')
+	ratings['book_id_gr'] = book_map.map(ratings['book_id'], default=-1)
 	ratings_clean = ratings.drop(['book_id' ] , axis='columns')
 
 	# Extracting ratings for read and read/reviewed books
@@ -58,15 +65,91 @@ def get_users_books(books_sci, bookmap, ratings):
 
 	return df2
 
+def _read_reviewed_scifi(interactions, book_map, scifi_map, chunksize):
+	""" Read and reviewed sci-fi interactions, one chunk at a time
+
+	Args:
+		interactions (:obj:`str`): name of the interactions csv file
+		book_map (:obj:`IdMap`): goodreads book id of the book ids from csv
+		scifi_map (:obj:`IdMap`): whether each book id from csv is a sci-fi book
+		chunksize (:obj:`int`): number of rows read at a time
+
+	Returns:
+		:obj:`generator`: pandas DataFrames of the interactions with a book_id_gr column
+	"""
+	for chunk in pd.read_csv(interactions, dtype=INTERACTIONS_DTYPES, chunksize=chunksize):
+		scifi = scifi_map.map(chunk['book_id'], default=False)
+		chunk = chunk[scifi & (chunk['is_read'] == 1).to_numpy() & (chunk['is_reviewed'] == 1).to_numpy()]
+
+		yield chunk.assign(book_id_gr=book_map.map(chunk['book_id']))
+
+
+def get_users_books_chunked(books_sci, bookmap, interactions, chunksize=10000000, minreviews=80, minratings=10):
+	""" Same result as get_users_books, reading the interactions csv file in chunks with
+	compact dtypes so that memory is bounded by the chunk size and the result size.
+	A first pass counts the read and reviewed sci-fi books per user and per book,
+	a second pass keeps the interactions passing the user and book cuts
+
+	Args:
+		books_sci (:obj:`DataFrame`): pandas DataFrame of scifi books
+		bookmap (:obj:`DataFrame`): pandas DataFrame of book id from csv and goodreads book id, or IdMap
+		interactions (:obj:`str`): name of the users interactions csv file
+		chunksize (:obj:`int`): number of rows read at a time
+		minreviews (:obj:`int`): users need more than minreviews read and reviewed sci-fi books
+		minratings (:obj:`int`): books need more than minratings users who read and reviewed them
+
+	Returns:
+		:obj:`df`: pandas DataFrame corresponding to the criteria
+	"""
+	# Goodreads book id and sci-fi membership of the book ids from csv
+	book_map = bookmap if isinstance(bookmap, IdMap) else IdMap.from_frame(bookmap, 'book_id_csv', 'book_id')
+	scifi_map = IdMap(book_map.keys, np.isin(book_map.values, books_sci['book_id'].unique()))
+
+	# First pass: count per user and per book
+	user_counts = np.zeros(0, dtype=np.int64)
+	book_counts = np.zeros(book_map.keys.max() + 1, dtype=np.int64)
+	for chunk in _read_reviewed_scifi(interactions, book_map, scifi_map, chunksize):
+		chunk_counts = np.bincount(chunk['user_id'].to_numpy(), minlength=len(user_counts))
+		chunk_counts[:len(user_counts)] += user_counts
+		user_counts = chunk_counts
+		book_counts += np.bincount(chunk['book_id'].to_numpy(), minlength=len(book_counts))
+
+	# Second pass: apply user + book cuts
+	kept = []
+	for chunk in _read_reviewed_scifi(interactions, book_map, scifi_map, chunksize):
+		chunk_user_counts = user_counts[chunk['user_id'].to_numpy()]
+		chunk_book_counts = book_counts[chunk['book_id'].to_numpy()]
+		cut = (chunk_user_counts > minreviews) & (chunk_book_counts > minratings)
+		chunk = chunk.drop(['book_id'], axis='columns')[cut]
+		chunk['user_counts'] = chunk_user_counts[cut]
+		chunk['book_counts'] = chunk_book_counts[cut]
+		kept.append(chunk)
+
+	if kept:
+		df2 = pd.concat(kept, ignore_index=True)
+	else:
+		# no interactions at all: no rows, with the columns of the kept chunks
+		dtypes = dict(INTERACTIONS_DTYPES, book_id_gr=np.int64, user_counts=np.int64, book_counts=np.int64)
+		del dtypes['book_id']
+		df2 = pd.DataFrame({column: pd.Series(dtype=dtype) for column, dtype in dtypes.items()})
+
+	# Add a user index for matrix building later
+	df2['user_idx'] = pd.Categorical(df2['user_id']).codes
+	df2['book_idx'] = pd.Categorical(df2['book_id_gr']).codes
+
+	return df2
+
+
 def main():
 	# Reading in user_ratings, book id mapping from csv to goodreads id and scifi books
-	ratings = pd.read_csv('goodreads_interactions.csv')
-	bookmap = pd.read_csv('book_id_map.csv')
-	books_sci = pd.read_csv('books-scifi.csv')
+	bookmap = load_id_map('book_id_map.csv', 'book_id_csv', 'book_id', 'book_id_map.npz')
+	store = ArtifactStore()
+	books_sci = store.read('books_scifi', ['book_id'])
 
-	df2 = get_users_books(books_sci, bookmap, ratings)
+	# Interactions are read in chunks, never loaded whole
+	df2 = get_users_books_chunked(books_sci, bookmap, 'goodreads_interactions.csv')
 
-	df2.to_csv('ratings_books_u80_b10-v3.csv', index=False)
+	store.write('ratings_books', df2)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,187 @@
+""" Users x (publication year, tag) count features in a sparse matrix,
+with a column vocabulary shared by the groups and saved in a numpy npz file
+
+:Author: Yassmine Chebaro <yassmnine.chebaro@mssm.edu>
+:Date: 2019-10-06
+:License: MIT
+"""
+
+import hashlib
+import os
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix, diags
+
+
+class YearTagFeatures(object):
+	""" Column vocabulary of the features: the publication years (or decades) first,
+	then the tags, both sorted, as the columns of the former year and tag pivot tables
+
+	Args:
+		years (:obj:`array`): publication years (or decades) of the columns
+		tags (:obj:`array`): tags of the columns
+		decades (:obj:`bool`): whether publication years are bucketed by decade
+		min_tag_users (:obj:`int`): minimum number of users of a tag of the fitted vocabulary
+		data_hash (:obj:`str`): :obj:`frame_hash` of the DataFrame the vocabulary was fitted on
+	"""
+
+	def __init__(self, years, tags, decades=False, min_tag_users=None, data_hash=None):
+		self.years = np.sort(np.asarray(years))
+		self.tags = np.sort(np.asarray(tags, dtype=str))
+		self.decades = bool(decades)
+		self.min_tag_users = min_tag_users
+		self.data_hash = data_hash
+
+	@classmethod
+	def fit(cls, dfin, min_tag_users=10, decades=False):
+		""" Vocabulary of the publication years and of the tags of at least min_tag_users users
+
+		Args:
+			dfin (:obj:`DataFrame`): pandas DataFrame with user_idx, pub_year and popular_shelves
+			min_tag_users (:obj:`int`): minimum number of users of a tag
+			decades (:obj:`bool`): whether publication years are bucketed by decade
+
+		Returns:
+			:obj:`YearTagFeatures`: vocabulary of the features
+		"""
+		years = _bucket(dfin['pub_year'], decades)
+		user_tags = dfin.drop_duplicates(['user_idx', 'popular_shelves'])['popular_shelves']
+		nb_users = user_tags.value_counts()
+
+		return cls(np.unique(years), nb_users.index[nb_users >= min_tag_users].to_numpy(), decades, min_tag_users,
+			frame_hash(dfin))
+
+	@classmethod
+	def load(cls, inputnpz):
+		""" Load a vocabulary saved with :obj:`save`
+
+		Args:
+			inputnpz (:obj:`str`): name of the npz file
+
+		Returns:
+			:obj:`YearTagFeatures`: vocabulary of the features
+		"""
+		with np.load(inputnpz) as data:
+			min_tag_users = int(data['min_tag_users']) if 'min_tag_users' in data.files else None
+			data_hash = str(data['data_hash']) if 'data_hash' in data.files else None
+			return cls(data['years'], data['tags'], bool(data['decades']), min_tag_users, data_hash)
+
+	def save(self, outputnpz):
+		""" Save the vocabulary, with its fitting parameters and data hash, in a npz file
+
+		Args:
+			outputnpz (:obj:`str`): name of the npz file
+		"""
+		arrays = dict(years=self.years, tags=self.tags, decades=self.decades)
+		if self.min_tag_users is not None:
+			arrays['min_tag_users'] = self.min_tag_users
+		if self.data_hash is not None:
+			arrays['data_hash'] = self.data_hash
+		with open(outputnpz, 'wb') as fout:
+			np.savez(fout, **arrays)
+
+	def __len__(self):
+		return len(self.years) + len(self.tags)
+
+	def columns(self):
+		""" Names of the columns, publication years then tags """
+		return self.years.tolist() + self.tags.tolist()
+
+	def transform(self, dfin, min_tag_users=None):
+		""" Count of the books of each publication year and of each tag per user. As with the
+		former merge of the pivot tables, only users with at least one tag of the vocabulary are kept
+
+		Args:
+			dfin (:obj:`DataFrame`): pandas DataFrame with user_idx, pub_year and popular_shelves
+			min_tag_users (:obj:`int`): if given, tags of fewer users of dfin are left out,
+			for the same columns as a vocabulary fitted on dfin
+
+		Returns:
+			:obj:`features`: scipy csr matrix (users x columns) of counts
+			:obj:`users`: numpy array of the user_idx of the rows
+		"""
+		users, rows = np.unique(dfin['user_idx'].to_numpy(), return_inverse=True)
+		rows = rows.reshape(-1)
+
+		years = _bucket(dfin['pub_year'], self.decades)
+		year_col = np.minimum(np.searchsorted(self.years, years), max(len(self.years) - 1, 0))
+		known_year = (self.years[year_col] == years) if len(self.years) else np.zeros(len(years), dtype=bool)
+		tag_col = pd.Categorical(dfin['popular_shelves'].to_numpy(), categories=self.tags).codes
+		known_tag = tag_col >= 0
+
+		row = np.concatenate([rows[known_year], rows[known_tag]])
+		col = np.concatenate([year_col[known_year], len(self.years) + tag_col[known_tag]])
+		features = coo_matrix((np.ones(len(row)), (row, col)), shape=(len(users), len(self))).tocsr()
+
+		if min_tag_users is not None:
+			keep = np.ones(len(self))
+			keep[len(self.years):][features[:, len(self.years):].getnnz(axis=0) < min_tag_users] = 0
+			features = features @ diags(keep)
+			features.eliminate_zeros()
+
+		with_tags = features[:, len(self.years):].getnnz(axis=1) > 0
+
+		return features[with_tags].tocsr(), users[with_tags]
+
+	def to_frame(self, features, users):
+		""" Dense pandas DataFrame of the features, as the former tag_year pivot tables
+
+		Args:
+			features (:obj:`csr_matrix`): scipy csr matrix (users x columns) of counts
+			users (:obj:`array`): user_idx of the rows
+
+		Returns:
+			:obj:`tag_year`: pandas DataFrame of user_idx vs book year and tag
+		"""
+		return pd.DataFrame(features.toarray(), index=pd.Index(users, name='user_idx'), columns=self.columns())
+
+
+def frame_hash(dfin):
+	""" Hash of the user_idx, pub_year and popular_shelves of a DataFrame, independent
+	of the order of the rows and of the other columns
+
+	Args:
+		dfin (:obj:`DataFrame`): pandas DataFrame with user_idx, pub_year and popular_shelves
+
+	Returns:
+		:obj:`str`: hexadecimal sha1
+	"""
+	columns = dfin.loc[:, ['user_idx', 'pub_year', 'popular_shelves']]
+	columns = columns.astype({'user_idx': np.int64, 'pub_year': np.float64, 'popular_shelves': str})
+	rows = np.sort(pd.util.hash_pandas_object(columns, index=False).to_numpy())
+
+	return hashlib.sha1(rows.tobytes()).hexdigest()
+
+
+def _bucket(years, decades):
+	if isinstance(years.dtype, pd.api.extensions.ExtensionDtype):
+		# nullable integers of the artifacts, missing years are dropped before
+		years = years.astype(np.float64)
+	years = years.to_numpy()
+	return (years // 10) * 10 if decades else years
+
+
+def load_year_tag_features(dfin, inputnpz, min_tag_users=10, decades=False):
+	""" Load the shared vocabulary from its npz file, fitting it on dfin (and saving
+	it for the next stages) when the npz file is missing, or was fitted on other data
+	or with other parameters
+
+	Args:
+		dfin (:obj:`DataFrame`): pandas DataFrame with user_idx, pub_year and popular_shelves
+		inputnpz (:obj:`str`): name of the npz file
+		min_tag_users (:obj:`int`): minimum number of users of a tag
+		decades (:obj:`bool`): whether publication years are bucketed by decade
+
+	Returns:
+		:obj:`YearTagFeatures`: vocabulary of the features
+	"""
+	if os.path.exists(inputnpz):
+		features = YearTagFeatures.load(inputnpz)
+		if (features.decades == bool(decades) and features.min_tag_users == min_tag_users and
+			features.data_hash == frame_hash(dfin)):
+			return features
+
+	features = YearTagFeatures.fit(dfin, min_tag_users, decades)
+	features.save(inputnpz)
+
+	return features
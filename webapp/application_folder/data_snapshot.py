@@ -0,0 +1,58 @@
+""" Data of the web application as loaded from the data files at one time
+
+Each request takes the current snapshot once and uses only its users database and
+neighbor index, so a reload never mixes old and new data within a request. A replaced
+snapshot keeps its database open until the last request using it is done.
+
+:Author: Yassmine Chebaro <yassmnine.chebaro@mssm.edu>
+:Date: 2019-10-17
+:License: MIT
+"""
+
+import threading
+
+
+class DataSnapshot(object):
+	""" Users database and neighbor index of one load of the data files
+
+	Args:
+		users_db (:obj:`UsersDB`): users database
+		users_sim (:obj:`NeighborIndex`): neighbor index
+		generation (:obj:`int`): number of the load, increasing with each reload
+	"""
+
+	def __init__(self, users_db, users_sim, generation):
+		self.users_db = users_db
+		self.users_sim = users_sim
+		self.generation = generation
+		self.retired = False
+		self._requests = 0
+		self._lock = threading.Lock()
+
+	def acquire(self):
+		""" Use the snapshot in a request, until :obj:`release`
+
+		Returns:
+			:obj:`DataSnapshot`: this snapshot
+		"""
+		with self._lock:
+			self._requests += 1
+		return self
+
+	def release(self):
+		""" End of a request using the snapshot, the database of a replaced snapshot is
+		closed by the last request """
+		with self._lock:
+			self._requests -= 1
+			close = self.retired and self._requests == 0
+		if close:
+			self.users_db.close()
+
+	def retire(self):
+		""" Snapshot replaced by a reload, its database is closed now if no request uses it,
+		or by the last request using it """
+		with self._lock:
+			self.retired = True
+			close = self._requests == 0
+		if close:
+			self.users_db.close()
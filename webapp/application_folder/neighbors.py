@@ -0,0 +1,216 @@
+""" Precomputed user-user neighbor index for the web application
+
+Neighbors of every user are stored already sorted by decreasing similarity
+in flat arrays (one offset per user), so getting the top N neighbors of a
+user is a slice and no CSV parsing or sorting happens while serving a request.
+The sentiment label of each neighbor is stored next to its similarity, with the
+lists of the non-negative neighbors precomputed, so excluding negative reviewers
+is also a slice.
+
+:Author: Yassmine Chebaro <yassmnine.chebaro@mssm.edu>
+:Date: 2019-10-02
+:License: MIT
+"""
+
+import os
+import numpy as np
+import pandas as pd
+
+
+class NeighborIndex(object):
+	""" Sorted neighbor lists for all users of the similarity matrix
+
+	Args:
+		users (:obj:`numpy.ndarray`): sorted array of user_idx
+		offsets (:obj:`numpy.ndarray`): start of the neighbors of each user, of length len(users) + 1
+		neighbors (:obj:`numpy.ndarray`): user_idx of the neighbors, sorted by decreasing similarity per user
+		similarity (:obj:`numpy.ndarray`): similarity of each neighbor
+		sentiment (:obj:`numpy.ndarray`): sentiment label of each neighbor ('' if unknown),
+		see :obj:`set_sentiment`
+	"""
+
+	def __init__(self, users, offsets, neighbors, similarity, sentiment=None):
+		self.users = users
+		self.offsets = offsets
+		self.neighbors = neighbors
+		self.similarity = similarity
+		self.sentiment = None
+		self.kept_offsets = offsets
+		self.kept = np.arange(len(neighbors))
+		if sentiment is not None:
+			self._index_sentiment(np.asarray(sentiment, dtype=str))
+
+	def set_sentiment(self, user_sentiment):
+		""" Store the sentiment label of each neighbor and the lists of the non-negative neighbors
+
+		Args:
+			user_sentiment (:obj:`dict` or :obj:`Series`): average sentiment label ('positive',
+			'neutral' or 'negative') of each user_idx
+		"""
+		labels = pd.Series(user_sentiment, dtype=object)
+		self._index_sentiment(labels.reindex(self.neighbors).fillna('').to_numpy(dtype=str))
+
+	def _index_sentiment(self, sentiment):
+		self.sentiment = sentiment
+		# positions of the non-negative neighbors, still sorted by decreasing similarity per user
+		kept = sentiment != 'negative'
+		self.kept = np.flatnonzero(kept)
+		self.kept_offsets = np.append(0, np.cumsum(kept))[self.offsets]
+
+	@classmethod
+	def from_frame(cls, users_sim):
+		""" Build the index from a flat similarity DataFrame
+
+		Args:
+			users_sim (:obj:`DataFrame`): pandas DataFrame with User1, User2 and Similarity columns
+
+		Returns:
+			:obj:`NeighborIndex`: index of the neighbors of each User1
+		"""
+		user1 = users_sim['User1'].to_numpy(dtype=np.int64)
+		user2 = users_sim['User2'].to_numpy(dtype=np.int64)
+		sim = users_sim['Similarity'].to_numpy(dtype=np.float32)
+
+		# sort by user, then by decreasing similarity
+		order = np.lexsort((-sim, user1))
+		user1 = user1[order]
+
+		users, starts = np.unique(user1, return_index=True)
+		offsets = np.append(starts, len(user1)).astype(np.int64)
+
+		return cls(users, offsets, user2[order], sim[order])
+
+	@classmethod
+	def from_csv(cls, inputcsv):
+		""" Build the index from the user_user_similarity csv file
+
+		Args:
+			inputcsv (:obj:`str`): name of the similarity csv file
+
+		Returns:
+			:obj:`NeighborIndex`: index of the neighbors of each User1
+		"""
+		users_sim = pd.read_csv(inputcsv, usecols=['User1', 'User2', 'Similarity'],
+			dtype={'User1': np.int64, 'User2': np.int64, 'Similarity': np.float32})
+
+		return cls.from_frame(users_sim)
+
+	@classmethod
+	def load(cls, inputnpz):
+		""" Load an index saved with :obj:`save`
+
+		Args:
+			inputnpz (:obj:`str`): name of the npz file
+
+		Returns:
+			:obj:`NeighborIndex`: index of the neighbors of each User1
+		"""
+		with np.load(inputnpz) as data:
+			sentiment = data['sentiment'] if 'sentiment' in data.files else None
+			return cls(data['users'], data['offsets'], data['neighbors'], data['similarity'], sentiment)
+
+	def save(self, outputnpz):
+		""" Save the index (and the sentiment labels, if set) in a compact npz file
+
+		Args:
+			outputnpz (:obj:`str`): name of the npz file
+		"""
+		arrays = dict(users=self.users, offsets=self.offsets, neighbors=self.neighbors, similarity=self.similarity)
+		if self.sentiment is not None:
+			arrays['sentiment'] = self.sentiment
+		with open(outputnpz, 'wb') as fout:
+			np.savez(fout, **arrays)
+
+	def _position(self, user_idx):
+		pos = np.searchsorted(self.users, user_idx)
+		if pos == len(self.users) or self.users[pos] != user_idx:
+			return None
+		return pos
+
+	def __contains__(self, user_idx):
+		return self._position(user_idx) is not None
+
+	def _positions(self, user_idx, nb_users=None, exclude_negative=False):
+		""" Positions of the most similar neighbors of a user in the flat arrays """
+		pos = self._position(user_idx)
+		if pos is None:
+			return self.kept[:0]
+		offsets = self.kept_offsets if exclude_negative else self.offsets
+		start, end = offsets[pos], offsets[pos + 1]
+		if nb_users is not None:
+			end = min(end, start + int(nb_users))
+		# only the wanted neighbors, not the whole list of the user
+		return self.kept[start:end] if exclude_negative else np.arange(start, end)
+
+	def count(self, user_idx, exclude_negative=False):
+		""" Number of neighbors stored for a user
+
+		Args:
+			user_idx (:obj:`int`): user index of the similarity matrix
+			exclude_negative (:obj:`bool`): count only the neighbors without a negative sentiment
+
+		Returns:
+			:obj:`int`: number of neighbors, 0 for an unknown user
+		"""
+		pos = self._position(user_idx)
+		if pos is None:
+			return 0
+		offsets = self.kept_offsets if exclude_negative else self.offsets
+
+		return int(offsets[pos + 1] - offsets[pos])
+
+	def top(self, user_idx, nb_users, exclude_negative=False):
+		""" Most similar users of a user
+
+		Args:
+			user_idx (:obj:`int`): user index of the similarity matrix
+			nb_users (:obj:`int`): number of neighbors wanted
+			exclude_negative (:obj:`bool`): leave out the neighbors with a negative sentiment,
+			the next most similar ones taking their place
+
+		Returns:
+			:obj:`neighbors`: numpy array of at most nb_users neighbors user_idx, most similar first
+			:obj:`similarity`: numpy array of their similarity
+		"""
+		positions = self._positions(user_idx, nb_users, exclude_negative)
+
+		return self.neighbors[positions], self.similarity[positions]
+
+	def top_sentiment(self, user_idx, nb_users, exclude_negative=False):
+		""" Sentiment labels of the neighbors of :obj:`top`
+
+		Returns:
+			:obj:`sentiment`: numpy array of the sentiment label of each neighbor
+		"""
+		if self.sentiment is None:
+			raise ValueError('No sentiment labels in the index')
+
+		return self.sentiment[self._positions(user_idx, nb_users, exclude_negative)]
+
+
+def load_neighbor_index(inputcsv, inputnpz, user_sentiment=None):
+	""" Load the neighbor index from its npz file, building it from the similarity
+	csv file (and saving it for the next start) when the npz file is missing or older
+
+	Args:
+		inputcsv (:obj:`str`): name of the similarity csv file
+		inputnpz (:obj:`str`): name of the npz file
+		user_sentiment (:obj:`dict`): average sentiment label of each user_idx, stored
+		with the neighbors if given (the labels of the npz file are kept otherwise)
+
+	Returns:
+		:obj:`NeighborIndex`: index of the neighbors of each user
+	"""
+	if os.path.exists(inputnpz) and (not os.path.exists(inputcsv) or
+		os.path.getmtime(inputnpz) >= os.path.getmtime(inputcsv)):
+		index = NeighborIndex.load(inputnpz)
+		if user_sentiment is not None:
+			index.set_sentiment(user_sentiment)
+		return index
+
+	index = NeighborIndex.from_csv(inputcsv)
+	if user_sentiment is not None:
+		index.set_sentiment(user_sentiment)
+	index.save(inputnpz)
+
+	return index
@@ -0,0 +1,72 @@
+""" Bounded in-process cache of the responses of the web application
+
+Least recently used entries are evicted beyond maxsize entries, and entries older
+than ttl seconds are recomputed. The cache is cleared when the data files are reloaded.
+
+:Author: Yassmine Chebaro <yassmnine.chebaro@mssm.edu>
+:Date: 2019-10-15
+:License: MIT
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResponseCache(object):
+	""" LRU cache with a time to live, shared by the threads serving requests
+
+	Args:
+		maxsize (:obj:`int`): maximum number of entries
+		ttl (:obj:`float`): time to live of an entry in seconds, None for no expiry
+	"""
+
+	def __init__(self, maxsize=1024, ttl=600):
+		self.maxsize = maxsize
+		self.ttl = ttl
+		self._entries = OrderedDict()
+		self._lock = threading.Lock()
+		self.hits = 0
+		self.misses = 0
+
+	def __len__(self):
+		return len(self._entries)
+
+	def get(self, key):
+		""" Cached value of a key
+
+		Args:
+			key (:obj:`tuple`): hashable key, ex: the parameters of a request
+
+		Returns:
+			:obj:`object`: cached value, None if missing or expired
+		"""
+		with self._lock:
+			entry = self._entries.get(key)
+			if entry is not None and self.ttl is not None and time.monotonic() - entry[0] > self.ttl:
+				del self._entries[key]
+				entry = None
+			if entry is None:
+				self.misses += 1
+				return None
+			self._entries.move_to_end(key)
+			self.hits += 1
+			return entry[1]
+
+	def put(self, key, value):
+		""" Cache the value of a key, evicting the least recently used entries beyond maxsize
+
+		Args:
+			key (:obj:`tuple`): hashable key
+			value (:obj:`object`): value, not None
+		"""
+		with self._lock:
+			self._entries[key] = (time.monotonic(), value)
+			self._entries.move_to_end(key)
+			while len(self._entries) > self.maxsize:
+				self._entries.popitem(last=False)
+
+	def clear(self):
+		""" Remove all the entries """
+		with self._lock:
+			self._entries.clear()
@@ -1,8 +1,200 @@
-from flask import render_template, request, redirect
+from flask import render_template, request, redirect, jsonify, g
 from application_folder import app
-import pandas as pd
-import random
-import sqlite3
+from application_folder.data_snapshot import DataSnapshot
+from application_folder.neighbors import load_neighbor_index
+from application_folder.response_cache import ResponseCache
+from application_folder.users_db import UsersDB, parse_int
+import itertools
+import numpy as np
+import os
+import threading
+import time
+
+# data read on the first request, and again when the files are replaced
+dbname = './application_folder/static/data/db.sqlite'
+dbsimname = './application_folder/static/data/user_user_similarity.csv'
+dbsimindex = './application_folder/static/data/user_user_similarity.npz'
+
+# maximum number of user ids of a batch request
+MAX_BATCH_USERS = 1000
+
+# error pages of the invalid parameters
+ERROR_TEMPLATES = {'user_id': 'output-error.html', 'nb_users': 'output-error-nb_users.html',
+	'review_type': 'output-error-review.html'}
+
+# minimum number of seconds between two checks of the modification times of the data files
+RELOAD_CHECK_SECONDS = 5
+
+# similar users of the recent requests, by generation of the data, cleared when the data files are reloaded
+responses = ResponseCache(maxsize=4096, ttl=600)
+
+# one load of the data files at a time, and the snapshot of the current data
+reload_lock = threading.Lock()
+data_lock = threading.Lock()
+data = None
+data_generations = itertools.count(1)
+data_mtimes = None
+data_checked = None
+
+
+def data_files_mtimes():
+	return [os.path.getmtime(path) if os.path.exists(path) else None for path in [dbname, dbsimname]]
+
+
+def load_data():
+	""" (Re)load the users database and the neighbor index in a new snapshot of the data,
+	and clear the cached responses. The previous snapshot is closed once the requests
+	using it are done """
+	global data, data_mtimes, data_checked
+
+	mtimes = data_files_mtimes()
+
+	# indexed read-only queries instead of loading the users table in every request
+	users_db = UsersDB(dbname)
+	try:
+		# neighbors sorted by similarity, with their sentiment labels for the negative reviewers filter
+		sentiments = users_db.sentiments()
+		users_sim = load_neighbor_index(dbsimname, dbsimindex, sentiments)
+
+		# every neighbor needs a profile, for the pages to show as many users as the checks allow
+		unknown = np.setdiff1d(users_sim.neighbors, np.fromiter(sentiments, dtype=np.int64, count=len(sentiments)))
+		if len(unknown):
+			raise ValueError('{} neighbors of {} are not in the users table of {}, ex: {}'.format(
+				len(unknown), dbsimname, dbname, unknown[:5].tolist()))
+	except Exception:
+		users_db.close()
+		raise
+
+	snapshot = DataSnapshot(users_db, users_sim, next(data_generations))
+	with data_lock:
+		previous, data = data, snapshot
+
+	responses.clear()
+	data_mtimes = mtimes
+	data_checked = time.monotonic()
+
+	if previous is not None:
+		previous.retire()
+
+
+def current_data():
+	""" Snapshot of the current data, used by a request until it is released
+
+	Returns:
+		:obj:`DataSnapshot`: users database and neighbor index of the request
+	"""
+	with data_lock:
+		return data.acquire()
+
+
+@app.before_request
+def reload_changed_data():
+	# data files replaced by a new run of the pipeline, checked at most every RELOAD_CHECK_SECONDS
+	global data_checked
+	if data is None or time.monotonic() - data_checked >= RELOAD_CHECK_SECONDS:
+		with reload_lock:
+			if data is None:
+				load_data()
+			elif time.monotonic() - data_checked >= RELOAD_CHECK_SECONDS:
+				if data_files_mtimes() != data_mtimes:
+					# invalid or partially copied files: the previous data is still served
+					try:
+						load_data()
+					except Exception:
+						app.logger.exception('Data files not reloaded')
+				data_checked = time.monotonic()
+
+	# the whole request uses the same data, even if it is reloaded meanwhile
+	g.data = current_data()
+
+
+@app.teardown_request
+def release_data(exception=None):
+	snapshot = g.pop('data', None)
+	if snapshot is not None:
+		snapshot.release()
+
+
+def cache_response(snapshot, key, result):
+	""" Cache the result of a request, unless the data was reloaded during the request
+	(results of older data are never read anyway, as the keys start with the generation) """
+	if not snapshot.retired:
+		responses.put(key, result)
+
+
+def similar_users(snapshot, user_id, nb_users, negative):
+	""" Most similar users of a user, from the cache of the recent requests
+
+	Args:
+		snapshot (:obj:`DataSnapshot`): data of the request
+		user_id (:obj:`str`): user id of the csv files
+		nb_users (:obj:`str`): number of similar users wanted
+		negative (:obj:`str`): 'Yes' to exclude the users with a negative average sentiment, 'No'
+
+	Returns:
+		:obj:`error`: (invalid parameter, error message), None for valid parameters
+		:obj:`users`: list of dict of name, user_gr_id, reviewing_style, title and similarity of the users,
+		most similar first
+	"""
+	key = (snapshot.generation, str(user_id), str(nb_users), negative)
+	result = responses.get(key)
+	if result is None:
+		result = find_similar_users(snapshot, [key[1]], key[2], negative)[0]
+		cache_response(snapshot, key, result)
+
+	return result
+
+
+def find_similar_users(snapshot, user_ids, nb_users, negative):
+	""" Most similar users of several users, with the profiles of all their neighbors
+	fetched in one query
+
+	Returns:
+		:obj:`list`: (error, users) of :obj:`similar_users` for each user id
+	"""
+	users_db, users_sim = snapshot.users_db, snapshot.users_sim
+	results = [None] * len(user_ids)
+	neighbors = {}
+	# positive integer, ex: not '0', '-1', '²' or '1.5'
+	nb = parse_int(nb_users, minimum=1)
+	for i, user_id in enumerate(user_ids):
+		# check if user_id entered is in the data
+		user = users_db.user(user_id)
+		if user is None:
+			results[i] = (('user_id', 'Invalid user id'), [])
+		elif nb is None:
+			results[i] = (('nb_users', 'Invalid number of users'), [])
+		elif negative not in ['Yes', 'No']:
+			results[i] = (('review_type', 'Invalid review answer'), [])
+		# size of the cluster to which the user belongs to, and number of neighbors left
+		# once the negative reviewers are excluded
+		elif (nb >= users_db.cluster_size(user['group_y']) or
+			nb > users_sim.count(user['user_idx'], exclude_negative=negative == 'Yes')):
+			results[i] = (('nb_users', 'Invalid number of users'), [])
+		else:
+			# find the most similar x users according to input form, already sorted in the index
+			# (without the negative reviewers if asked, from the precomputed non-negative lists)
+			neighbors[i] = users_sim.top(user['user_idx'], nb, exclude_negative=negative == 'Yes')
+
+	# profiles of all the neighbors in one query
+	wanted = sorted(set(user_idx for list_wanted, _ in neighbors.values() for user_idx in list_wanted.tolist()))
+	profiles = {profile['user_idx']: profile for profile in users_db.profiles(wanted)}
+	for i, (list_wanted, similarity) in neighbors.items():
+		users = []
+		for user_idx, sim in zip(list_wanted.tolist(), similarity.tolist()):
+			profile = profiles.get(user_idx)
+			if profile is None:
+				app.logger.warning('No profile of the neighbor %s of the user %s', user_idx, user_ids[i])
+				continue
+			users.append(dict(name=profile['names'],
+				reviewing_style=profile['Average sentiment'],
+				title=profile['title'],
+				user_gr_id=profile['user_id_csv'],
+				similarity=sim))
+		results[i] = (None, users)
+
+	return results
+
 
 @app.route('/', methods=['POST', 'GET'])
 @app.route('/index', methods=['POST', 'GET'])
@@ -16,56 +208,47 @@ def scifi_output():
 	nb_users = request.args.get('nb_users')
 	negative = request.args.get('review_type')
 
-	# read in our csv file    
-	dbname = './application_folder/static/data/db.sqlite'
-	dbsimname = './application_folder/static/data/user_user_similarity.csv'
-	users_sim = pd.read_csv(dbsimname)
-
-	conn = sqlite3.connect(dbname)
-	cur = conn.cursor()
-	users_db = pd.read_sql_query("select * from users", conn)
-
-	if negative == 'Yes':
-		cluster_all = cluster_all[cluster_all['Average sentiment'] != 'negative']
-
-	print(users_db[users_db['user_id_csv'] == int(user_id)])
-	# check if user_id entered is in the data
-#	if len(users_db[users_db['user_id_csv'].astype(str).str.contains(user_id)]) == 0:
-	if len(users_db[users_db['user_id_csv'] == int(user_id)]) == 0:
-		error = 'Invalid user id'
-		print('entering')
-		return render_template('output-error.html', error=error)
-	elif nb_users.isdigit() == False: 
-		error = 'Invalid number of users'
-		return render_template('output-error-nb_users.html', error=error)
-	elif negative not in ['Yes', 'No']:
-		error = 'Invalid review answer'
-		return render_template('output-error-review.html', error=error)
-	else:
-		# select cluster to which the user belongs to
-		result = cur.execute("select group_y from users where user_id_csv=(?)", [user_id]).fetchall()
-		user_clust = result[0][0]
-		cluster_all = users_db[users_db['group_y'] == user_clust]
-
-		if int(nb_users) >= len(cluster_all):
-			error = 'Invalid number of users'
-			return render_template('output-error-nb_users.html', error=error)
-
-		# get user idx for similarity matrix
-		user_idx = users_db['user_idx'][users_db['user_id_csv'] == int(user_id)].item()
-		# get similar users
-		similar_users = users_sim[users_sim['User1'] == user_idx].sort_values(by='Similarity', ascending=False)
-
-		# find the most similar x users according to input form
-		list_wanted = [similar_users['User2'].iloc[i] for i in range(int(nb_users))]
+	error, users = similar_users(g.data, user_id, nb_users, negative)
+	if error is not None:
+		return render_template(ERROR_TEMPLATES[error[0]], error=error[1])
 
-		users = []
-		print(list_wanted)
-		for i in list_wanted:
-			users.append(dict(name=cluster_all['names'][cluster_all['user_idx'] == i].item(), 
-				reviewing_style=cluster_all['Average sentiment'][cluster_all['user_idx'] == i].item(),
-				title=cluster_all['title'][cluster_all['user_idx'] == i].item(),
-				user_gr_id=cluster_all['user_id_csv'][cluster_all['user_idx'] == i].item()))
+	return render_template("output.html", users=users)
 
+@app.route('/api/similar_users', methods=['GET', 'POST'])
+def api_similar_users():
+	""" Similar users as json: GET with user_id, nb_users and review_type, or POST of a
+	json object with user_ids (list), nb_users and review_type for a batch of users """
+	if request.method == 'GET':
+		user_id = request.args.get('user_id')
+		nb_users = request.args.get('nb_users')
+		negative = request.args.get('review_type', 'No')
+		error, users = similar_users(g.data, user_id, nb_users, negative)
+		if error is not None:
+			return jsonify(error=error[1], parameter=error[0]), 400
+		return jsonify(user_id=user_id, nb_users=parse_int(nb_users), review_type=negative, users=users)
 
-	return render_template("output.html", users=users)
+	params = request.get_json(silent=True)
+	if not isinstance(params, dict) or not isinstance(params.get('user_ids'), list):
+		return jsonify(error='Expected a json object with a list of user_ids', parameter='user_ids'), 400
+	if len(params['user_ids']) > MAX_BATCH_USERS:
+		return jsonify(error='At most {} user_ids per request'.format(MAX_BATCH_USERS), parameter='user_ids'), 400
+	nb_users = str(params.get('nb_users'))
+	negative = str(params.get('review_type', 'No'))
+
+	# cached users first, the others together
+	user_ids = [str(user_id) for user_id in params['user_ids']]
+	keys = [(g.data.generation, user_id, nb_users, negative) for user_id in user_ids]
+	results = [responses.get(key) for key in keys]
+	missing = [i for i, result in enumerate(results) if result is None]
+	for i, result in zip(missing, find_similar_users(g.data, [user_ids[i] for i in missing], nb_users, negative)):
+		cache_response(g.data, keys[i], result)
+		results[i] = result
+
+	output = []
+	for user_id, (error, users) in zip(user_ids, results):
+		if error is not None:
+			output.append(dict(user_id=user_id, error=error[1], parameter=error[0]))
+		else:
+			output.append(dict(user_id=user_id, users=users))
+
+	return jsonify(nb_users=params.get('nb_users'), review_type=negative, results=output)
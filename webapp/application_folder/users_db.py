@@ -0,0 +1,196 @@
+""" Data access layer of the web application on the users table of the sqlite database
+
+Each thread serving requests keeps its own read-only connection, and the queries
+fetch only the rows they need through the indexes on user_id_csv, user_idx and
+group_y, so a request does not depend on the size of the users table.
+
+:Author: Yassmine Chebaro <yassmnine.chebaro@mssm.edu>
+:Date: 2019-10-14
+:License: MIT
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+
+# indexes of the users table used by the queries, created with the table by the final_mapping
+# stage of the pipeline (scificrew mapping_final_clusters_data.py)
+USERS_INDEXES = {
+	'idx_users_user_id_csv': 'user_id_csv',
+	'idx_users_user_idx': 'user_idx',
+	'idx_users_group_y': 'group_y',
+}
+
+# maximum number of parameters of a query, below the default limit of older sqlite versions
+MAX_PARAMETERS = 500
+
+# columns of the profile of a user shown by the web application
+PROFILE_COLUMNS = ['user_idx', 'user_id_csv', 'names', 'Average sentiment', 'title', 'group_y']
+
+# largest integer stored by sqlite (64-bit signed)
+MAX_INTEGER = 2 ** 63 - 1
+
+
+def parse_int(value, minimum=0, maximum=MAX_INTEGER):
+	""" Integer of a request parameter, ex: a user id entered in the form
+
+	Args:
+		value (:obj:`str`): parameter
+		minimum (:obj:`int`): smallest valid value
+		maximum (:obj:`int`): largest valid value
+
+	Returns:
+		:obj:`int`: value, None if it is not an integer between minimum and maximum
+	"""
+	try:
+		value = int(value)
+	except (TypeError, ValueError):
+		return None
+
+	return value if minimum <= value <= maximum else None
+
+
+class UsersDB(object):
+	""" Read-only queries on the users table
+
+	Args:
+		database (:obj:`str`): name of the sqlite database file
+		create_indexes (:obj:`bool`): whether to create the missing indexes of the users
+		table (with a short-lived read-write connection), for databases written before
+		the final_mapping stage created them
+	"""
+
+	def __init__(self, database, create_indexes=False):
+		if not os.path.exists(database):
+			raise FileNotFoundError('No database {}'.format(database))
+		self.database = database
+		self._local = threading.local()
+		self._connections = []
+		self._lock = threading.Lock()
+		if create_indexes:
+			self.create_indexes()
+		missing = self.missing_indexes()
+		if missing:
+			logger.warning('Missing indexes %s of the users table of %s, run the final_mapping stage again',
+				', '.join(missing), database)
+
+	def create_indexes(self):
+		""" Create the indexes of USERS_INDEXES which are missing, a warning is logged
+		if the database cannot be written (ex: read-only data folder) """
+		try:
+			conn = sqlite3.connect(self.database)
+			try:
+				with conn:
+					for name, column in USERS_INDEXES.items():
+						conn.execute('create index if not exists {} on users ({})'.format(name, column))
+			finally:
+				conn.close()
+		except sqlite3.OperationalError as error:
+			logger.warning('Cannot create the indexes of %s: %s', self.database, error)
+
+	def missing_indexes(self):
+		""" Indexes of USERS_INDEXES which are not in the database
+
+		Returns:
+			:obj:`list`: names of the missing indexes
+		"""
+		indexes = set(row[0] for row in self.connection().execute(
+			"select name from sqlite_master where type = 'index' and tbl_name = 'users'"))
+
+		return [name for name in USERS_INDEXES if name not in indexes]
+
+	def connection(self):
+		""" Read-only connection of the current thread, opened on first use """
+		conn = getattr(self._local, 'conn', None)
+		if conn is None:
+			# only used by this thread, but closed by the thread which closes the database
+			conn = sqlite3.connect('file:{}?mode=ro'.format(os.path.abspath(self.database)), uri=True,
+				check_same_thread=False)
+			conn.row_factory = sqlite3.Row
+			with self._lock:
+				self._connections.append(conn)
+			self._local.conn = conn
+		return conn
+
+	def close(self):
+		""" Close the connections of all the threads, ex: when the database is replaced """
+		with self._lock:
+			connections, self._connections = self._connections, []
+		for conn in connections:
+			conn.close()
+		self._local = threading.local()
+
+	def _select(self, where):
+		columns = ', '.join('"{}"'.format(column) for column in PROFILE_COLUMNS)
+		return 'select {} from users where {}'.format(columns, where)
+
+	def user(self, user_id_csv):
+		""" Profile of a user
+
+		Args:
+			user_id_csv (:obj:`str`): user id of the csv files, as entered in the form
+
+		Returns:
+			:obj:`dict`: columns of PROFILE_COLUMNS, None for an unknown or invalid user id
+		"""
+		user_id_csv = parse_int(user_id_csv)
+		if user_id_csv is None:
+			return None
+		row = self.connection().execute(self._select('user_id_csv = ? limit 1'), (user_id_csv,)).fetchone()
+		return None if row is None else dict(row)
+
+	def profile(self, user_idx):
+		""" Profile of a user of the similarity index
+
+		Args:
+			user_idx (:obj:`int`): user index of the similarity matrix
+
+		Returns:
+			:obj:`dict`: columns of PROFILE_COLUMNS, None for an unknown user
+		"""
+		profiles = self.profiles([user_idx])
+		return profiles[0] if profiles else None
+
+	def profiles(self, user_idxs):
+		""" Profiles of users of the similarity index, in one query (per MAX_PARAMETERS users)
+
+		Args:
+			user_idxs (:obj:`iterable`): user indexes of the similarity matrix, ex: neighbors
+			sorted by decreasing similarity
+
+		Returns:
+			:obj:`list`: dict of the columns of PROFILE_COLUMNS for each known user, in the order of user_idxs
+		"""
+		user_idxs = [int(user_idx) for user_idx in user_idxs]
+		rows = {}
+		for start in range(0, len(user_idxs), MAX_PARAMETERS):
+			chunk = user_idxs[start:start + MAX_PARAMETERS]
+			query = self._select('user_idx in ({})'.format(', '.join('?' * len(chunk))))
+			for row in self.connection().execute(query, chunk):
+				rows.setdefault(row['user_idx'], dict(row))
+
+		return [rows[user_idx] for user_idx in user_idxs if user_idx in rows]
+
+	def sentiments(self):
+		""" Average sentiment label of every user, stored in the neighbor index at startup
+
+		Returns:
+			:obj:`dict`: dict of user_idx and 'positive', 'neutral' or 'negative'
+		"""
+		return dict(self.connection().execute('select user_idx, "Average sentiment" from users'))
+
+	def cluster_size(self, group):
+		""" Number of users of a cluster
+
+		Args:
+			group (:obj:`int`): final cluster (group_y)
+
+		Returns:
+			:obj:`int`: number of users
+		"""
+		return self.connection().execute('select count(*) from users where group_y = ?', (int(group),)).fetchone()[0]
@@ -0,0 +1,33 @@
+""" Data of the web application as loaded from the data files at one time
+    Unit Testing
+
+:Author: Yassmine Chebaro <yassmnine.chebaro@mssm.edu>
+:Date: 2019-10-17
+:License: MIT
+"""
+
+import unittest
+from unittest import mock
+from application_folder.data_snapshot import DataSnapshot
+
+
+class DataSnapshotTestCase(unittest.TestCase):
+
+	def test_close(self):
+		# closed by the last request using a retired snapshot
+		snapshot = DataSnapshot(mock.Mock(), None, 1)
+		self.assertIs(snapshot.acquire(), snapshot)
+		snapshot.acquire()
+		snapshot.release()
+		snapshot.retire()
+		self.assertTrue(snapshot.retired)
+		snapshot.users_db.close.assert_not_called()
+		snapshot.release()
+		snapshot.users_db.close.assert_called_once_with()
+
+		# closed when retired if no request uses it
+		snapshot = DataSnapshot(mock.Mock(), None, 2)
+		snapshot.acquire().release()
+		snapshot.users_db.close.assert_not_called()
+		snapshot.retire()
+		snapshot.users_db.close.assert_called_once_with()
@@ -0,0 +1,105 @@
+""" Precomputed user-user neighbor index of the web application
+    Unit Testing
+
+:Author: Yassmine Chebaro <yassmnine.chebaro@mssm.edu>
+:Date: 2019-10-16
+:License: MIT
+"""
+
+import numpy as np
+import os
+import pandas as pd
+import tempfile
+import time
+import unittest
+from application_folder.neighbors import NeighborIndex, load_neighbor_index
+
+
+class NeighborIndexTestCase(unittest.TestCase):
+
+	def setUp(self):
+		rng = np.random.RandomState(0)
+		user1, user2 = np.meshgrid(np.arange(8), np.arange(8), indexing='ij')
+		users_sim = pd.DataFrame({'User1': user1.ravel(), 'User2': user2.ravel(),
+			# few distinct values, so most users have ties
+			'Similarity': rng.randint(0, 4, 64) / 4.})
+		users_sim = users_sim[users_sim['User1'] != users_sim['User2']]
+		# user 5 has no neighbors, the rows are not sorted
+		self.users_sim = users_sim[users_sim['User1'] != 5].sample(frac=1, random_state=0).reset_index(drop=True)
+		self.sentiment = {user_idx: ['positive', 'neutral', 'negative'][user_idx % 3] for user_idx in range(8)}
+
+	def expected(self, user_idx, nb_users, exclude_negative=False):
+		# decreasing similarity, ties in the order of the rows
+		users_sim = self.users_sim[self.users_sim['User1'] == user_idx]
+		if exclude_negative:
+			users_sim = users_sim[users_sim['User2'].map(self.sentiment) != 'negative']
+		users_sim = users_sim.sort_values('Similarity', ascending=False, kind='mergesort').head(nb_users)
+		return users_sim['User2'].tolist(), users_sim['Similarity'].tolist()
+
+	def assert_top(self, index, user_idx, nb_users, exclude_negative=False):
+		neighbors, similarity = index.top(user_idx, nb_users, exclude_negative)
+		expected_neighbors, expected_similarity = self.expected(user_idx, nb_users, exclude_negative)
+		self.assertEqual(neighbors.tolist(), expected_neighbors)
+		np.testing.assert_allclose(similarity, expected_similarity)
+
+	def test_top(self):
+		index = NeighborIndex.from_frame(self.users_sim)
+		self.assertEqual(index.users.tolist(), [0, 1, 2, 3, 4, 6, 7])
+		for user_idx in index.users.tolist():
+			for nb_users in [1, 3, 7, 100]:
+				self.assert_top(index, user_idx, nb_users)
+			self.assertEqual(index.count(user_idx), 7)
+		self.assertEqual(len(index.top(0, 100)[0]), 7)
+
+		# unknown users
+		for user_idx in [5, -1, 8]:
+			self.assertNotIn(user_idx, index)
+			self.assertEqual(index.count(user_idx), 0)
+			neighbors, similarity = index.top(user_idx, 3)
+			self.assertEqual((len(neighbors), len(similarity)), (0, 0))
+		self.assertIn(0, index)
+
+		with self.assertRaises(ValueError):
+			index.top_sentiment(0, 3)
+
+	def test_sentiment(self):
+		index = NeighborIndex.from_frame(self.users_sim)
+		index.set_sentiment(self.sentiment)
+		for user_idx in index.users.tolist():
+			for nb_users in [1, 3, 100]:
+				self.assert_top(index, user_idx, nb_users)
+				self.assert_top(index, user_idx, nb_users, exclude_negative=True)
+				self.assertNotIn('negative', index.top_sentiment(user_idx, nb_users, exclude_negative=True).tolist())
+			self.assertEqual(index.count(user_idx, exclude_negative=True), len(self.expected(user_idx, 100, True)[0]))
+		self.assertEqual(index.count(5, exclude_negative=True), 0)
+
+	def test_load_neighbor_index(self):
+		with tempfile.TemporaryDirectory() as tmpdir:
+			inputcsv = os.path.join(tmpdir, 'user_user_similarity.csv')
+			inputnpz = os.path.join(tmpdir, 'user_user_similarity.npz')
+			self.users_sim.to_csv(inputcsv, index=False)
+
+			index = load_neighbor_index(inputcsv, inputnpz, self.sentiment)
+			self.assertTrue(os.path.exists(inputnpz))
+			self.assert_top(index, 0, 3, exclude_negative=True)
+
+			# saved index, with its sentiment labels
+			loaded = NeighborIndex.load(inputnpz)
+			for name in ['users', 'offsets', 'neighbors', 'similarity', 'sentiment']:
+				np.testing.assert_array_equal(getattr(loaded, name), getattr(index, name))
+			self.assert_top(load_neighbor_index(inputcsv, inputnpz), 0, 3, exclude_negative=True)
+
+			# rebuilt when the csv file is newer than the npz file
+			self.users_sim = self.users_sim[self.users_sim['User1'] != 0]
+			self.users_sim.to_csv(inputcsv, index=False)
+			mtime = time.time()
+			os.utime(inputnpz, (mtime - 10, mtime - 10))
+			index = load_neighbor_index(inputcsv, inputnpz)
+			self.assertNotIn(0, index)
+			self.assert_top(index, 1, 3)
+			self.assertGreaterEqual(os.path.getmtime(inputnpz), os.path.getmtime(inputcsv))
+			self.assertNotIn(0, NeighborIndex.load(inputnpz))
+
+			# the npz file is used while it is not older than the csv file
+			os.remove(inputcsv)
+			self.assertNotIn(0, load_neighbor_index(inputcsv, inputnpz))
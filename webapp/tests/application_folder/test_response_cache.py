@@ -0,0 +1,52 @@
+""" Bounded in-process cache of the responses of the web application
+    Unit Testing
+
+:Author: Yassmine Chebaro <yassmnine.chebaro@mssm.edu>
+:Date: 2019-10-16
+:License: MIT
+"""
+
+import unittest
+from unittest import mock
+from application_folder.response_cache import ResponseCache
+
+
+class ResponseCacheTestCase(unittest.TestCase):
+
+	def test_lru(self):
+		cache = ResponseCache(maxsize=3, ttl=None)
+		for key in 'abc':
+			cache.put((key,), key.upper())
+		self.assertEqual(len(cache), 3)
+
+		# 'a' used recently, 'b' is the least recently used entry
+		self.assertEqual(cache.get(('a',)), 'A')
+		cache.put(('d',), 'D')
+		self.assertEqual(len(cache), 3)
+		self.assertIsNone(cache.get(('b',)))
+		self.assertEqual([cache.get((key,)) for key in 'acd'], ['A', 'C', 'D'])
+
+		# replaced value, moved to the end
+		cache.put(('a',), 'AA')
+		cache.put(('e',), 'E')
+		self.assertIsNone(cache.get(('c',)))
+		self.assertEqual(cache.get(('a',)), 'AA')
+		self.assertEqual((cache.hits, cache.misses), (5, 2))
+
+		cache.clear()
+		self.assertEqual(len(cache), 0)
+		self.assertIsNone(cache.get(('a',)))
+
+	def test_ttl(self):
+		cache = ResponseCache(maxsize=10, ttl=60)
+		with mock.patch('application_folder.response_cache.time.monotonic', return_value=1000.):
+			cache.put(('a',), 'A')
+			cache.put(('b',), 'B')
+		with mock.patch('application_folder.response_cache.time.monotonic', return_value=1030.):
+			cache.put(('b',), 'B2')
+		with mock.patch('application_folder.response_cache.time.monotonic', return_value=1060.):
+			self.assertEqual(cache.get(('a',)), 'A')
+		with mock.patch('application_folder.response_cache.time.monotonic', return_value=1061.):
+			self.assertIsNone(cache.get(('a',)))
+			self.assertEqual(cache.get(('b',)), 'B2')
+		self.assertEqual(len(cache), 1)
@@ -0,0 +1,247 @@
+""" Pages and json API of the web application
+    Unit Testing
+
+:Author: Yassmine Chebaro <yassmnine.chebaro@mssm.edu>
+:Date: 2019-10-16
+:License: MIT
+"""
+
+import os
+import pandas as pd
+import sqlite3
+import tempfile
+import time
+import unittest
+from unittest import mock
+from application_folder import app, routes
+from application_folder.users_db import UsersDB
+from test_users_db import write_users
+
+
+class RoutesTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self.tmpdir = tempfile.TemporaryDirectory()
+		self.data = {name: getattr(routes, name) for name in ['dbname', 'dbsimname', 'dbsimindex']}
+		routes.dbname = os.path.join(self.tmpdir.name, 'db.sqlite')
+		routes.dbsimname = os.path.join(self.tmpdir.name, 'user_user_similarity.csv')
+		routes.dbsimindex = os.path.join(self.tmpdir.name, 'user_user_similarity.npz')
+
+		# 2 groups of 15 users, a third of them negative reviewers
+		self.users = write_users(routes.dbname, 30, nb_groups=2)
+		pairs = pd.merge(self.users.loc[:, ['user_idx', 'group_y']], self.users.loc[:, ['user_idx', 'group_y']],
+			on='group_y')
+		pairs = pairs[pairs['user_idx_x'] != pairs['user_idx_y']]
+		self.users_sim = pd.DataFrame({'User1': pairs['user_idx_x'], 'User2': pairs['user_idx_y'],
+			'Similarity': 1. / (1 + abs(pairs['user_idx_x'] - pairs['user_idx_y']))})
+		self.users_sim.to_csv(routes.dbsimname, index=False)
+
+		routes.load_data()
+		app.testing = True
+		self.client = app.test_client()
+
+	def tearDown(self):
+		routes.data.retire()
+		routes.data = None
+		for name, path in self.data.items():
+			setattr(routes, name, path)
+		self.tmpdir.cleanup()
+
+	def get(self, **params):
+		return self.client.get('/api/similar_users', query_string=params)
+
+	def test_negative_reviewers(self):
+		# 14 neighbors of user 0 in group 1, 5 of them negative reviewers
+		self.assertEqual(routes.data.users_sim.count(0), 14)
+		self.assertEqual(routes.data.users_sim.count(0, exclude_negative=True), 9)
+
+		response = self.get(user_id='1000', nb_users='9', review_type='Yes')
+		self.assertEqual(response.status_code, 200)
+		users = response.get_json()['users']
+		self.assertEqual([user['user_gr_id'] for user in users], [1004, 1006, 1010, 1012, 1016, 1018, 1022, 1024, 1028])
+		self.assertNotIn('negative', [user['reviewing_style'] for user in users])
+
+		response = self.get(user_id='1000', nb_users='10', review_type='Yes')
+		self.assertEqual(response.status_code, 400)
+		self.assertEqual(response.get_json(), {'error': 'Invalid number of users', 'parameter': 'nb_users'})
+		self.assertEqual(len(self.get(user_id='1000', nb_users='10', review_type='No').get_json()['users']), 10)
+
+		response = self.client.get('/output', query_string=dict(user_id='1000', nb_users='10', review_type='Yes'))
+		self.assertEqual(response.status_code, 200)
+		self.assertIn(b'non valid number of users', response.data)
+
+	def test_output(self):
+		# profiles of all the neighbors in one query, shown by decreasing similarity
+		with mock.patch.object(UsersDB, 'profiles', autospec=True, side_effect=UsersDB.profiles) as profiles:
+			response = self.client.get('/output', query_string=dict(user_id='1001', nb_users='4', review_type='No'))
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(profiles.call_count, 1)
+		self.assertEqual(sorted(profiles.call_args[0][1]), [3, 5, 7, 9])
+		page = response.data.decode()
+		positions = [page.index('<td>Name {}</td>'.format(user_idx)) for user_idx in [3, 5, 7, 9]]
+		self.assertEqual(positions, sorted(positions))
+		self.assertNotIn('<td>Name 11</td>', page)
+
+		# one query for the neighbors of all the users of a batch, shared neighbors once
+		with mock.patch.object(UsersDB, 'profiles', autospec=True, side_effect=UsersDB.profiles) as profiles:
+			response = self.client.post('/api/similar_users', json=dict(user_ids=['1001', '1003', '1000'], nb_users=2))
+		self.assertEqual(profiles.call_count, 1)
+		self.assertEqual(profiles.call_args[0][1], [1, 2, 3, 4, 5])
+		self.assertEqual([[user['user_gr_id'] for user in output['users']] for output in response.get_json()['results']],
+			[[1003, 1005], [1001, 1005], [1002, 1004]])
+
+	def test_api_get(self):
+		response = self.get(user_id='1001', nb_users='3', review_type='No')
+		self.assertEqual(response.status_code, 200)
+		result = response.get_json()
+		self.assertEqual({key: result[key] for key in ['user_id', 'nb_users', 'review_type']},
+			{'user_id': '1001', 'nb_users': 3, 'review_type': 'No'})
+		user = dict(result['users'][0])
+		self.assertAlmostEqual(user.pop('similarity'), 1. / 3, places=6)
+		self.assertEqual(user, {'name': 'Name 3', 'reviewing_style': 'positive', 'title': 'Book 3', 'user_gr_id': 1003})
+		self.assertEqual([user['user_gr_id'] for user in result['users']], [1003, 1005, 1007])
+
+		# default review_type, and the response of the cache
+		hits = routes.responses.hits
+		self.assertEqual(self.get(user_id='1001', nb_users='3').get_json(), result)
+		self.assertEqual(routes.responses.hits, hits + 1)
+
+	def test_api_errors(self):
+		for user_id in [None, '', 'abc', '999', '-1', '1.5', '²', '9' * 30, str(2 ** 63)]:
+			response = self.get(user_id=user_id, nb_users='3', review_type='No')
+			self.assertEqual(response.status_code, 400)
+			self.assertEqual(response.get_json(), {'error': 'Invalid user id', 'parameter': 'user_id'})
+
+		# not a positive integer, or not less than the size of the group (15 users)
+		for nb_users in [None, '', 'abc', '0', '-1', '1.5', '²', '9' * 30, '15']:
+			response = self.get(user_id='1000', nb_users=nb_users, review_type='No')
+			self.assertEqual(response.status_code, 400)
+			self.assertEqual(response.get_json(), {'error': 'Invalid number of users', 'parameter': 'nb_users'})
+		self.assertEqual(self.get(user_id='1000', nb_users='14', review_type='No').status_code, 200)
+
+		response = self.get(user_id='1000', nb_users='3', review_type='Maybe')
+		self.assertEqual(response.status_code, 400)
+		self.assertEqual(response.get_json(), {'error': 'Invalid review answer', 'parameter': 'review_type'})
+
+		response = self.client.get('/output', query_string=dict(user_id='²', nb_users='3', review_type='No'))
+		self.assertEqual(response.status_code, 200)
+		response = self.client.get('/output', query_string=dict(user_id='1000', nb_users='²', review_type='No'))
+		self.assertEqual(response.status_code, 200)
+		self.assertIn(b'non valid number of users', response.data)
+
+	def test_api_batch(self):
+		user_ids = ['1001', 1002, '²', '9' * 30, None, '1001']
+		response = self.client.post('/api/similar_users', json=dict(user_ids=user_ids, nb_users=2, review_type='Yes'))
+		self.assertEqual(response.status_code, 200)
+		result = response.get_json()
+		self.assertEqual((result['nb_users'], result['review_type']), (2, 'Yes'))
+		self.assertEqual([output['user_id'] for output in result['results']], [str(user_id) for user_id in user_ids])
+
+		single = self.get(user_id='1001', nb_users='2', review_type='Yes').get_json()['users']
+		self.assertEqual(result['results'][0], {'user_id': '1001', 'users': single})
+		self.assertEqual(result['results'][5], result['results'][0])
+		self.assertEqual([user['user_gr_id'] for user in result['results'][1]['users']], [1000, 1004])
+		for output in result['results'][2:5]:
+			self.assertEqual((output['error'], output['parameter']), ('Invalid user id', 'user_id'))
+
+		# invalid nb_users for every user
+		for nb_users in ['²', 0, -2, 1.5, None, '9' * 30]:
+			response = self.client.post('/api/similar_users', json=dict(user_ids=['1001', '1002'], nb_users=nb_users))
+			self.assertEqual(response.status_code, 200)
+			for output in response.get_json()['results']:
+				self.assertEqual((output['error'], output['parameter']), ('Invalid number of users', 'nb_users'))
+
+		# not a list of user ids, or too many of them
+		for params in [None, [], dict(user_ids='1001'), dict(nb_users=2)]:
+			response = self.client.post('/api/similar_users', json=params)
+			self.assertEqual(response.status_code, 400)
+			self.assertEqual(response.get_json()['parameter'], 'user_ids')
+		response = self.client.post('/api/similar_users',
+			json=dict(user_ids=['1001'] * (routes.MAX_BATCH_USERS + 1), nb_users=2))
+		self.assertEqual(response.status_code, 400)
+		self.assertEqual(response.get_json(), {'error': 'At most {} user_ids per request'.format(routes.MAX_BATCH_USERS),
+			'parameter': 'user_ids'})
+		response = self.client.post('/api/similar_users', json=dict(user_ids=['1001'] * routes.MAX_BATCH_USERS, nb_users=2))
+		self.assertEqual(len(response.get_json()['results']), routes.MAX_BATCH_USERS)
+
+	def test_unknown_neighbors(self):
+		snapshot = routes.data
+
+		# neighbor 99 without a profile in the users table
+		users_sim = pd.concat([self.users_sim, pd.DataFrame({'User1': [0], 'User2': [99], 'Similarity': [2.]})])
+		users_sim.to_csv(routes.dbsimname, index=False)
+		mtime = time.time() + 10
+		os.utime(routes.dbsimname, (mtime, mtime))
+		with self.assertRaises(ValueError):
+			routes.load_data()
+		self.assertIs(routes.data, snapshot)
+
+		# not reloaded, the previous data is still served in full
+		routes.data_checked -= routes.RELOAD_CHECK_SECONDS
+		with self.assertLogs(app.logger, 'ERROR'):
+			response = self.get(user_id='1000', nb_users='14', review_type='No')
+		self.assertEqual(len(response.get_json()['users']), 14)
+		self.assertIs(routes.data, snapshot)
+
+	def change_similarity(self):
+		# new similarities, more recent than the npz file
+		self.users_sim['Similarity'] = 1. - self.users_sim['Similarity']
+		self.users_sim.to_csv(routes.dbsimname, index=False)
+		mtime = time.time() + 10
+		os.utime(routes.dbsimname, (mtime, mtime))
+
+	def test_reload(self):
+		self.assertEqual(self.get(user_id='1000', nb_users='1').get_json()['users'][0]['user_gr_id'], 1002)
+		self.assertGreater(len(routes.responses), 0)
+		snapshot = routes.data
+		conn = snapshot.users_db.connection()
+		self.change_similarity()
+
+		# not checked again before RELOAD_CHECK_SECONDS
+		self.assertEqual(self.get(user_id='1000', nb_users='1').get_json()['users'][0]['user_gr_id'], 1002)
+		self.assertIs(routes.data, snapshot)
+
+		# reloaded, the previous database is closed as no request uses it
+		routes.data_checked -= routes.RELOAD_CHECK_SECONDS
+		self.assertEqual(self.get(user_id='1000', nb_users='1').get_json()['users'][0]['user_gr_id'], 1028)
+		self.assertIsNot(routes.data, snapshot)
+		self.assertGreater(routes.data.generation, snapshot.generation)
+		self.assertEqual(len(routes.responses), 1)
+		with self.assertRaises(sqlite3.ProgrammingError):
+			conn.execute('select 1')
+
+		# checked, but not changed
+		routes.data_checked -= routes.RELOAD_CHECK_SECONDS
+		snapshot = routes.data
+		self.get(user_id='1000', nb_users='1')
+		self.assertIs(routes.data, snapshot)
+		self.assertGreater(routes.data_checked, time.monotonic() - routes.RELOAD_CHECK_SECONDS)
+
+	def test_reload_during_request(self):
+		# snapshot taken by a request before the reload
+		snapshot = routes.current_data()
+		self.change_similarity()
+		routes.load_data()
+		self.assertIsNot(routes.data, snapshot)
+
+		# the request still gets the old neighbors and profiles, from a database left open
+		error, users = routes.find_similar_users(snapshot, ['1000'], '1', 'No')[0]
+		self.assertIsNone(error)
+		self.assertEqual([user['user_gr_id'] for user in users], [1002])
+		conn = snapshot.users_db.connection()
+		self.assertEqual(self.get(user_id='1000', nb_users='1').get_json()['users'][0]['user_gr_id'], 1028)
+
+		# results of the old data are not cached, and never read by the requests of the new data
+		error, users = routes.similar_users(snapshot, '1000', '1', 'No')
+		self.assertEqual([user['user_gr_id'] for user in users], [1002])
+		self.assertNotIn(snapshot.generation, [key[0] for key in routes.responses._entries])
+		routes.responses.put((snapshot.generation, '1000', '1', 'No'), (None, users))
+		self.assertEqual(routes.similar_users(routes.data, '1000', '1', 'No')[1][0]['user_gr_id'], 1028)
+		response = self.client.post('/api/similar_users', json=dict(user_ids=['1000'], nb_users=1))
+		self.assertEqual(response.get_json()['results'][0]['users'][0]['user_gr_id'], 1028)
+
+		# closed when the request is done
+		conn.execute('select 1')
+		snapshot.release()
+		with self.assertRaises(sqlite3.ProgrammingError):
+			conn.execute('select 1')
@@ -0,0 +1,129 @@
+""" Data access layer of the web application on the users table
+    Unit Testing
+
+:Author: Yassmine Chebaro <yassmnine.chebaro@mssm.edu>
+:Date: 2019-10-16
+:License: MIT
+"""
+
+import os
+import pandas as pd
+import sqlite3
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from application_folder.users_db import UsersDB, USERS_INDEXES, MAX_PARAMETERS, parse_int
+
+
+def write_users(database, nb_users, nb_groups=3, indexes=True):
+	""" Users table of the web application with nb_users users, user_id_csv = 1000 + user_idx,
+	and its indexes as written by the final_mapping stage """
+	users = pd.DataFrame({'user_id_csv': range(1000, 1000 + nb_users), 'user_idx': range(nb_users)})
+	users['user_id_gr'] = users['user_idx'].map('gr{}'.format)
+	users['Average sentiment'] = [['positive', 'neutral', 'negative'][user_idx % 3] for user_idx in range(nb_users)]
+	users['title'] = users['user_idx'].map('Book {}'.format)
+	users['group_y'] = users['user_idx'] % nb_groups + 1
+	users['names'] = users['user_idx'].map('Name {}'.format)
+	conn = sqlite3.connect(database)
+	try:
+		with conn:
+			users.to_sql('users', conn, index=False)
+			for name, column in USERS_INDEXES.items() if indexes else []:
+				conn.execute('create index {} on users ({})'.format(name, column))
+	finally:
+		conn.close()
+
+	return users
+
+
+class UsersDBTestCase(unittest.TestCase):
+
+	def setUp(self):
+		self.tmpdir = tempfile.TemporaryDirectory()
+		self.database = os.path.join(self.tmpdir.name, 'db.sqlite')
+		self.users = write_users(self.database, 2 * MAX_PARAMETERS + 10)
+		self.users_db = UsersDB(self.database)
+
+	def tearDown(self):
+		self.users_db.close()
+		self.tmpdir.cleanup()
+
+	def test_indexes(self):
+		self.assertEqual(self.users_db.missing_indexes(), [])
+
+		# database without indexes: opened read-only, with a warning
+		database = os.path.join(self.tmpdir.name, 'noindex.sqlite')
+		write_users(database, 10, indexes=False)
+		mtime = os.path.getmtime(database)
+		with self.assertLogs('application_folder.users_db', 'WARNING'):
+			users_db = UsersDB(database)
+		self.assertEqual(users_db.missing_indexes(), list(USERS_INDEXES))
+		self.assertEqual(users_db.cluster_size(1), 4)
+		self.assertEqual(os.path.getmtime(database), mtime)
+		users_db.close()
+
+		# created if asked, a warning if the database cannot be written
+		with mock.patch('application_folder.users_db.sqlite3.connect',
+			side_effect=sqlite3.OperationalError('attempt to write a readonly database')):
+			with self.assertLogs('application_folder.users_db', 'WARNING'):
+				users_db.create_indexes()
+		users_db = UsersDB(database, create_indexes=True)
+		self.assertEqual(users_db.missing_indexes(), [])
+		users_db.close()
+
+		with self.assertRaises(FileNotFoundError):
+			UsersDB(os.path.join(self.tmpdir.name, 'missing.sqlite'))
+
+	def test_connection(self):
+		conn = self.users_db.connection()
+		self.assertIs(self.users_db.connection(), conn)
+		with self.assertRaises(sqlite3.OperationalError):
+			conn.execute('delete from users')
+
+		# one connection per thread, all closed by close
+		connections = []
+		thread = threading.Thread(target=lambda: connections.append(self.users_db.connection()))
+		thread.start()
+		thread.join()
+		self.assertIsNot(connections[0], conn)
+
+		self.users_db.close()
+		for closed in [conn, connections[0]]:
+			with self.assertRaises(sqlite3.ProgrammingError):
+				closed.execute('select 1')
+		self.assertIsNot(self.users_db.connection(), conn)
+		self.assertEqual(self.users_db.cluster_size(1), (self.users['group_y'] == 1).sum())
+
+	def test_user(self):
+		user = self.users_db.user('1003')
+		self.assertEqual(user, {'user_idx': 3, 'user_id_csv': 1003, 'names': 'Name 3',
+			'Average sentiment': 'positive', 'title': 'Book 3', 'group_y': 1})
+		self.assertEqual(self.users_db.user(1003), user)
+		for user_id in ['999', '1', '-1', 'abc', '', '1.5', None, '²', '9' * 30, str(2 ** 63)]:
+			self.assertIsNone(self.users_db.user(user_id))
+
+		self.assertEqual(parse_int('12'), 12)
+		self.assertEqual(parse_int(str(2 ** 63 - 1)), 2 ** 63 - 1)
+		self.assertIsNone(parse_int('0', minimum=1))
+		self.assertIsNone(parse_int('11', maximum=10))
+
+	def test_profiles(self):
+		# more users than the parameters of a query, in the given order
+		user_idxs = list(range(len(self.users)))[::-1]
+		profiles = self.users_db.profiles(user_idxs + [len(self.users) + 1, -1])
+		self.assertEqual([profile['user_idx'] for profile in profiles], user_idxs)
+		self.assertEqual([profile['names'] for profile in profiles], ['Name {}'.format(i) for i in user_idxs])
+		self.assertEqual([profile['user_idx'] for profile in self.users_db.profiles([5, 2, 5])], [5, 2, 5])
+		self.assertEqual(self.users_db.profiles([]), [])
+
+		self.assertEqual(self.users_db.profile(7)['user_id_csv'], 1007)
+		self.assertIsNone(self.users_db.profile(len(self.users)))
+
+	def test_groups(self):
+		for group, size in self.users['group_y'].value_counts().items():
+			self.assertEqual(self.users_db.cluster_size(group), size)
+		self.assertEqual(self.users_db.cluster_size(10), 0)
+
+		self.assertEqual(self.users_db.sentiments(),
+			dict(zip(self.users['user_idx'], self.users['Average sentiment'])))